@@ -1,6 +1,27 @@
+import time
+import asyncio
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from functools import cache
+from typing import Any, AsyncIterator
 from llama_index.core import PromptTemplate
-from llama_index.core.agent import ReActAgent
+from llama_index.core.agent import AgentRunner, ReActAgent
+from llama_index.core.agent.types import Task
+from llama_index.core.base.llms.types import ChatMessage
+from llama_index.core.chat_engine.types import StreamingAgentChatResponse
+from llama_index.core.memory import ChatMemoryBuffer
+from llama_index.core.tools import AsyncBaseTool, BaseTool, ToolMetadata, ToolOutput
+from llama_index.agent.openai import OpenAIAgentWorker
+from llama_index.agent.openai.step import call_tool_with_error_handling
+from ai_assistant.rags import get_llm
+from ai_assistant.config import get_agent_settings
+from ai_assistant.prompts import function_calling_agent_prompt
+from ai_assistant.prompt_cache import PrecompiledReActChatFormatter
+from ai_assistant.transcript import CompactingReActChatFormatter, TranscriptCompactor
+from ai_assistant.models import TranscriptStats
 from ai_assistant.tools import (
+    city_card_tool,
     travel_guide_tool,
     flight_tool,
     hotel_tool,
@@ -8,27 +29,330 @@ from ai_assistant.tools import (
     restaurant_tool,
     get_current_date_tool,
     travel_report_tool,
+    search_reservations_tool,
     delete_reservations_tool,
 )
 
+TRAVEL_TOOLS = [
+    city_card_tool,
+    travel_guide_tool,
+    flight_tool,
+    hotel_tool,
+    bus_tool,
+    restaurant_tool,
+    get_current_date_tool,
+    travel_report_tool,
+    search_reservations_tool,
+    delete_reservations_tool,
+]
+
+AGENT_MODES = ("react", "parallel_tools")
+SETTINGS = get_agent_settings()
+
+
+@cache
+def get_tool_executor(max_workers: int) -> ThreadPoolExecutor:
+    """Thread pool that runs the parallel tool calls of all the agents."""
+    return ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="agent-tool")
+
+
+@cache
+def get_transcript_compactor() -> TranscriptCompactor | None:
+    """Compactor of the ReAct transcripts of all the agents, None if disabled."""
+    if not SETTINGS.agent_transcript_compaction:
+        return None
+    return TranscriptCompactor(
+        observation_token_limit=SETTINGS.agent_observation_token_limit,
+        step_token_budget=SETTINGS.agent_step_token_budget,
+    )
+
+
+def transcript_compaction_stats() -> TranscriptStats | None:
+    compactor = get_transcript_compactor()
+    return compactor.stats() if compactor is not None else None
+
+
+class _CompletedTool(AsyncBaseTool):
+    """Stands in for `tool` and returns the output of a call that already ran."""
+
+    def __init__(self, tool: BaseTool, output: ToolOutput):
+        self._tool = tool
+        self._output = output
+
+    @property
+    def metadata(self) -> ToolMetadata:
+        return self._tool.metadata
+
+    def call(self, *args: Any, **kwargs: Any) -> ToolOutput:
+        return self._output
+
+    async def acall(self, *args: Any, **kwargs: Any) -> ToolOutput:
+        return self._output
+
+
+class ParallelToolAgentWorker(OpenAIAgentWorker):
+    """
+    OpenAI function calling agent worker that runs the tool calls of a step
+    concurrently on `executor`. The model can ask for several independent tools
+    at once (e.g. a flight, a hotel and a restaurant reservation), they all run
+    together and their results go back to the model in a single request, instead
+    of one reasoning step and LLM round trip per tool.
+
+    The calls run as soon as the model answers, then the base worker adds their
+    outputs to the memory and the sources in the order of the calls as usual.
+    """
+
+    def __init__(self, *args: Any, executor: ThreadPoolExecutor | None = None, **kwargs: Any):
+        super().__init__(*args, **kwargs)
+        self._executor = executor or get_tool_executor(8)
+        self._outputs: dict[str, ToolOutput] = {}
+        self._outputs_lock = threading.Lock()
+
+    @classmethod
+    def from_tools(
+        cls, *args: Any, executor: ThreadPoolExecutor | None = None, **kwargs: Any
+    ) -> "ParallelToolAgentWorker":
+        worker = super().from_tools(*args, **kwargs)
+        if executor is not None:
+            worker._executor = executor
+        return worker
+
+    def _parallel_calls(self, task: Task) -> list[tuple[Any, BaseTool, dict]]:
+        tool_calls = self.get_latest_tool_calls(task) or []
+        if len(tool_calls) < 2 or not self._should_continue(tool_calls, task.extra_state["n_function_calls"]):
+            return []
+        tools = {tool.metadata.name: tool for tool in self.get_tools(task.input)}
+        calls = []
+        for tool_call in tool_calls:
+            tool = tools.get(tool_call.function.name)
+            try:
+                arguments = self.tool_call_parser(tool_call)
+            except ValueError:
+                # The base worker reports the malformed call to the model
+                continue
+            if tool_call.type == "function" and tool is not None:
+                calls.append((tool_call, tool, arguments))
+        return calls
+
+    def _store_outputs(self, calls: list, outputs: list[ToolOutput]):
+        with self._outputs_lock:
+            for (tool_call, _, _), output in zip(calls, outputs):
+                self._outputs[tool_call.id] = output
+
+    def _run_parallel_calls(self, task: Task):
+        calls = self._parallel_calls(task)
+        outputs = self._executor.map(lambda call: call_tool_with_error_handling(call[1], call[2]), calls)
+        self._store_outputs(calls, list(outputs))
+
+    async def _arun_parallel_calls(self, task: Task):
+        calls = self._parallel_calls(task)
+        loop = asyncio.get_running_loop()
+        outputs = await asyncio.gather(*[
+            loop.run_in_executor(self._executor, call_tool_with_error_handling, tool, arguments)
+            for _, tool, arguments in calls
+        ])
+        self._store_outputs(calls, outputs)
+
+    def _completed(self, tools: list[BaseTool], tool_call) -> list[BaseTool]:
+        with self._outputs_lock:
+            output = self._outputs.pop(tool_call.id, None)
+        if output is None:
+            return tools
+        return [
+            _CompletedTool(tool, output) if tool.metadata.name == tool_call.function.name else tool
+            for tool in tools
+        ]
+
+    def _get_agent_response(self, task: Task, mode, **llm_chat_kwargs: Any):
+        response = super()._get_agent_response(task, mode, **llm_chat_kwargs)
+        self._run_parallel_calls(task)
+        return response
+
+    async def _get_async_agent_response(self, task: Task, mode, **llm_chat_kwargs: Any):
+        response = await super()._get_async_agent_response(task, mode, **llm_chat_kwargs)
+        await self._arun_parallel_calls(task)
+        return response
+
+    def _call_function(self, tools, tool_call, memory, sources) -> bool:
+        return super()._call_function(self._completed(tools, tool_call), tool_call, memory, sources)
+
+    async def _acall_function(self, tools, tool_call, memory, sources) -> bool:
+        return await super()._acall_function(self._completed(tools, tool_call), tool_call, memory, sources)
+
+
+class BoundedChatMemory(ChatMemoryBuffer):
+    """
+    Chat memory that also drops the stored messages past `token_limit`,
+    ChatMemoryBuffer only leaves them out when reading and keeps them forever.
+    """
+
+    def set(self, messages: list[ChatMessage]) -> None:
+        super().set(messages)
+        kept = self.get()
+        if len(kept) < len(messages):
+            super().set(kept)
+
+    def put(self, message: ChatMessage) -> None:
+        super().put(message)
+        self.set(self.get_all())
+
 
 class TravelAgent:
-    def __init__(self, system_prompt: PromptTemplate | None = None):
-        self.agent = ReActAgent.from_tools(
-            [
-                travel_guide_tool,
-                flight_tool,
-                hotel_tool,
-                bus_tool,
-                restaurant_tool,
-                get_current_date_tool,
-                travel_report_tool,
-                delete_reservations_tool,
-            ],
-            verbose=True,
-        )
-        if system_prompt is not None:
-            self.agent.update_prompts({"agent_worker:system_prompt": system_prompt})
-
-    def get_agent(self) -> ReActAgent:
+    def __init__(
+        self,
+        system_prompt: PromptTemplate | None = None,
+        memory_token_limit: int | None = None,
+        mode: str = "react",
+        tool_workers: int = 8,
+    ):
+        """
+        `mode` selects the agent:
+            - "react": ReAct agent with the `system_prompt` template, one tool per step.
+              Its transcript is compacted at every step, see `TranscriptCompactor`, and
+              its system prompt is compiled once, see `PrecompiledReActChatFormatter`.
+            - "parallel_tools": OpenAI function calling agent that runs the tools asked
+              for in the same step concurrently on `tool_workers` threads, see
+              `ParallelToolAgentWorker`. It has its own system prompt.
+        """
+        memory = None
+        if memory_token_limit is not None:
+            memory = BoundedChatMemory.from_defaults(token_limit=memory_token_limit)
+
+        # The tools, the RAG query engine and the LLM client are shared by all the agents
+        if mode == "parallel_tools":
+            worker = ParallelToolAgentWorker.from_tools(
+                TRAVEL_TOOLS,
+                llm=get_llm(),
+                system_prompt=function_calling_agent_prompt,
+                verbose=True,
+                executor=get_tool_executor(tool_workers),
+            )
+            self.agent = AgentRunner(worker, memory=memory, verbose=True)
+        elif mode == "react":
+            compactor = get_transcript_compactor()
+            self.agent = ReActAgent.from_tools(
+                TRAVEL_TOOLS,
+                llm=get_llm(),
+                memory=memory,
+                react_chat_formatter=(
+                    CompactingReActChatFormatter(compactor=compactor)
+                    if compactor is not None else PrecompiledReActChatFormatter()
+                ),
+                verbose=True,
+            )
+            if system_prompt is not None:
+                self.agent.update_prompts({"agent_worker:system_prompt": system_prompt})
+        else:
+            raise ValueError(f"Unknown agent mode {mode!r}, expected one of {AGENT_MODES}")
+
+    def get_agent(self) -> AgentRunner:
         return self.agent
+
+
+class AgentPool:
+    """
+    Keeps one agent, with its own chat memory, per session. Sessions idle for
+    more than `idle_timeout` seconds are evicted, as are the least recently used
+    ones past `max_sessions`. Requests without a session get a fresh agent.
+    """
+
+    def __init__(
+        self,
+        system_prompt: PromptTemplate | None = None,
+        max_sessions: int = 1000,
+        idle_timeout: float = 1800,
+        memory_token_limit: int = 3000,
+        mode: str = "react",
+        tool_workers: int = 8,
+    ):
+        self.system_prompt = system_prompt
+        self.max_sessions = max_sessions
+        self.idle_timeout = idle_timeout
+        self.memory_token_limit = memory_token_limit
+        self.mode = mode
+        self.tool_workers = tool_workers
+        self._sessions: OrderedDict[str, tuple[float, AgentRunner]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+    def new_agent(self) -> AgentRunner:
+        return TravelAgent(
+            self.system_prompt, self.memory_token_limit, self.mode, self.tool_workers
+        ).get_agent()
+
+    def get(self, session_id: str | None = None) -> AgentRunner:
+        if session_id is None:
+            return self.new_agent()
+
+        with self._lock:
+            self._evict_idle()
+            _, agent = self._sessions.pop(session_id, (None, None))
+            if agent is None:
+                agent = self.new_agent()
+            self._sessions[session_id] = (time.monotonic(), agent)
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+            return agent
+
+    def evict_idle(self) -> int:
+        with self._lock:
+            return self._evict_idle()
+
+    def _evict_idle(self) -> int:
+        # The sessions are kept in order of last use, the idle ones are first
+        deadline = time.monotonic() - self.idle_timeout
+        evicted = 0
+        while self._sessions:
+            session_id, (last_used, _) = next(iter(self._sessions.items()))
+            if last_used >= deadline:
+                break
+            del self._sessions[session_id]
+            evicted += 1
+        return evicted
+
+
+def _step_contents(task: Task) -> list[str]:
+    if "current_reasoning" in task.extra_state:
+        return [step.get_content() for step in task.extra_state["current_reasoning"]]
+    # Function calling agents only keep the outputs of the tools
+    return [
+        f"Action: {output.tool_name}\nObservation: {output.content}"
+        for output in task.extra_state.get("sources", [])
+    ]
+
+
+async def astream_agent_events(agent: AgentRunner, prompt: str) -> AsyncIterator[tuple[str, str]]:
+    """
+    Runs the agent step by step and yields its events as they are produced:
+        - ("step", content): A ReAct reasoning step (thought, action or observation),
+          or a tool call and its output for function calling agents.
+        - ("token", delta): A piece of the final answer.
+    """
+    task = agent.create_task(prompt)
+    try:
+        reported_steps = 0
+        while True:
+            step_output = await agent.astream_step(task.task_id)
+
+            steps = _step_contents(task)
+            for content in steps[reported_steps:]:
+                yield "step", content
+            reported_steps = len(steps)
+
+            if step_output.is_last:
+                break
+
+        response = step_output.output
+        if isinstance(response, StreamingAgentChatResponse):
+            async for delta in response.async_response_gen():
+                yield "token", delta
+        else:
+            yield "token", str(response)
+    except BaseException:
+        # Also reached when the client disconnects and the generator is closed
+        agent.delete_task(task.task_id)
+        raise
+
+    agent.finalize_response(task.task_id, step_output)
@@ -0,0 +1,118 @@
+import math
+import numpy as np
+
+
+def top_k_indices(scores: np.ndarray, top_k: int) -> np.ndarray:
+    """Positions of the `top_k` highest scores, best first."""
+    top_k = min(top_k, len(scores))
+    if top_k <= 0:
+        return np.empty(0, dtype=np.int64)
+    top = np.argpartition(-scores, top_k - 1)[:top_k]
+    return top[np.argsort(-scores[top], kind="stable")]
+
+
+def _assign(embeddings: np.ndarray, centroids: np.ndarray, chunk_size: int = 65536) -> np.ndarray:
+    """Closest centroid of every row, computed in chunks to bound the memory used."""
+    assignments = np.empty(len(embeddings), dtype=np.int32)
+    for start in range(0, len(embeddings), chunk_size):
+        chunk = np.asarray(embeddings[start:start + chunk_size], dtype=np.float32)
+        assignments[start:start + chunk_size] = np.argmax(chunk @ centroids.T, axis=1)
+    return assignments
+
+
+def default_nlist(num_vectors: int) -> int:
+    return max(1, min(num_vectors, int(math.sqrt(num_vectors))))
+
+
+class IVFIndex:
+    """
+    Inverted file index over L2 normalized embeddings, built locally with NumPy.
+
+    The vectors are clustered with spherical k-means into `nlist` lists. A query
+    only scores the vectors of the `nprobe` lists whose centroids are closest to
+    it, so it reads about `nprobe / nlist` of the matrix. More probes give a
+    better recall at the cost of latency; `nprobe == nlist` is an exact search.
+    """
+
+    def __init__(self, centroids: np.ndarray, order: np.ndarray, offsets: np.ndarray, nprobe: int = 8):
+        self.centroids = centroids
+        # Rows of the matrix sorted by list, list i is order[offsets[i]:offsets[i + 1]]
+        self.order = order
+        self.offsets = offsets
+        self.nprobe = nprobe
+
+    @property
+    def nlist(self) -> int:
+        return len(self.centroids)
+
+    @property
+    def num_vectors(self) -> int:
+        return len(self.order)
+
+    @classmethod
+    def build(
+        cls,
+        embeddings: np.ndarray,
+        nlist: int | None = None,
+        nprobe: int = 8,
+        iterations: int = 10,
+        max_training_points: int = 64,
+        seed: int = 0,
+    ) -> "IVFIndex":
+        """
+        Clusters `embeddings`, which must be L2 normalized. The centroids are
+        trained on at most `max_training_points` vectors per list, then every
+        vector is assigned to its closest centroid.
+        """
+        num_vectors = len(embeddings)
+        nlist = min(nlist or default_nlist(num_vectors), num_vectors)
+        rng = np.random.default_rng(seed)
+
+        sample_size = min(num_vectors, nlist * max_training_points)
+        sample_rows = np.sort(rng.choice(num_vectors, size=sample_size, replace=False))
+        sample = np.asarray(embeddings[sample_rows], dtype=np.float32)
+
+        centroids = sample[rng.choice(sample_size, size=nlist, replace=False)].copy()
+        for _ in range(iterations):
+            assignments = _assign(sample, centroids)
+            counts = np.bincount(assignments, minlength=nlist)
+            empty = counts == 0
+            starts = np.concatenate([[0], np.cumsum(counts)[:-1]])
+            sums = np.zeros_like(centroids)
+            sums[~empty] = np.add.reduceat(
+                sample[np.argsort(assignments, kind="stable")], starts[~empty]
+            )
+            # Re-seed empty lists with random training points
+            sums[empty] = sample[rng.choice(sample_size, size=int(empty.sum()))]
+            norms = np.linalg.norm(sums, axis=1, keepdims=True)
+            centroids = sums / np.where(norms == 0, 1.0, norms)
+
+        assignments = _assign(embeddings, centroids)
+        order = np.argsort(assignments, kind="stable").astype(np.int64)
+        offsets = np.zeros(nlist + 1, dtype=np.int64)
+        np.cumsum(np.bincount(assignments, minlength=nlist), out=offsets[1:])
+        return cls(centroids.astype(np.float32), order, offsets, nprobe=nprobe)
+
+    def search(self, embeddings: np.ndarray, query: np.ndarray, top_k: int) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Approximate top-k of the normalized `query` over the rows of `embeddings`.
+        Returns:
+            - tuple: (rows, scores), best first.
+        """
+        probes = top_k_indices(self.centroids @ query, self.nprobe)
+        rows = np.concatenate(
+            [self.order[self.offsets[probe]:self.offsets[probe + 1]] for probe in probes]
+        )
+        # Reading the rows in file order keeps the access to a mapped matrix sequential
+        rows.sort()
+        scores = embeddings[rows] @ query
+        top = top_k_indices(scores, top_k)
+        return rows[top], scores[top]
+
+    def save(self, file):
+        np.savez(file, centroids=self.centroids, order=self.order, offsets=self.offsets)
+
+    @classmethod
+    def load(cls, path: str, nprobe: int = 8) -> "IVFIndex":
+        with np.load(path) as data:
+            return cls(data["centroids"], data["order"], data["offsets"], nprobe=nprobe)
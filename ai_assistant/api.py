@@ -1,18 +1,143 @@
-from fastapi import FastAPI, Depends, Query, HTTPException
-from llama_index.core.agent import ReActAgent
-from ai_assistant.agent import TravelAgent
-from ai_assistant.models import AgentAPIResponse, APIResponse
-from ai_assistant.prompts import agent_prompt_tpl, recommend_cities_prompt, travel_report_prompt
-from ai_assistant.tools import reserve_bus, reserve_flight, reserve_hotel, reserve_restaurant, delete_reservations
+import json
+import threading
+import traceback
+from contextlib import asynccontextmanager
+from datetime import datetime
+from typing import AsyncIterator, Literal
+from fastapi import FastAPI, Depends, Header, Query, HTTPException, Response
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
+from llama_index.core.agent import AgentRunner
+from ai_assistant.agent import AgentPool, astream_agent_events, transcript_compaction_stats
+from ai_assistant.cache import ResponseCache
+from ai_assistant.concurrency import ConcurrencyLimiter, OverloadedError
+from ai_assistant.config import get_agent_settings
+from ai_assistant.models import (
+    AgentAPIResponse,
+    APIResponse,
+    ReadinessAPIResponse,
+    CacheStatsAPIResponse,
+    TravelReport,
+    TravelReportAPIResponse,
+    BatchAPIResponse,
+    BatchItemResult,
+    ReservationRequest,
+    TripReservationRequest,
+    HotelReservationRequest,
+    TripType,
+)
+from ai_assistant.prompts import (
+    agent_prompt_tpl,
+    recommend_cities_prompt,
+    recommend_city_card_prompt,
+    travel_report_prompt,
+)
+from ai_assistant.cards import CityCardStore, format_city_card
+from ai_assistant.tools import (
+    reserve_bus,
+    reserve_flight,
+    reserve_hotel,
+    reserve_restaurant,
+    delete_reservations,
+    build_bus_reservation,
+    build_flight_reservation,
+    build_hotel_reservation,
+    build_restaurant_reservation,
+    travel_guide_engine,
+    travel_guide_cache_stats,
+    context_compression_stats,
+    get_city_card_store,
+)
+from ai_assistant.reports import build_travel_report
+from ai_assistant.rags import query_embedding_cache_stats, llm_gateway_stats, prompt_cache_stats
+from ai_assistant.utils import save_reservations, load_reservations
 from functools import cache
 
 
 @cache
-def get_agent() -> ReActAgent:
-    return TravelAgent(agent_prompt_tpl).get_agent()
+def get_agent_pool() -> AgentPool:
+    settings = get_agent_settings()
+    return AgentPool(
+        agent_prompt_tpl,
+        max_sessions=settings.agent_max_sessions,
+        idle_timeout=settings.agent_session_idle_timeout,
+        memory_token_limit=settings.agent_memory_token_limit,
+        mode=settings.agent_mode,
+        tool_workers=settings.agent_tool_workers,
+    )
+
+
+def get_agent(session_id: str | None = Header(None, alias="X-Session-ID")) -> AgentRunner:
+    """
+    Agent of the session given in the `X-Session-ID` header, so follow-up requests
+    share the conversation memory. Without the header every request gets a new agent.
+    """
+    return get_agent_pool().get(session_id)
+
+
+@cache
+def get_response_cache() -> ResponseCache:
+    settings = get_agent_settings()
+    embed_fn = None
+    if settings.response_cache_semantic:
+        from ai_assistant.rags import get_embed_model
+
+        embed_fn = lambda text: get_embed_model().get_query_embedding(text)
+    return ResponseCache(
+        max_size=settings.response_cache_size,
+        ttl=settings.response_cache_ttl,
+        embed_fn=embed_fn,
+        similarity_threshold=settings.response_cache_similarity,
+    )
+
+
+@cache
+def get_agent_limiter() -> ConcurrencyLimiter:
+    settings = get_agent_settings()
+    return ConcurrencyLimiter(
+        max_concurrency=settings.agent_max_concurrency,
+        max_waiting=settings.agent_max_waiting,
+        timeout=settings.agent_queue_timeout,
+    )
 
 
-app = FastAPI(title="AI Travel Assistant Agent")
+warm_up_errors: list[str] = []
+
+
+def warm_up():
+    try:
+        travel_guide_engine.warm_up()
+        get_agent_pool().new_agent()
+    except Exception:
+        warm_up_errors.append(traceback.format_exc(limit=1))
+        traceback.print_exc()
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # The RAG index and the embedding model load in the background, the
+    # reservation endpoints do not need them and are served right away
+    if get_agent_settings().warm_up_on_startup:
+        threading.Thread(target=warm_up, name="rag-warm-up", daemon=True).start()
+    yield
+
+
+app = FastAPI(title="AI Travel Assistant Agent", lifespan=lifespan)
+
+
+@app.get("/health/ready")
+def readiness(response: Response):
+    if travel_guide_engine.is_ready:
+        return ReadinessAPIResponse(status="OK", message="Travel guide is ready", rag_ready=True)
+
+    response.status_code = 503
+    if warm_up_errors:
+        return ReadinessAPIResponse(
+            status="ERROR", message=warm_up_errors[-1], rag_ready=False
+        )
+    return ReadinessAPIResponse(
+        status="LOADING", message="Travel guide is loading", rag_ready=False
+    )
 
 
 def format_notes(notes: list[str]) -> str:
@@ -22,87 +147,296 @@ def format_notes(notes: list[str]) -> str:
     return formated_notes
 
 
+RECOMMENDATION_DESCRIPTIONS = {
+    "places": "places to visit in the city and their descriptions",
+    "hotels": "main hotels in the city and their locations",
+    "activities": "main activities to do in the city",
+}
+
+
+def cities_prompt(notes: list[str]) -> str:
+    return f"Recommend me some cities in Bolivia to visit with the following notes: {notes}."
+
+
+def recommendation_prompt(
+    field: str, city: str, notes: list[str], city_cards: CityCardStore | None = None
+) -> str:
+    # The precomputed card of the city usually answers without a travel_guide lookup
+    card = city_cards.get(city) if city_cards is not None else None
+    return recommend_cities_prompt.format(
+        notes=format_notes(notes),
+        city=city,
+        field=field,
+        description=RECOMMENDATION_DESCRIPTIONS[field],
+        city_card=(
+            recommend_city_card_prompt.format(city=city, card=format_city_card(card))
+            if card is not None else ""
+        ),
+    )
+
+
+def report_prompt(notes: list[str], report: TravelReport) -> str:
+    return travel_report_prompt.format(
+        notes=format_notes(notes), report=report.model_dump_json()
+    )
+
+
+def get_travel_report_summary() -> TravelReport:
+    return build_travel_report(load_reservations())
+
+
+async def run_agent(agent: AgentRunner, limiter: ConcurrencyLimiter, prompt: str) -> str:
+    try:
+        async with limiter.acquire():
+            return str(await agent.aquery(prompt))
+    except OverloadedError as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "5"})
+
+
+async def cached_agent_query(
+    agent: AgentRunner,
+    limiter: ConcurrencyLimiter,
+    response_cache: ResponseCache,
+    prompt: str,
+    no_cache: bool,
+    scope: str,
+    query: str,
+) -> str:
+    if not no_cache:
+        response = await response_cache.aget(prompt, scope=scope, query=query)
+        if response is not None:
+            return response
+
+    response = await run_agent(agent, limiter, prompt)
+    await response_cache.aset(prompt, response, scope=scope, query=query)
+    return response
+
+
+def sse_event(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+async def agent_event_stream(
+    agent: AgentRunner,
+    limiter: ConcurrencyLimiter,
+    prompt: str,
+    cached_response: str | None = None,
+    on_complete=None,
+) -> AsyncIterator[str]:
+    """
+    Server-sent events of an agent run: "step" events with the ReAct reasoning
+    steps, "token" events with the final answer as it is generated, then "done",
+    or "error" if the run fails once the stream has started.
+    """
+    if cached_response is not None:
+        yield sse_event("token", {"content": cached_response})
+    else:
+        answer = ""
+        try:
+            async with limiter.acquire():
+                async for event, content in astream_agent_events(agent, prompt):
+                    if event == "token":
+                        answer += content
+                    yield sse_event(event, {"content": content})
+        except Exception as e:
+            yield sse_event("error", {"detail": str(e)})
+            return
+        if on_complete is not None:
+            await on_complete(answer)
+    yield sse_event("done", {"timestamp": datetime.now().isoformat()})
+
+
+async def stream_agent_query(
+    agent: AgentRunner,
+    limiter: ConcurrencyLimiter,
+    prompt: str,
+    response_cache: ResponseCache | None = None,
+    no_cache: bool = True,
+    scope: str | None = None,
+    query: str | None = None,
+) -> StreamingResponse:
+    cached_response, on_complete = None, None
+    if response_cache is not None:
+        if not no_cache:
+            cached_response = await response_cache.aget(prompt, scope=scope, query=query)
+        on_complete = lambda answer: response_cache.aset(prompt, answer, scope=scope, query=query)
+
+    if cached_response is None and limiter.is_overloaded:
+        raise HTTPException(
+            status_code=503,
+            detail="Too many requests waiting, try again later.",
+            headers={"Retry-After": "5"},
+        )
+
+    return StreamingResponse(
+        agent_event_stream(agent, limiter, prompt, cached_response, on_complete),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
 @app.get("/recommendations/cities")
-def recommend_cities(
-    notes: list[str] = Query([]), agent: ReActAgent = Depends(get_agent)
+async def recommend_cities(
+    notes: list[str] = Query([]),
+    no_cache: bool = False,
+    agent: AgentRunner = Depends(get_agent),
+    limiter: ConcurrencyLimiter = Depends(get_agent_limiter),
+    response_cache: ResponseCache = Depends(get_response_cache),
 ):
-    prompt = f"Recommend me some cities in Bolivia to visit with the following notes: {notes}."
+    prompt = cities_prompt(notes)
     return AgentAPIResponse(
         status="OK", 
         message="Recommendations obtained successfully", 
-        agent_response=str(agent.query(prompt))
+        agent_response=await cached_agent_query(
+            agent, limiter, response_cache, prompt, no_cache, scope="cities", query=" ".join(notes)
+        )
     )
 
 
 @app.get("/recommendations/places")
-def recommend_places(
-    city: str, notes: list[str] = Query([]), agent: ReActAgent = Depends(get_agent)
+async def recommend_places(
+    city: str,
+    notes: list[str] = Query([]),
+    no_cache: bool = False,
+    agent: AgentRunner = Depends(get_agent),
+    limiter: ConcurrencyLimiter = Depends(get_agent_limiter),
+    response_cache: ResponseCache = Depends(get_response_cache),
+    city_cards: CityCardStore | None = Depends(get_city_card_store),
 ):
-    formated_notes = format_notes(notes)
-    prompt = recommend_cities_prompt.format(
-        notes=formated_notes,
-        city=city,
-        field="places",
-        description="places to visit in the city and their descriptions"
-    )
+    # The card lookup queries SQLite, keep it off the event loop
+    prompt = await run_in_threadpool(recommendation_prompt, "places", city, notes, city_cards)
     return AgentAPIResponse(
         status="OK", 
         message="Recommendations obtained successfully", 
-        agent_response=str(agent.query(prompt))
+        agent_response=await cached_agent_query(
+            agent, limiter, response_cache, prompt, no_cache, scope="places", query=" ".join([city, *notes])
+        )
     )
 
 
 @app.get("/recommendations/hotels")
-def recommend_hotels(
-    city: str, notes: list[str] = Query([]), agent: ReActAgent = Depends(get_agent)
+async def recommend_hotels(
+    city: str,
+    notes: list[str] = Query([]),
+    no_cache: bool = False,
+    agent: AgentRunner = Depends(get_agent),
+    limiter: ConcurrencyLimiter = Depends(get_agent_limiter),
+    response_cache: ResponseCache = Depends(get_response_cache),
+    city_cards: CityCardStore | None = Depends(get_city_card_store),
 ):
-    formated_notes = format_notes(notes)
-    prompt = recommend_cities_prompt.format(
-        notes=formated_notes,
-        city=city,
-        field="hotels",
-        description="main hotels in the city and their locations"
-    )
+    prompt = await run_in_threadpool(recommendation_prompt, "hotels", city, notes, city_cards)
     return AgentAPIResponse(
         status="OK", 
         message="Recommendations obtained successfully", 
-        agent_response=str(agent.query(prompt))
+        agent_response=await cached_agent_query(
+            agent, limiter, response_cache, prompt, no_cache, scope="hotels", query=" ".join([city, *notes])
+        )
     )
 
 
 @app.get("/recommendations/activities")
-def recommend_activities(
-    city: str, notes: list[str] = Query([]), agent: ReActAgent = Depends(get_agent)
+async def recommend_activities(
+    city: str,
+    notes: list[str] = Query([]),
+    no_cache: bool = False,
+    agent: AgentRunner = Depends(get_agent),
+    limiter: ConcurrencyLimiter = Depends(get_agent_limiter),
+    response_cache: ResponseCache = Depends(get_response_cache),
+    city_cards: CityCardStore | None = Depends(get_city_card_store),
 ):
-    formated_notes = format_notes(notes)
-    prompt = recommend_cities_prompt.format(
-        notes=formated_notes,
-        city=city,
-        field="activities",
-        description="main activities to do in the city"
-    )
+    prompt = await run_in_threadpool(recommendation_prompt, "activities", city, notes, city_cards)
     return AgentAPIResponse(
         status="OK", 
         message="Recommendations obtained successfully", 
-        agent_response=str(agent.query(prompt))
+        agent_response=await cached_agent_query(
+            agent, limiter, response_cache, prompt, no_cache, scope="activities", query=" ".join([city, *notes])
+        )
+    )
+
+
+@app.get("/recommendations/cities/stream")
+async def stream_recommend_cities(
+    notes: list[str] = Query([]),
+    no_cache: bool = False,
+    agent: AgentRunner = Depends(get_agent),
+    limiter: ConcurrencyLimiter = Depends(get_agent_limiter),
+    response_cache: ResponseCache = Depends(get_response_cache),
+):
+    return await stream_agent_query(
+        agent, limiter, cities_prompt(notes), response_cache, no_cache,
+        scope="cities", query=" ".join(notes),
+    )
+
+
+@app.get("/recommendations/{field}/stream")
+async def stream_recommendations(
+    field: Literal["places", "hotels", "activities"],
+    city: str,
+    notes: list[str] = Query([]),
+    no_cache: bool = False,
+    agent: AgentRunner = Depends(get_agent),
+    limiter: ConcurrencyLimiter = Depends(get_agent_limiter),
+    response_cache: ResponseCache = Depends(get_response_cache),
+    city_cards: CityCardStore | None = Depends(get_city_card_store),
+):
+    prompt = await run_in_threadpool(recommendation_prompt, field, city, notes, city_cards)
+    return await stream_agent_query(
+        agent, limiter, prompt, response_cache, no_cache,
+        scope=field, query=" ".join([city, *notes]),
+    )
+
+
+@app.get("/cache/stats")
+def cache_stats(response_cache: ResponseCache = Depends(get_response_cache)):
+    return CacheStatsAPIResponse(
+        status="OK",
+        message="Cache statistics obtained successfully",
+        stats=response_cache.stats(),
+        query_embedding_stats=query_embedding_cache_stats(),
+        travel_guide_stats=travel_guide_cache_stats(),
+        context_compression_stats=context_compression_stats(),
+        llm_gateway_stats=llm_gateway_stats(),
+        transcript_compaction_stats=transcript_compaction_stats(),
+        prompt_cache_stats=prompt_cache_stats(),
     )
 
 
 @app.get("/reservations")
-def get_travel_report(
-    notes: list[str] = Query([]), agent: ReActAgent = Depends(get_agent)
+async def get_travel_report(
+    notes: list[str] = Query([]),
+    agent: AgentRunner = Depends(get_agent),
+    limiter: ConcurrencyLimiter = Depends(get_agent_limiter),
 ):
-    formated_notes = ""
-    for note in notes:
-        formated_notes += f"- {note}\n"
-    prompt = travel_report_prompt.format(notes=formated_notes)
-    return AgentAPIResponse(
+    # The agent gets the report in the prompt instead of fetching it with a tool
+    report = await run_in_threadpool(get_travel_report_summary)
+    prompt = report_prompt(notes, report)
+    return TravelReportAPIResponse(
         status="OK", 
         message="Travel report obtained successfully",
-        agent_response=str(agent.query(prompt))
+        report=report,
+        agent_response=await run_agent(agent, limiter, prompt)
     )
 
 
+@app.get("/reservations/report")
+def get_structured_travel_report():
+    return TravelReportAPIResponse(
+        status="OK",
+        message="Travel report obtained successfully",
+        report=get_travel_report_summary(),
+    )
+
+
+@app.get("/reservations/stream")
+async def stream_travel_report(
+    notes: list[str] = Query([]),
+    agent: AgentRunner = Depends(get_agent),
+    limiter: ConcurrencyLimiter = Depends(get_agent_limiter),
+):
+    report = await run_in_threadpool(get_travel_report_summary)
+    return await stream_agent_query(agent, limiter, report_prompt(notes, report))
+
+
 @app.post("/reservations/flight")
 def flight_reservation(date: str, departure: str, destination: str):
     try:
@@ -151,6 +485,53 @@ def restaurant_reservation(reservation_time: str, restaurant: str, city: str, di
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
     
+def build_reservation(item: ReservationRequest):
+    if isinstance(item, TripReservationRequest):
+        if item.trip_type == TripType.flight:
+            return build_flight_reservation(item.date, item.departure, item.destination)
+        return build_bus_reservation(item.date, item.departure, item.destination)
+    if isinstance(item, HotelReservationRequest):
+        return build_hotel_reservation(
+            item.checkin_date, item.checkout_date, item.hotel_name, item.city
+        )
+    return build_restaurant_reservation(
+        item.reservation_time, item.restaurant, item.city, item.dish
+    )
+
+
+@app.post("/reservations/batch")
+def batch_reservation(items: list[ReservationRequest]):
+    if not items:
+        raise HTTPException(status_code=400, detail="The batch has no reservations")
+    results = []
+    reservations = []
+    for index, item in enumerate(items):
+        try:
+            reservation = build_reservation(item)
+            reservations.append(reservation)
+            results.append(BatchItemResult(index=index, status="OK", reservation=reservation))
+        except ValueError as e:
+            results.append(BatchItemResult(index=index, status="ERROR", error=str(e)))
+
+    failed = len(items) - len(reservations)
+    if failed:
+        response = BatchAPIResponse(
+            status="ERROR",
+            message=f"{failed} of {len(items)} reservations are invalid, nothing was saved",
+            results=[
+                result.model_copy(update={"reservation": None}) for result in results
+            ],
+        )
+        raise HTTPException(status_code=400, detail=response.model_dump(mode="json"))
+
+    save_reservations(reservations)
+    return BatchAPIResponse(
+        status="OK",
+        message=f"{len(reservations)} reservations successful",
+        results=results,
+    )
+
+
 @app.delete("/reservations")
 def delete_all_reservations():
     delete_reservations()
@@ -0,0 +1,186 @@
+import re
+import time
+import asyncio
+import threading
+from collections import OrderedDict
+from typing import Any, Callable
+import numpy as np
+from ai_assistant.models import CacheStats
+
+
+def normalize_text(text: str) -> str:
+    return re.sub(r"\s+", " ", text).strip().casefold()
+
+
+class TTLCache:
+    """
+    Thread safe LRU cache whose entries expire `ttl` seconds after being set.
+    A `ttl` of None keeps the entries until they are evicted.
+    """
+
+    def __init__(self, max_size: int = 256, ttl: float | None = None):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries: OrderedDict[Any, tuple[float, Any]] = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, key) -> bool:
+        with self._lock:
+            return self._live_entry(key) is not None
+
+    def _live_entry(self, key) -> tuple[float, Any] | None:
+        entry = self._entries.get(key)
+        if entry is not None and self.ttl is not None and time.monotonic() - entry[0] > self.ttl:
+            del self._entries[key]
+            self.expirations += 1
+            return None
+        return entry
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._live_entry(key)
+            if entry is None:
+                self.misses += 1
+                return default
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = (time.monotonic(), value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> CacheStats:
+        return CacheStats(
+            size=len(self._entries),
+            hits=self.hits,
+            semantic_hits=0,
+            misses=self.misses,
+            evictions=self.evictions,
+            expirations=self.expirations,
+        )
+
+
+class ResponseCache:
+    """
+    Cache of agent responses keyed by the normalized prompt.
+
+    With an `embed_fn` a semantic tier is added: on an exact miss, the `query`
+    text (e.g. the city and the notes) is compared by cosine similarity with the
+    queries cached under the same `scope` (e.g. the endpoint), and the response
+    of the most similar one is reused when it reaches `similarity_threshold`.
+    """
+
+    def __init__(
+        self,
+        max_size: int = 256,
+        ttl: float | None = 3600,
+        embed_fn: Callable[[str], list[float]] | None = None,
+        similarity_threshold: float = 0.95,
+    ):
+        self.responses = TTLCache(max_size=max_size, ttl=ttl)
+        self.embed_fn = embed_fn
+        self.similarity_threshold = similarity_threshold
+        # scope -> {prompt key: normalized query embedding}
+        self._embeddings: dict[str, dict[str, np.ndarray]] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+
+    def _embed(self, query: str) -> np.ndarray:
+        embedding = np.asarray(self.embed_fn(normalize_text(query)), dtype=np.float32)
+        return embedding / (np.linalg.norm(embedding) or 1.0)
+
+    def get(self, prompt: str, scope: str | None = None, query: str | None = None) -> str | None:
+        response = self.responses.get(normalize_text(prompt))
+        if response is not None:
+            # `aget` runs in worker threads, the counters are updated under the lock
+            with self._lock:
+                self.hits += 1
+            return response
+
+        if self.embed_fn is not None and query is not None:
+            response = self._get_similar(scope, query)
+            if response is not None:
+                with self._lock:
+                    self.semantic_hits += 1
+                return response
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def _get_similar(self, scope: str | None, query: str) -> str | None:
+        with self._lock:
+            candidates = dict(self._embeddings.get(scope, {}))
+        if not candidates:
+            return None
+
+        keys = list(candidates)
+        similarities = np.stack([candidates[k] for k in keys]) @ self._embed(query)
+        for index in np.argsort(-similarities):
+            if similarities[index] < self.similarity_threshold:
+                break
+            response = self.responses.get(keys[index])
+            if response is not None:
+                return response
+            with self._lock:
+                self._embeddings.get(scope, {}).pop(keys[index], None)
+        return None
+
+    def set(self, prompt: str, response: str, scope: str | None = None, query: str | None = None):
+        key = normalize_text(prompt)
+        self.responses.set(key, response)
+        if self.embed_fn is not None and query is not None:
+            embedding = self._embed(query)
+            with self._lock:
+                scoped = self._embeddings.setdefault(scope, {})
+                scoped[key] = embedding
+                # Forget the embeddings of the responses evicted from the cache
+                if len(scoped) > self.responses.max_size:
+                    for stale_key in [k for k in scoped if k not in self.responses]:
+                        del scoped[stale_key]
+
+    async def aget(self, prompt: str, scope: str | None = None, query: str | None = None) -> str | None:
+        # Embedding the query is CPU bound, keep it off the event loop
+        if self.embed_fn is None or query is None:
+            return self.get(prompt, scope=scope, query=query)
+        return await asyncio.to_thread(self.get, prompt, scope, query)
+
+    async def aset(self, prompt: str, response: str, scope: str | None = None, query: str | None = None):
+        if self.embed_fn is None or query is None:
+            return self.set(prompt, response, scope=scope, query=query)
+        await asyncio.to_thread(self.set, prompt, response, scope, query)
+
+    def clear(self):
+        self.responses.clear()
+        with self._lock:
+            self._embeddings.clear()
+
+    def stats(self) -> CacheStats:
+        with self._lock:
+            hits, semantic_hits, misses = self.hits, self.semantic_hits, self.misses
+        return CacheStats(
+            size=len(self.responses),
+            hits=hits,
+            semantic_hits=semantic_hits,
+            misses=misses,
+            evictions=self.responses.evictions,
+            expirations=self.responses.expirations,
+        )
@@ -0,0 +1,160 @@
+import json
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import closing
+from llama_index.core.llms import LLM
+from llama_index.core.schema import BaseNode
+from ai_assistant.models import CityCard, CityCardContent
+from ai_assistant.prompts import city_card_tpl
+from ai_assistant.storage import file_lock
+from ai_assistant.retrievers import BM25Index, tokenize
+
+
+def city_key(city: str) -> str:
+    """Lookup key of a city, "Potosí" and " potosi " share the same card."""
+    return " ".join(tokenize(city))
+
+
+def _mentions(node: BaseNode, key: str) -> bool:
+    return f" {key} " in f" {' '.join(tokenize(node.get_content()))} "
+
+
+def build_city_card(
+    city: str, nodes: list[BaseNode], bm25_index: BM25Index, llm: LLM, max_nodes: int = 5
+) -> CityCard | None:
+    """
+    Summarizes the nodes that mention `city` into a card with one LLM call.
+    The nodes are the best BM25 matches of the city name that contain it as a
+    phrase, so "La Paz" does not match a node that only mentions "Paz".
+    Returns None when the travel guide does not mention the city.
+    """
+    key = city_key(city)
+    nodes_by_id = {node.node_id: node for node in nodes}
+    matches = [
+        nodes_by_id[node_id]
+        for node_id, _ in bm25_index.search(city, top_k=4 * max_nodes)
+        if _mentions(nodes_by_id[node_id], key)
+    ][:max_nodes]
+    if not matches:
+        return None
+
+    context_str = "\n\n".join(node.get_content() for node in matches)
+    content = llm.structured_predict(CityCardContent, city_card_tpl, city=city, context_str=context_str)
+    return CityCard(
+        city=city, source_node_ids=[node.node_id for node in matches], **content.model_dump()
+    )
+
+
+def build_city_cards(
+    nodes: list[BaseNode], cities: list[str], llm: LLM, max_nodes: int = 5, workers: int = 4
+) -> tuple[list[CityCard], list[str]]:
+    """
+    Builds the cards of the `cities` mentioned in the nodes, `workers` LLM calls
+    at a time. A city whose card fails (e.g. the LLM is down or its answer does
+    not parse) is logged and skipped.
+    Returns:
+        - tuple: (cards, cities whose card failed)
+    """
+    bm25_index = BM25Index(nodes)
+    failed = []
+
+    def build(city: str) -> CityCard | None:
+        try:
+            return build_city_card(city, nodes, bm25_index, llm, max_nodes)
+        except Exception as error:
+            print(f"City card for {city} not built: {error!r}")
+            failed.append(city)
+            return None
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        cards = [card for card in executor.map(build, cities) if card is not None]
+    return cards, [city for city in cities if city in failed]
+
+
+def format_city_card(card: CityCard) -> str:
+    """Compact text of the card for a prompt or a tool observation."""
+    lines = [f"{card.city}: {card.description}"]
+    for label, items in [
+        ("Places", card.places),
+        ("Hotels", card.hotels),
+        ("Activities", card.activities),
+        ("Transport", card.transport),
+    ]:
+        if items:
+            lines.append(f"- {label}: {'; '.join(items)}")
+    return "\n".join(lines)
+
+
+class CityCardStore:
+    """
+    City cards kept in a SQLite database, one JSON row per city keyed by
+    `city_key`, with the version of the index they were built from. A
+    connection is opened per operation.
+    """
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        with closing(self._connect()) as connection, connection:
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.executescript(
+                """
+                CREATE TABLE IF NOT EXISTS city_cards (
+                    city_key TEXT PRIMARY KEY,
+                    card TEXT NOT NULL
+                );
+                CREATE TABLE IF NOT EXISTS city_cards_meta (
+                    key TEXT PRIMARY KEY,
+                    value TEXT NOT NULL
+                );
+                """
+            )
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.db_path, timeout=30)
+
+    def rebuild_lock(self):
+        """
+        Exclusive lock on the store across processes, held while the cards are
+        rebuilt so the workers of a server do not all rebuild them at once.
+        """
+        return file_lock(f"{self.db_path}.lock")
+
+    def get(self, city: str) -> CityCard | None:
+        with closing(self._connect()) as connection:
+            row = connection.execute(
+                "SELECT card FROM city_cards WHERE city_key = ?", (city_key(city),)
+            ).fetchone()
+        return CityCard.model_validate_json(row[0]) if row is not None else None
+
+    def cities(self) -> list[str]:
+        with closing(self._connect()) as connection:
+            rows = connection.execute("SELECT card FROM city_cards ORDER BY city_key").fetchall()
+        return [json.loads(card)["city"] for (card,) in rows]
+
+    def index_version(self) -> str | None:
+        """Version of the index the cards were built from, None if never built."""
+        with closing(self._connect()) as connection:
+            row = connection.execute(
+                "SELECT value FROM city_cards_meta WHERE key = 'index_version'"
+            ).fetchone()
+        return row[0] if row is not None else None
+
+    def replace(self, cards: list[CityCard], index_version: str | None):
+        """
+        Replaces all the cards at once, readers see either the old or the new ones.
+        An `index_version` of None marks the cards as partial, so the next update
+        rebuilds them whatever the version of the index.
+        """
+        with closing(self._connect()) as connection, connection:
+            connection.execute("DELETE FROM city_cards")
+            connection.executemany(
+                "INSERT INTO city_cards (city_key, card) VALUES (?, ?)",
+                [(city_key(card.city), card.model_dump_json()) for card in cards],
+            )
+            if index_version is None:
+                connection.execute("DELETE FROM city_cards_meta WHERE key = 'index_version'")
+            else:
+                connection.execute(
+                    "INSERT OR REPLACE INTO city_cards_meta (key, value) VALUES ('index_version', ?)",
+                    (index_version,),
+                )
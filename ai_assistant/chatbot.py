@@ -1,12 +1,51 @@
 import gradio as gr
-from ai_assistant.agent import TravelAgent
+from llama_index.core.llms import ChatMessage, MessageRole
+from ai_assistant.agent import AgentPool
+from ai_assistant.config import get_agent_settings
 from ai_assistant.prompts import agent_prompt_tpl
+from ai_assistant.rags import get_embed_model
+from ai_assistant.router import IntentRouter, NEGATIVE_EXAMPLES, default_intents
 
-agent = TravelAgent(agent_prompt_tpl).get_agent()
+SETTINGS = get_agent_settings()
 
+agent_pool = AgentPool(
+    agent_prompt_tpl,
+    max_sessions=SETTINGS.agent_max_sessions,
+    idle_timeout=SETTINGS.agent_session_idle_timeout,
+    memory_token_limit=SETTINGS.agent_memory_token_limit,
+    mode=SETTINGS.agent_mode,
+    tool_workers=SETTINGS.agent_tool_workers,
+)
 
-def agent_response(message, history):
-    return agent.chat(message).response
+intent_router = None
+if SETTINGS.intent_router:
+    intent_router = IntentRouter(
+        default_intents(),
+        embed_fn=(
+            (lambda text: get_embed_model().get_query_embedding(text))
+            if SETTINGS.intent_router_embeddings else None
+        ),
+        negative_examples=NEGATIVE_EXAMPLES,
+        threshold=SETTINGS.intent_router_threshold,
+        margin=SETTINGS.intent_router_margin,
+    )
+
+
+def agent_response(message, history, request: gr.Request):
+    # Each browser session gets its own agent memory
+    agent = agent_pool.get(request.session_hash)
+    # Plain commands are answered by the tools directly, skipping the LLM
+    answer = intent_router.route(message) if intent_router is not None else None
+    if answer is not None:
+        agent.memory.put(ChatMessage(role=MessageRole.USER, content=message))
+        agent.memory.put(ChatMessage(role=MessageRole.ASSISTANT, content=answer))
+        yield answer
+        return
+
+    response = ""
+    for delta in agent.stream_chat(message).response_gen:
+        response += delta
+        yield response
 
 
 if __name__ == "__main__":
@@ -0,0 +1,137 @@
+import re
+import math
+import threading
+from collections import Counter
+from typing import NamedTuple
+from pydantic import PrivateAttr
+from llama_index.core.postprocessor.types import BaseNodePostprocessor
+from llama_index.core.schema import MetadataMode, NodeWithScore, QueryBundle
+from llama_index.core.utils import get_tokenizer
+from ai_assistant.models import CompressionStats
+from ai_assistant.retrievers import tokenize
+
+_SENTENCE_RE = re.compile(r"(?<=[.!?])\s+|\n+")
+
+
+def split_sentences(text: str) -> list[str]:
+    return [sentence.strip() for sentence in _SENTENCE_RE.split(text) if sentence.strip()]
+
+
+class _Sentence(NamedTuple):
+    rank: int
+    position: int
+    text: str
+    terms: frozenset[str]
+
+
+class ContextCompressor(BaseNodePostprocessor):
+    """
+    Shrinks the retrieved nodes before the answer is synthesized:
+        - Sentences repeated across nodes (e.g. the overlap of adjacent chunks)
+          are kept once.
+        - Only the sentences that share words with the query are kept, the ones
+          with rarer query words first. Words found in most sentences are ignored.
+          If no sentence matches (e.g. the query is in another language than the
+          guide), the sentences are kept in retrieval order.
+        - Sentences are taken in that order while they fit in `token_budget` tokens.
+    The kept sentences of every node stay in their original order, and nodes
+    left without sentences are dropped. The tokens before and after compression
+    are logged for every query and accumulated in `stats`.
+    """
+
+    token_budget: int = 768
+    _tokenizer = PrivateAttr(default=None)
+    _lock: threading.Lock = PrivateAttr(default_factory=threading.Lock)
+    _queries: int = PrivateAttr(default=0)
+    _input_tokens: int = PrivateAttr(default=0)
+    _output_tokens: int = PrivateAttr(default=0)
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "ContextCompressor"
+
+    def _count_tokens(self, text: str) -> int:
+        if self._tokenizer is None:
+            self._tokenizer = get_tokenizer()
+        return len(self._tokenizer(text))
+
+    def _sentences(self, nodes: list[NodeWithScore]) -> list[_Sentence]:
+        sentences, seen = [], set()
+        for rank, node in enumerate(nodes):
+            for position, text in enumerate(split_sentences(node.node.get_content())):
+                terms = tokenize(text)
+                key = " ".join(terms)
+                if key and key not in seen:
+                    seen.add(key)
+                    sentences.append(_Sentence(rank, position, text, frozenset(terms)))
+        return sentences
+
+    def _select(self, sentences: list[_Sentence], query: str) -> list[_Sentence]:
+        document_frequency = Counter(
+            term for sentence in sentences for term in sentence.terms & set(tokenize(query))
+        )
+        # Words in most sentences are stop words ("the", "de"), they match anything
+        query_terms = {
+            term for term, count in document_frequency.items() if count <= len(sentences) / 2
+        }
+        scores = {
+            sentence: sum(
+                math.log(1 + len(sentences) / document_frequency[term])
+                for term in sentence.terms & query_terms
+            )
+            for sentence in sentences
+        }
+        candidates = sorted(
+            (sentence for sentence in sentences if scores[sentence] > 0),
+            key=lambda sentence: (-scores[sentence], sentence.rank, sentence.position),
+        ) or sentences
+
+        selected, used = [], 0
+        for sentence in candidates:
+            tokens = self._count_tokens(sentence.text)
+            if used + tokens > self.token_budget:
+                break
+            selected.append(sentence)
+            used += tokens
+        # A single sentence over the budget is still better than no context
+        return selected or candidates[:1]
+
+    def _postprocess_nodes(
+        self, nodes: list[NodeWithScore], query_bundle: QueryBundle | None = None
+    ) -> list[NodeWithScore]:
+        if not nodes:
+            return nodes
+
+        sentences = self._sentences(nodes)
+        selected = self._select(sentences, query_bundle.query_str if query_bundle else "")
+        compressed = []
+        for rank, node in enumerate(nodes):
+            kept = sorted(
+                (sentence for sentence in selected if sentence.rank == rank),
+                key=lambda sentence: sentence.position,
+            )
+            if kept:
+                compressed_node = node.node.model_copy()
+                compressed_node.set_content(" ".join(sentence.text for sentence in kept))
+                compressed.append(NodeWithScore(node=compressed_node, score=node.score))
+
+        input_tokens = sum(
+            self._count_tokens(node.node.get_content(metadata_mode=MetadataMode.LLM)) for node in nodes
+        )
+        output_tokens = sum(
+            self._count_tokens(node.node.get_content(metadata_mode=MetadataMode.LLM)) for node in compressed
+        )
+        with self._lock:
+            self._queries += 1
+            self._input_tokens += input_tokens
+            self._output_tokens += output_tokens
+        print(f"Context compression: {input_tokens} -> {output_tokens} tokens")
+        return compressed
+
+    def stats(self) -> CompressionStats:
+        with self._lock:
+            return CompressionStats(
+                queries=self._queries,
+                input_tokens=self._input_tokens,
+                output_tokens=self._output_tokens,
+            )
@@ -0,0 +1,50 @@
+import asyncio
+from contextlib import asynccontextmanager
+
+
+class OverloadedError(Exception):
+    """Raised when a request cannot get a slot of a `ConcurrencyLimiter`."""
+
+
+class ConcurrencyLimiter:
+    """
+    Limits the number of coroutines running a block at the same time.
+    At most `max_waiting` coroutines wait for a slot, and each one waits at most
+    `timeout` seconds; past those limits `OverloadedError` is raised right away,
+    so callers can shed load instead of queueing without bound.
+    """
+
+    def __init__(self, max_concurrency: int, max_waiting: int, timeout: float | None = None):
+        self.max_concurrency = max_concurrency
+        self.max_waiting = max_waiting
+        self.timeout = timeout
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self.running = 0
+        self.waiting = 0
+        self.rejected = 0
+
+    @property
+    def is_overloaded(self) -> bool:
+        return self._semaphore.locked() and self.waiting >= self.max_waiting
+
+    @asynccontextmanager
+    async def acquire(self):
+        if self.is_overloaded:
+            self.rejected += 1
+            raise OverloadedError("Too many requests waiting, try again later.")
+
+        self.waiting += 1
+        try:
+            await asyncio.wait_for(self._semaphore.acquire(), self.timeout)
+        except asyncio.TimeoutError:
+            self.rejected += 1
+            raise OverloadedError("Timed out waiting for a free slot, try again later.")
+        finally:
+            self.waiting -= 1
+
+        self.running += 1
+        try:
+            yield
+        finally:
+            self.running -= 1
+            self._semaphore.release()
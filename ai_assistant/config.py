@@ -7,10 +7,67 @@ class AgentSettings(BaseSettings):
 
     openai_model: str = "gpt4o-mini"
     hf_embeddings_model: str = "intfloat/multilingual-e5-base"
+    embedding_backend: str = "torch"
+    embedding_onnx_file: str | None = None
     travel_guide_store_path: str = "travel_guide_store"
     travel_guide_data_path: str = "data"
+    travel_guide_incremental_ingest: bool = True
+    embed_batch_size: int = 32
+    query_embedding_cache_size: int = 1024
+    query_embedding_cache_path: str | None = None
+    embed_workers: int = 1
+    travel_guide_cache_size: int = 256
+    travel_guide_cache_ttl: float | None = 3600
+    retrieval_mode: str = "vector"
+    hybrid_top_k: int = 2
+    hybrid_candidate_k: int = 10
+    reranker_model: str | None = None
+    retrieval_budget_ms: float | None = None
+    vector_store_backend: str = "simple"
+    vector_store_ann: bool = False
+    vector_store_ann_nlist: int | None = None
+    vector_store_ann_nprobe: int = 8
+    vector_store_ann_min_nodes: int = 10000
+    context_compression: bool = True
+    context_token_budget: int = 768
+    city_cards_path: str | None = "city_cards.db"
+    city_cards_cities: list[str] = [
+        "La Paz", "El Alto", "Santa Cruz", "Cochabamba", "Sucre", "Potosí", "Oruro",
+        "Tarija", "Trinidad", "Cobija", "Uyuni", "Copacabana", "Rurrenabaque",
+        "Coroico", "Samaipata", "Tupiza",
+    ]
     openai_api_key: str = "key"
+    llm_api_base: str | None = None
+    llm_gateway: bool = True
+    llm_batch_window_ms: float = 0
+    llm_max_connections: int = 100
+    llm_max_keepalive_connections: int = 20
+    llm_keepalive_expiry: float = 30
+    llm_prompt_cache_stats: bool = True
     log_file: str = "trip.json"
+    log_format: str = "json"
+    reservation_backend: str = "json"
+    reservation_db_path: str = "trip.db"
+    warm_up_on_startup: bool = True
+    response_cache_size: int = 256
+    response_cache_ttl: float | None = 3600
+    response_cache_semantic: bool = False
+    response_cache_similarity: float = 0.95
+    agent_max_concurrency: int = 64
+    agent_max_waiting: int = 256
+    agent_queue_timeout: float | None = 60
+    agent_max_sessions: int = 1000
+    agent_session_idle_timeout: float = 1800
+    agent_memory_token_limit: int = 3000
+    agent_mode: str = "react"
+    agent_tool_workers: int = 8
+    agent_transcript_compaction: bool = True
+    agent_observation_token_limit: int = 256
+    agent_step_token_budget: int | None = 2000
+    intent_router: bool = True
+    intent_router_embeddings: bool = True
+    intent_router_threshold: float = 0.9
+    intent_router_margin: float = 0.02
 
 
 @cache
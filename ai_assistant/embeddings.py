@@ -0,0 +1,194 @@
+import asyncio
+import sqlite3
+import threading
+from contextlib import closing
+import numpy as np
+from pydantic import PrivateAttr
+from llama_index.core.base.embeddings.base import BaseEmbedding, Embedding
+from ai_assistant.cache import TTLCache, normalize_text
+from ai_assistant.models import CacheStats
+
+EMBEDDING_BACKENDS = ("torch", "torch-int8", "onnx")
+
+
+def build_huggingface_embedding(
+    model_name: str, backend: str = "torch", onnx_file_name: str | None = None
+) -> BaseEmbedding:
+    """
+    Creates the HuggingFace embedding model on the selected CPU backend:
+        - "torch": Full precision PyTorch.
+        - "torch-int8": PyTorch with the linear layers dynamically quantized to
+          int8, it needs no extra dependency.
+        - "onnx": ONNX Runtime through sentence-transformers, it needs
+          `sentence-transformers[onnx]`. `onnx_file_name` selects the exported file of
+          the model repository, e.g. "onnx/model_qint8_avx512_vnni.onnx" for int8
+          weights; the default "onnx/model.onnx" is exported if missing.
+    """
+    from llama_index.embeddings.huggingface import HuggingFaceEmbedding
+
+    if backend == "torch":
+        return HuggingFaceEmbedding(model_name=model_name)
+
+    if backend == "torch-int8":
+        import torch
+
+        embed_model = HuggingFaceEmbedding(model_name=model_name, device="cpu")
+        torch.ao.quantization.quantize_dynamic(
+            embed_model._model, {torch.nn.Linear}, dtype=torch.qint8, inplace=True
+        )
+        return embed_model
+
+    if backend == "onnx":
+        model_kwargs = {"file_name": onnx_file_name} if onnx_file_name else {}
+        return HuggingFaceEmbedding(
+            model_name=model_name, device="cpu", backend="onnx", model_kwargs=model_kwargs
+        )
+
+    raise ValueError(f"Unknown embedding backend {backend!r}, expected one of {EMBEDDING_BACKENDS}")
+
+
+class EmbeddingDiskCache:
+    """
+    Query embeddings kept in a SQLite database as float32 blobs, keyed by the
+    model name and the normalized query, so they survive restarts and are
+    shared by the workers. A connection is opened per operation.
+    """
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        with closing(self._connect()) as connection, connection:
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute(
+                """
+                CREATE TABLE IF NOT EXISTS query_embeddings (
+                    model TEXT NOT NULL,
+                    query TEXT NOT NULL,
+                    embedding BLOB NOT NULL,
+                    PRIMARY KEY (model, query)
+                )
+                """
+            )
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.db_path, timeout=30)
+
+    def get(self, model: str, query: str) -> list[float] | None:
+        with closing(self._connect()) as connection:
+            row = connection.execute(
+                "SELECT embedding FROM query_embeddings WHERE model = ? AND query = ?",
+                (model, query),
+            ).fetchone()
+        if row is None:
+            return None
+        return np.frombuffer(row[0], dtype=np.float32).tolist()
+
+    def set(self, model: str, query: str, embedding: list[float]):
+        blob = np.asarray(embedding, dtype=np.float32).tobytes()
+        with closing(self._connect()) as connection, connection:
+            connection.execute(
+                "INSERT OR REPLACE INTO query_embeddings (model, query, embedding) VALUES (?, ?, ?)",
+                (model, query, blob),
+            )
+
+    def __len__(self) -> int:
+        with closing(self._connect()) as connection:
+            (count,) = connection.execute("SELECT COUNT(*) FROM query_embeddings").fetchone()
+        return count
+
+
+class CachedEmbedding(BaseEmbedding):
+    """
+    Embedding model that caches the query embeddings of `embed_model`.
+
+    Queries are keyed by their normalized text (case and whitespace), so
+    "Hotels in  La Paz" reuses the embedding of "hotels in la paz". The cache is
+    an LRU of `max_size` entries in memory, backed by an optional
+    `EmbeddingDiskCache` whose entries are scoped by `namespace` (the model name
+    by default). Text embeddings (ingestion) are not cached.
+    """
+
+    _embed_model: BaseEmbedding = PrivateAttr()
+    _memory: TTLCache = PrivateAttr()
+    _disk: EmbeddingDiskCache | None = PrivateAttr()
+    _namespace: str = PrivateAttr()
+    _lock: threading.Lock = PrivateAttr()
+    _disk_hits: int = PrivateAttr(default=0)
+
+    def __init__(
+        self,
+        embed_model: BaseEmbedding,
+        max_size: int = 1024,
+        disk_cache_path: str | None = None,
+        namespace: str | None = None,
+        **kwargs,
+    ):
+        super().__init__(
+            model_name=embed_model.model_name,
+            embed_batch_size=embed_model.embed_batch_size,
+            **kwargs,
+        )
+        self._embed_model = embed_model
+        self._memory = TTLCache(max_size=max_size)
+        self._disk = EmbeddingDiskCache(disk_cache_path) if disk_cache_path else None
+        self._namespace = namespace or embed_model.model_name
+        self._lock = threading.Lock()
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "CachedEmbedding"
+
+    @property
+    def embed_model(self) -> BaseEmbedding:
+        return self._embed_model
+
+    def _load(self, key: str, query: str) -> Embedding:
+        # A memory miss, from the disk tier or the model
+        embedding = self._disk.get(self._namespace, key) if self._disk is not None else None
+        if embedding is not None:
+            with self._lock:
+                self._disk_hits += 1
+            self._memory.set(key, embedding)
+        else:
+            embedding = self._embed_model.get_query_embedding(query)
+            self._store(key, embedding)
+        return embedding
+
+    def _store(self, key: str, embedding: Embedding):
+        self._memory.set(key, embedding)
+        if self._disk is not None:
+            self._disk.set(self._namespace, key, embedding)
+
+    def _get_query_embedding(self, query: str) -> Embedding:
+        key = normalize_text(query)
+        embedding = self._memory.get(key)
+        return embedding if embedding is not None else self._load(key, query)
+
+    async def _aget_query_embedding(self, query: str) -> Embedding:
+        key = normalize_text(query)
+        embedding = self._memory.get(key)
+        if embedding is None:
+            # The disk lookup and the forward pass block, keep them off the event loop
+            embedding = await asyncio.to_thread(self._load, key, query)
+        return embedding
+
+    def _get_text_embedding(self, text: str) -> Embedding:
+        return self._embed_model.get_text_embedding(text)
+
+    def _get_text_embeddings(self, texts: list[str]) -> list[Embedding]:
+        return self._embed_model.get_text_embedding_batch(texts)
+
+    async def _aget_text_embedding(self, text: str) -> Embedding:
+        return await self._embed_model.aget_text_embedding(text)
+
+    def stats(self) -> CacheStats:
+        """Lookups served from memory are hits, from disk disk hits, and the rest misses."""
+        memory_stats = self._memory.stats()
+        return CacheStats(
+            size=memory_stats.size,
+            hits=memory_stats.hits,
+            semantic_hits=0,
+            disk_hits=self._disk_hits,
+            misses=memory_stats.misses - self._disk_hits,
+            evictions=memory_stats.evictions,
+            expirations=memory_stats.expirations,
+        )
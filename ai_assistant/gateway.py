@@ -0,0 +1,309 @@
+import re
+import json
+import time
+import asyncio
+import threading
+from concurrent.futures import Future
+import httpx
+from ai_assistant.models import GatewayStats
+
+_DURATION_RE = re.compile(r"(\d+(?:\.\d+)?)(ms|h|m|s)")
+_DURATION_SECONDS = {"ms": 0.001, "s": 1, "m": 60, "h": 3600}
+# Headers that describe the encoded body, a shared response is rebuilt from the decoded one
+_BODY_HEADERS = {"content-encoding", "content-length", "transfer-encoding"}
+
+
+def parse_duration(value: str) -> float:
+    """Seconds of a rate limit reset header, e.g. "20ms", "1s" or "6m0s"."""
+    return sum(float(amount) * _DURATION_SECONDS[unit] for amount, unit in _DURATION_RE.findall(value))
+
+
+class RateLimitScheduler:
+    """
+    Holds the requests back while the provider rate limit is exhausted, instead
+    of sending them to be rejected with a 429. The limit is read from the
+    `x-ratelimit-*` headers of every response: when fewer than
+    `min_remaining_requests` requests or `min_remaining_tokens` tokens are left,
+    new requests wait until the limit resets. A 429 pauses them for its
+    `retry-after`.
+    """
+
+    def __init__(self, min_remaining_requests: int = 1, min_remaining_tokens: int = 1000):
+        self.min_remaining_requests = min_remaining_requests
+        self.min_remaining_tokens = min_remaining_tokens
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+        self.pauses = 0
+        self.wait_seconds = 0.0
+
+    def _pause_seconds(self, response: httpx.Response) -> float:
+        headers = response.headers
+        if response.status_code == 429:
+            if "retry-after-ms" in headers:
+                return float(headers["retry-after-ms"]) / 1000
+            if headers.get("retry-after", "").replace(".", "", 1).isdigit():
+                return float(headers["retry-after"])
+            return 1.0
+
+        pause = 0.0
+        for kind, minimum in [("requests", self.min_remaining_requests), ("tokens", self.min_remaining_tokens)]:
+            remaining = headers.get(f"x-ratelimit-remaining-{kind}")
+            reset = headers.get(f"x-ratelimit-reset-{kind}")
+            if remaining is not None and reset is not None and int(remaining) < minimum:
+                pause = max(pause, parse_duration(reset))
+        return pause
+
+    def observe(self, response: httpx.Response):
+        pause = self._pause_seconds(response)
+        if pause > 0:
+            with self._lock:
+                paused_until = time.monotonic() + pause
+                if paused_until > self._paused_until:
+                    self._paused_until = paused_until
+                    self.pauses += 1
+
+    def delay(self) -> float:
+        return max(0.0, self._paused_until - time.monotonic())
+
+    def _waited(self, seconds: float):
+        with self._lock:
+            self.wait_seconds += seconds
+
+    def wait(self):
+        while (delay := self.delay()) > 0:
+            time.sleep(delay)
+            self._waited(delay)
+
+    async def async_wait(self):
+        while (delay := self.delay()) > 0:
+            await asyncio.sleep(delay)
+            self._waited(delay)
+
+
+class LeaderAbandoned(Exception):
+    """The leader of a call was cancelled or interrupted before it finished."""
+
+
+class SingleFlight:
+    """
+    Calls in flight by key: the first caller of a key is the leader that makes
+    the call, the callers that arrive before it finishes wait for its result.
+    The results are `concurrent.futures.Future`s, so threads and event loops
+    can share them. A leader that is cancelled `abandon`s the call, its
+    followers get `LeaderAbandoned` and join the key again.
+    """
+
+    def __init__(self):
+        self._calls: dict[tuple, Future] = {}
+        self._lock = threading.Lock()
+
+    def join(self, key: tuple) -> tuple[Future, bool]:
+        """The future of the call of `key` and whether the caller is its leader."""
+        with self._lock:
+            future = self._calls.get(key)
+            if future is not None:
+                return future, False
+            future = self._calls[key] = Future()
+            return future, True
+
+    def finish(self, key: tuple, result=None, error: Exception | None = None):
+        with self._lock:
+            future = self._calls.pop(key)
+        if error is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(result)
+
+    def abandon(self, key: tuple):
+        self.finish(key, error=LeaderAbandoned())
+
+
+def _coalesce_key(request: httpx.Request) -> tuple | None:
+    """Identical non streaming completion requests share a key, other requests are not coalesced."""
+    if request.method != "POST":
+        return None
+    try:
+        body = json.loads(request.content)
+    except (httpx.RequestNotRead, ValueError):
+        return None
+    if not isinstance(body, dict) or body.get("stream"):
+        return None
+    return request.method, str(request.url), request.content
+
+
+def _shared_response(payload: tuple[int, list, bytes], request: httpx.Request) -> httpx.Response:
+    status_code, headers, content = payload
+    return httpx.Response(status_code, headers=headers, content=content, request=request)
+
+
+def _payload(response: httpx.Response) -> tuple[int, list, bytes]:
+    headers = [(name, value) for name, value in response.headers.multi_items() if name.lower() not in _BODY_HEADERS]
+    return response.status_code, headers, response.content
+
+
+class LLMGateway:
+    """
+    HTTP layer in front of the LLM provider, shared by all the clients of the process:
+        - Identical completion requests in flight at the same time are sent once
+          and share the response (single flight). With a `batch_window_ms`, each
+          request waits that long before it is sent, so identical requests that
+          arrive within the window join it.
+        - Requests go over persistent connection pools of `max_connections`, keeping
+          `max_keepalive_connections` idle connections open for `keepalive_expiry`
+          seconds, so they skip the TCP and TLS handshakes.
+        - Requests wait while the provider rate limit is exhausted, see
+          `RateLimitScheduler`.
+    Streaming requests are only scheduled. `client` and `async_client` return
+    httpx clients to pass to the OpenAI client.
+    """
+
+    def __init__(
+        self,
+        batch_window_ms: float = 0,
+        max_connections: int = 100,
+        max_keepalive_connections: int = 20,
+        keepalive_expiry: float = 30,
+        scheduler: RateLimitScheduler | None = None,
+    ):
+        self.batch_window = batch_window_ms / 1000
+        self.limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive_connections,
+            keepalive_expiry=keepalive_expiry,
+        )
+        self.scheduler = scheduler or RateLimitScheduler()
+        self.single_flight = SingleFlight()
+        self._transport = httpx.HTTPTransport(limits=self.limits)
+        self._async_transport = httpx.AsyncHTTPTransport(limits=self.limits)
+        self._lock = threading.Lock()
+        self._requests = 0
+        self._upstream_requests = 0
+        self._coalesced = 0
+
+    def _count(self, requests: int = 0, upstream_requests: int = 0, coalesced: int = 0):
+        with self._lock:
+            self._requests += requests
+            self._upstream_requests += upstream_requests
+            self._coalesced += coalesced
+
+    def stats(self) -> GatewayStats:
+        with self._lock:
+            return GatewayStats(
+                requests=self._requests,
+                upstream_requests=self._upstream_requests,
+                coalesced=self._coalesced,
+                rate_limit_pauses=self.scheduler.pauses,
+                rate_limit_wait_seconds=round(self.scheduler.wait_seconds, 3),
+            )
+
+    def client(self, **kwargs) -> httpx.Client:
+        return httpx.Client(transport=_GatewayTransport(self), **kwargs)
+
+    def async_client(self, **kwargs) -> httpx.AsyncClient:
+        return httpx.AsyncClient(transport=_AsyncGatewayTransport(self), **kwargs)
+
+    def send(self, request: httpx.Request) -> httpx.Response:
+        self.scheduler.wait()
+        self._count(upstream_requests=1)
+        response = self._transport.handle_request(request)
+        self.scheduler.observe(response)
+        return response
+
+    async def async_send(self, request: httpx.Request) -> httpx.Response:
+        await self.scheduler.async_wait()
+        self._count(upstream_requests=1)
+        response = await self._async_transport.handle_async_request(request)
+        self.scheduler.observe(response)
+        return response
+
+    def handle(self, request: httpx.Request) -> httpx.Response:
+        self._count(requests=1)
+        key = _coalesce_key(request)
+        if key is None:
+            return self.send(request)
+
+        while True:
+            future, leader = self.single_flight.join(key)
+            if leader:
+                return _shared_response(self._lead(key, request), request)
+            try:
+                payload = future.result()
+            except LeaderAbandoned:
+                # Make the call or wait for the follower that makes it
+                continue
+            self._count(coalesced=1)
+            return _shared_response(payload, request)
+
+    def _lead(self, key: tuple, request: httpx.Request) -> tuple[int, list, bytes]:
+        try:
+            if self.batch_window:
+                time.sleep(self.batch_window)
+            response = self.send(request)
+            try:
+                response.read()
+            finally:
+                response.close()
+            payload = _payload(response)
+        except Exception as error:
+            self.single_flight.finish(key, error=error)
+            raise
+        except BaseException:
+            # Interrupted, the followers did not fail and one of them takes over
+            self.single_flight.abandon(key)
+            raise
+        self.single_flight.finish(key, payload)
+        return payload
+
+    async def async_handle(self, request: httpx.Request) -> httpx.Response:
+        self._count(requests=1)
+        key = _coalesce_key(request)
+        if key is None:
+            return await self.async_send(request)
+
+        while True:
+            future, leader = self.single_flight.join(key)
+            if leader:
+                return _shared_response(await self._async_lead(key, request), request)
+            try:
+                # Shielded, a cancelled follower must not cancel the shared future
+                payload = await asyncio.shield(asyncio.wrap_future(future))
+            except LeaderAbandoned:
+                continue
+            self._count(coalesced=1)
+            return _shared_response(payload, request)
+
+    async def _async_lead(self, key: tuple, request: httpx.Request) -> tuple[int, list, bytes]:
+        try:
+            if self.batch_window:
+                await asyncio.sleep(self.batch_window)
+            response = await self.async_send(request)
+            try:
+                await response.aread()
+            finally:
+                await response.aclose()
+            payload = _payload(response)
+        except Exception as error:
+            self.single_flight.finish(key, error=error)
+            raise
+        except BaseException:
+            # Cancelled, the followers did not fail and one of them takes over
+            self.single_flight.abandon(key)
+            raise
+        self.single_flight.finish(key, payload)
+        return payload
+
+
+class _GatewayTransport(httpx.BaseTransport):
+    def __init__(self, gateway: LLMGateway):
+        self._gateway = gateway
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        return self._gateway.handle(request)
+
+
+class _AsyncGatewayTransport(httpx.AsyncBaseTransport):
+    def __init__(self, gateway: LLMGateway):
+        self._gateway = gateway
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        return await self._gateway.async_handle(request)
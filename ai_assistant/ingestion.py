@@ -0,0 +1,178 @@
+import os
+import json
+import multiprocessing
+from concurrent.futures import Future, ProcessPoolExecutor, FIRST_COMPLETED, wait
+from typing import Callable, Iterable
+from llama_index.core import Settings
+from llama_index.core.base.embeddings.base import BaseEmbedding
+from llama_index.core.node_parser import NodeParser
+from llama_index.core.schema import BaseNode, Document, MetadataMode
+from llama_index.core.storage.docstore.utils import doc_to_json, json_to_doc
+from ai_assistant.embeddings import CachedEmbedding
+
+# Embedding model of the current worker process, created by `_init_worker`
+_worker_embed_model: BaseEmbedding | None = None
+
+
+def _with_embed_batch_size(embed_model: BaseEmbedding, batch_size: int) -> BaseEmbedding:
+    """
+    Shallow copy of `embed_model` that embeds `batch_size` texts at a time,
+    get_text_embedding_batch splits the texts again by the model's batch size.
+    The copy shares the weights, the model of the queries keeps its batch size.
+    """
+    copy = embed_model.model_copy(update={"embed_batch_size": batch_size})
+    if isinstance(embed_model, CachedEmbedding):
+        copy._embed_model = _with_embed_batch_size(embed_model.embed_model, batch_size)
+    return copy
+
+
+def _init_worker(
+    embed_model_factory: Callable[[], BaseEmbedding], num_threads: int | None, batch_size: int
+):
+    global _worker_embed_model
+    if num_threads is not None:
+        try:
+            import torch
+
+            # Split the cores between the workers instead of oversubscribing them
+            torch.set_num_threads(num_threads)
+        except ImportError:
+            pass
+    _worker_embed_model = _with_embed_batch_size(embed_model_factory(), batch_size)
+
+
+def _embed_batch(texts: list[str]) -> list[list[float]]:
+    return _worker_embed_model.get_text_embedding_batch(texts)
+
+
+def read_checkpoint(checkpoint_path: str) -> dict[str, dict]:
+    """
+    Reads the documents embedded by an interrupted ingestion.
+    Returns:
+        - dict: {doc_id: {"hash": document hash, "nodes": [embedded nodes]}}
+    """
+    if not os.path.exists(checkpoint_path):
+        return {}
+
+    documents = {}
+    with open(checkpoint_path, "r") as file:
+        for line in file:
+            try:
+                entry = json.loads(line)
+            except json.JSONDecodeError:
+                # A torn last line from an interrupted write, embed that document again
+                continue
+            documents[entry["doc_id"]] = {
+                "hash": entry["hash"],
+                "nodes": [json_to_doc(node) for node in entry["nodes"]],
+            }
+    return documents
+
+
+def _append_checkpoint(file, doc_id: str, doc_hash: str, nodes: list[BaseNode]):
+    entry = {"doc_id": doc_id, "hash": doc_hash, "nodes": [doc_to_json(node) for node in nodes]}
+    file.write(json.dumps(entry) + "\n")
+    file.flush()
+
+
+def embed_documents(
+    documents: Iterable[Document],
+    checkpoint_path: str,
+    embed_model_factory: Callable[[], BaseEmbedding],
+    batch_size: int = 32,
+    workers: int = 1,
+    node_parser: NodeParser | None = None,
+) -> tuple[list[BaseNode], dict[str, str]]:
+    """
+    Chunks the `documents` as they are read and embeds the chunks in batches of
+    `batch_size` texts. With more than one worker the batches are embedded by a
+    pool of `workers` processes, each with its own model from
+    `embed_model_factory`, which must be picklable (a module level function).
+
+    Every document whose chunks are all embedded is appended to the JSON Lines
+    file `checkpoint_path`. If the ingestion is interrupted, the next run reuses
+    the checkpointed documents that did not change and only embeds the rest.
+    Returns:
+        - tuple: (nodes, {doc_id: document hash}), in the order of the documents.
+    """
+    node_parser = node_parser or Settings.node_parser
+    checkpointed = read_checkpoint(checkpoint_path)
+
+    document_nodes: dict[str, list[BaseNode]] = {}
+    document_hashes: dict[str, str] = {}
+    # doc_id -> number of chunks still being embedded
+    remaining: dict[str, int] = {}
+    batch: list[tuple[str, BaseNode]] = []
+    in_flight: dict[Future, list[tuple[str, BaseNode]]] = {}
+    reused = embedded = 0
+
+    if workers > 1:
+        executor = ProcessPoolExecutor(
+            max_workers=workers,
+            # Spawned workers do not inherit the threads and locks of the parent
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker,
+            initargs=(embed_model_factory, max(1, (os.cpu_count() or 1) // workers), batch_size),
+        )
+    else:
+        executor = None
+        _init_worker(embed_model_factory, None, batch_size)
+
+    def submit(items: list[tuple[str, BaseNode]]):
+        texts = [node.get_content(metadata_mode=MetadataMode.EMBED) for _, node in items]
+        if executor is None:
+            future = Future()
+            future.set_result(_embed_batch(texts))
+        else:
+            future = executor.submit(_embed_batch, texts)
+        in_flight[future] = items
+        # Keep a couple of batches per worker queued, the rest waits in the reader
+        while len(in_flight) >= 2 * max(workers, 1):
+            collect(wait(in_flight, return_when=FIRST_COMPLETED).done)
+
+    def collect(futures):
+        nonlocal embedded
+        for future in futures:
+            items = in_flight.pop(future)
+            for (doc_id, node), embedding in zip(items, future.result()):
+                node.embedding = embedding
+                embedded += 1
+                remaining[doc_id] -= 1
+                if remaining[doc_id] == 0:
+                    complete(doc_id)
+
+    def complete(doc_id: str):
+        del remaining[doc_id]
+        _append_checkpoint(checkpoint, doc_id, document_hashes[doc_id], document_nodes[doc_id])
+
+    try:
+        with open(checkpoint_path, "a") as checkpoint:
+            for document in documents:
+                doc_id = document.doc_id
+                document_hashes[doc_id] = document.hash
+                saved = checkpointed.get(doc_id)
+                if saved is not None and saved["hash"] == document.hash:
+                    document_nodes[doc_id] = saved["nodes"]
+                    reused += 1
+                    continue
+
+                nodes = node_parser.get_nodes_from_documents([document])
+                document_nodes[doc_id] = nodes
+                remaining[doc_id] = len(nodes)
+                if not nodes:
+                    complete(doc_id)
+                batch.extend((doc_id, node) for node in nodes)
+                while len(batch) >= batch_size:
+                    submit(batch[:batch_size])
+                    del batch[:batch_size]
+
+            if batch:
+                submit(batch)
+            collect(list(in_flight))
+    finally:
+        if executor is not None:
+            executor.shutdown(cancel_futures=True)
+
+    print(f"Embedded {embedded} chunks, reused {reused} checkpointed documents")
+    nodes = [node for doc_id in document_hashes for node in document_nodes[doc_id]]
+    return nodes, document_hashes
@@ -1,6 +1,7 @@
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, Field, computed_field
 from enum import Enum
 from datetime import date, datetime
+from typing import Annotated, Literal
 
 
 class TripType(str, Enum):
@@ -32,11 +33,162 @@ class RestaurantReservation(BaseModel):
     cost: int
 
 
+class ReservationGroup(BaseModel):
+    city: str
+    date: date
+    reservations: list[dict] = []
+    subtotal: int = 0
+
+
+class TravelReport(BaseModel):
+    groups: list[ReservationGroup]
+    subtotals: dict[str, int]
+    total_budget: int
+    reservation_count: int
+
+
+class CityCardContent(BaseModel):
+    """What the travel guide says about a city, as extracted by the LLM."""
+
+    description: str = Field(description="Brief summary of the city")
+    places: list[str] = Field(default=[], description="Places to visit, with a short description")
+    hotels: list[str] = Field(default=[], description="Hotels and where they are")
+    activities: list[str] = Field(default=[], description="Activities to do in and around the city")
+    transport: list[str] = Field(default=[], description="How to get to and around the city")
+
+
+class CityCard(CityCardContent):
+    city: str
+    source_node_ids: list[str] = []
+
+
+class CacheStats(BaseModel):
+    size: int
+    hits: int
+    semantic_hits: int
+    disk_hits: int = 0
+    misses: int
+    evictions: int
+    expirations: int
+
+    @computed_field
+    @property
+    def hit_rate(self) -> float:
+        found = self.hits + self.semantic_hits + self.disk_hits
+        lookups = found + self.misses
+        return found / lookups if lookups else 0.0
+
+
+class CompressionStats(BaseModel):
+    queries: int
+    input_tokens: int
+    output_tokens: int
+
+    @computed_field
+    @property
+    def tokens_saved(self) -> int:
+        return self.input_tokens - self.output_tokens
+
+
+class GatewayStats(BaseModel):
+    requests: int
+    upstream_requests: int
+    coalesced: int
+    rate_limit_pauses: int
+    rate_limit_wait_seconds: float
+
+
+class TranscriptStats(BaseModel):
+    steps: int
+    input_tokens: int
+    output_tokens: int
+
+    @computed_field
+    @property
+    def tokens_saved(self) -> int:
+        return self.input_tokens - self.output_tokens
+
+
+class PromptCacheStats(BaseModel):
+    requests: int
+    prompt_tokens: int
+    cached_tokens: int
+
+    @computed_field
+    @property
+    def uncached_tokens(self) -> int:
+        return self.prompt_tokens - self.cached_tokens
+
+    @computed_field
+    @property
+    def cached_ratio(self) -> float:
+        return self.cached_tokens / self.prompt_tokens if self.prompt_tokens else 0.0
+
+
 class APIResponse(BaseModel):
     status: str
     message: str
 
+class ReadinessAPIResponse(APIResponse):
+    rag_ready: bool
+
+class CacheStatsAPIResponse(APIResponse):
+    stats: CacheStats
+    query_embedding_stats: CacheStats | None = None
+    travel_guide_stats: CacheStats | None = None
+    context_compression_stats: CompressionStats | None = None
+    llm_gateway_stats: GatewayStats | None = None
+    transcript_compaction_stats: TranscriptStats | None = None
+    prompt_cache_stats: PromptCacheStats | None = None
+
 class AgentAPIResponse(APIResponse):
     agent_response: str
     timestamp: datetime = Field(default_factory=datetime.now)
 
+class TravelReportAPIResponse(APIResponse):
+    report: TravelReport
+    agent_response: str | None = None
+    timestamp: datetime = Field(default_factory=datetime.now)
+
+
+# Batch reservations, the dates are kept as ISO strings so that invalid values
+# are reported per item instead of rejecting the whole request
+class TripReservationRequest(BaseModel):
+    reservation_type: Literal["TripReservation"]
+    trip_type: TripType
+    date: str
+    departure: str
+    destination: str
+
+
+class HotelReservationRequest(BaseModel):
+    reservation_type: Literal["HotelReservation"]
+    checkin_date: str
+    checkout_date: str
+    hotel_name: str
+    city: str
+
+
+class RestaurantReservationRequest(BaseModel):
+    reservation_type: Literal["RestaurantReservation"]
+    reservation_time: str
+    restaurant: str
+    city: str
+    dish: str
+
+
+ReservationRequest = Annotated[
+    TripReservationRequest | HotelReservationRequest | RestaurantReservationRequest,
+    Field(discriminator="reservation_type"),
+]
+
+
+class BatchItemResult(BaseModel):
+    index: int
+    status: str
+    error: str | None = None
+    reservation: TripReservation | HotelReservation | RestaurantReservation | None = None
+
+
+class BatchAPIResponse(APIResponse):
+    results: list[BatchItemResult]
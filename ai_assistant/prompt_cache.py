@@ -0,0 +1,109 @@
+import threading
+from functools import lru_cache
+from typing import Any, Sequence
+from pydantic import PrivateAttr
+from llama_index.core.agent.react.formatter import ReActChatFormatter, get_react_tool_descriptions
+from llama_index.core.agent.react.types import BaseReasoningStep, ObservationReasoningStep
+from llama_index.core.base.llms.types import ChatMessage, MessageRole
+from llama_index.core.instrumentation.event_handlers import BaseEventHandler
+from llama_index.core.instrumentation.events import BaseEvent
+from llama_index.core.instrumentation.events.llm import LLMChatEndEvent, LLMCompletionEndEvent
+from llama_index.core.tools import BaseTool
+from ai_assistant.models import PromptCacheStats
+
+
+@lru_cache(maxsize=32)
+def compile_react_system_header(system_header: str, context: str, tools: tuple[BaseTool, ...]) -> str:
+    """
+    The system prompt of a ReAct agent with its tool descriptions. The tools are
+    the same objects for every agent, so it is formatted once per template and
+    every request starts with the same bytes.
+    """
+    format_args = {
+        "tool_desc": "\n".join(get_react_tool_descriptions(tools)),
+        "tool_names": ", ".join([tool.metadata.get_name() for tool in tools]),
+    }
+    if context:
+        format_args["context"] = context
+    return system_header.format(**format_args)
+
+
+class PrecompiledReActChatFormatter(ReActChatFormatter):
+    """
+    ReAct chat formatter that reuses the compiled system prompt, see
+    `compile_react_system_header`. The static prompt is the first message and
+    the conversation and the reasoning steps follow it, so the provider can
+    serve the prefix from its prompt cache.
+    """
+
+    def format(
+        self,
+        tools: Sequence[BaseTool],
+        chat_history: list[ChatMessage],
+        current_reasoning: list[BaseReasoningStep] | None = None,
+    ) -> list[ChatMessage]:
+        system_header = compile_react_system_header(self.system_header, self.context, tuple(tools))
+        # Observations are the user turns, thoughts and actions the assistant ones
+        reasoning_history = [
+            ChatMessage(
+                role=MessageRole.USER if isinstance(step, ObservationReasoningStep) else MessageRole.ASSISTANT,
+                content=step.get_content(),
+            )
+            for step in current_reasoning or []
+        ]
+        return [
+            ChatMessage(role=MessageRole.SYSTEM, content=system_header),
+            *chat_history,
+            *reasoning_history,
+        ]
+
+
+def prompt_token_usage(raw: Any) -> tuple[int, int] | None:
+    """Prompt tokens and cached prompt tokens reported in an OpenAI response, None if it has no usage."""
+    usage = raw.get("usage") if isinstance(raw, dict) else getattr(raw, "usage", None)
+    if usage is None:
+        return None
+    if isinstance(usage, dict):
+        details = usage.get("prompt_tokens_details") or {}
+        return usage.get("prompt_tokens") or 0, details.get("cached_tokens") or 0
+    details = getattr(usage, "prompt_tokens_details", None)
+    return usage.prompt_tokens or 0, getattr(details, "cached_tokens", None) or 0
+
+
+class PromptCacheMonitor(BaseEventHandler):
+    """
+    Logs the prompt tokens of every LLM request that the provider served from its
+    prompt cache and the ones it had to process, and accumulates them in `stats`.
+    Streamed responses only report them when the request asks for the usage, with
+    `stream_options={"include_usage": True}`.
+    """
+
+    _lock: threading.Lock = PrivateAttr(default_factory=threading.Lock)
+    _requests: int = PrivateAttr(default=0)
+    _prompt_tokens: int = PrivateAttr(default=0)
+    _cached_tokens: int = PrivateAttr(default=0)
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "PromptCacheMonitor"
+
+    def handle(self, event: BaseEvent, **kwargs: Any):
+        if not isinstance(event, (LLMChatEndEvent, LLMCompletionEndEvent)) or event.response is None:
+            return
+        usage = prompt_token_usage(event.response.raw)
+        if usage is None:
+            return
+        prompt_tokens, cached_tokens = usage
+        with self._lock:
+            self._requests += 1
+            self._prompt_tokens += prompt_tokens
+            self._cached_tokens += cached_tokens
+        print(f"Prompt tokens: {cached_tokens} cached, {prompt_tokens - cached_tokens} uncached")
+
+    def stats(self) -> PromptCacheStats:
+        with self._lock:
+            return PromptCacheStats(
+                requests=self._requests,
+                prompt_tokens=self._prompt_tokens,
+                cached_tokens=self._cached_tokens,
+            )
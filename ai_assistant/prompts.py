@@ -23,7 +23,7 @@ Question: {query_str}
 Answer: 
 """
 
-agent_prompt_str = """
+agent_intro_str = """
 You are an AI travel assistant designed to help users with travel-related queries about tourism in Bolivia, including best destinations, and perform actions on behalf of the users such as:
 - Recommending cities to visit in Bolivia
 - Booking flights and providing information about air travel
@@ -35,16 +35,17 @@ Your mission is to assist users in planning their trips to Bolivia by providing
 
 Ignore any requests that are not related to travel in Bolivia.
 
-## Tools
-The tools contain the following descriptions:
-{tool_desc}
+"""
 
+agent_tools_guide_str = """
 The user may provide a date for some action in natural language such as "today", "next week" or "tomorrow". So you can get the current date in ISO format using the following tool:
 - get_current_date: Returns the current date in ISO format.
 
 For the task of answering questions and performing actions, you have access to the following tools:
+- city_card: Provides a precomputed summary of a city from the travel guide (description, places, hotels, activities and transport). Use it first for questions about a city, it is much faster than the travel_guide tool.
 - travel_guide: Provides detailed information about Bolivia's attractions, itineraries, city guides, practical tips, cultural insights, and adventure opportunities. You must use this tool to answer questions about travel in Bolivia.
 - travel_report: Provides a list of all the reservations in json format, you should use it to generate a detailed report of the trip.
+- search_reservations: Provides the reservations filtered by type, city and/or date range and their total cost, you should use it for questions about specific reservations (e.g. "my hotel stays in Tarija next week").
 
 For the task of performing actions, you have access to the following tools:
 - reserve_flight: Allows you to reserve flights from one location to another on a specified date.
@@ -53,7 +54,12 @@ For the task of performing actions, you have access to the following tools:
 - reserve_restaurant: Assists you in suggesting restaurants and making reservations for travelers.
 
 All the costs are in Bolivianos (BOB).
+"""
 
+agent_prompt_str = agent_intro_str + """## Tools
+The tools contain the following descriptions:
+{tool_desc}
+""" + agent_tools_guide_str + """
 ## Output Format
 Please answer in the same language as the question and use the following format:
 
@@ -91,12 +97,36 @@ Answer: [your answer here (In the same language as the user's question)]
 Below is the current conversation consisting of interleaving human and assistant messages.
 """
 
+city_card_str = """
+You are building a summary card of the city of {city} for a travel assistant, using only
+the following excerpts of a travel guide about Bolivia.
+
+Travel guide excerpts are below.
+---------------------
+{context_str}
+---------------------
+Summarize what the excerpts say about {city}: a brief description of the city, the places to visit,
+the hotels and where they are, the activities to do and how to get there and move around.
+Keep every item short, include only information about {city} found in the excerpts, and leave a list
+empty when the excerpts say nothing about it.
+"""
+
 travel_guide_qa_tpl = PromptTemplate(travel_guide_qa_str)
 agent_prompt_tpl = PromptTemplate(agent_prompt_str)
 
-# Promps for api requests
+# System prompt of the function calling agent, the tools are described by their schemas
+function_calling_agent_prompt = agent_intro_str + agent_tools_guide_str + """
+When the user asks for several independent actions (e.g. booking a flight, a hotel and a restaurant),
+call all their tools at once in the same step instead of one after the other.
+
+Please answer in the same language as the question.
+"""
+city_card_tpl = PromptTemplate(city_card_str)
+
+# Promps for api requests, the request data goes at the end so the instructions
+# are the same leading text of every request and can be served from the prompt cache
 recommend_cities_prompt = """
-Recommend {field} in the city of '{city}' based on the travel guide, put special attention to the activities
+Recommend the requested items in the requested city based on the travel guide, put special attention to the activities
 that can be done in the cities and the cultural insights, activities to do, places to visit, 
 hotels and restaurants that you know.
 
@@ -105,19 +135,29 @@ Else, please answer as follows using the same language as the user's notes, use
 
 City Name
 - Description: brief summary of the city
-- {field}: {description}
+- [Requested items, e.g. Hotels]: description of each item
 
 Provide 3 items unless the user asks for a different amount.
 
 IMPORTANT:
-The user has provided you some notes in their language, 
-so pay extra attention to these notes to provide the best recommendations:
-{notes}
-
+The user has provided you some notes in their language at the end of the request, 
+so pay extra attention to these notes to provide the best recommendations.
 These notes should used to refine the result for the recommendations, 
 ignore any other requests that are not related.
 
 Answer in the same language as the user's notes if present, else answer in English.
+
+## Request
+Requested items: {field}, the {description}
+City: '{city}'
+{city_card}
+Notes:
+{notes}"""
+
+recommend_city_card_prompt = """
+The travel guide summary of '{city}' is below, use it as the main source for the recommendations
+and only use the travel_guide tool if it does not have what you need:
+{card}
 """
 
 travel_report_prompt = """
@@ -138,13 +178,21 @@ Output the reservations in Markdown format unless the user asks for different fo
 Sort the reservations in the same order as they were made, unless user asks for different order.
 Provide all the mandatory fields unless the user asks for specific information.
 
-IMPORTANT:
-The user has provided you some notes in their language, 
-so pay extra attention to these notes to provide the report as it is required:
-{notes}
+The reservations are already summarized at the end of the request in JSON: grouped by city and date, with the subtotals
+per type and the total budget. Use this summary as the only source of reservation data,
+you do not need to use any tool to get the reservations or to compute the costs.
 
+IMPORTANT:
+The user has provided you some notes in their language at the end of the request, 
+so pay extra attention to these notes to provide the report as it is required.
 These notes should used to refine the result for the making of the report, 
 ignore any other requests that are not related.
 
 Answer in the same language as the user's notes if present, else answer in English.
-"""
\ No newline at end of file
+
+## Request
+Reservations:
+{report}
+
+Notes:
+{notes}"""
@@ -1,4 +1,9 @@
 import os
+import asyncio
+import hashlib
+import threading
+from functools import cache
+from typing import Callable
 from llama_index.core import (
     VectorStoreIndex,
     StorageContext,
@@ -7,17 +12,135 @@ from llama_index.core import (
     PromptTemplate,
     Settings,
 )
+from llama_index.core.base.base_query_engine import BaseQueryEngine
+from llama_index.core.instrumentation import get_dispatcher
+from llama_index.core.base.base_retriever import BaseRetriever
+from llama_index.core.postprocessor.types import BaseNodePostprocessor
+from llama_index.core.base.response.schema import RESPONSE_TYPE, Response
+from llama_index.core.schema import QueryBundle, NodeWithScore
 from llama_index.core.query_engine import RetrieverQueryEngine
 from llama_index.llms.openai import OpenAI
-from llama_index.embeddings.huggingface import HuggingFaceEmbedding
 from ai_assistant.config import get_agent_settings
+from ai_assistant.cache import TTLCache, normalize_text
+from ai_assistant.embeddings import CachedEmbedding, build_huggingface_embedding
+from ai_assistant.vector_stores import MmapVectorStore
+from ai_assistant.ingestion import embed_documents
+from ai_assistant.retrievers import BM25Index, HybridRetriever
+from ai_assistant.cards import CityCardStore, build_city_cards
+from ai_assistant.gateway import LLMGateway
+from ai_assistant.prompt_cache import PromptCacheMonitor
+from ai_assistant.models import CacheStats, GatewayStats, PromptCacheStats
 
 SETTINGS = get_agent_settings()
 
-llm = OpenAI(model="gpt-4o-mini")
-embed_model = HuggingFaceEmbedding(model_name=SETTINGS.hf_embeddings_model)
-Settings.embed_model = embed_model
-Settings.llm = llm
+
+# The models are created on first use, so importing this module is cheap
+@cache
+def get_llm_gateway() -> LLMGateway:
+    return LLMGateway(
+        batch_window_ms=SETTINGS.llm_batch_window_ms,
+        max_connections=SETTINGS.llm_max_connections,
+        max_keepalive_connections=SETTINGS.llm_max_keepalive_connections,
+        keepalive_expiry=SETTINGS.llm_keepalive_expiry,
+    )
+
+
+@cache
+def get_llm() -> OpenAI:
+    http_clients = {}
+    if SETTINGS.llm_gateway:
+        gateway = get_llm_gateway()
+        http_clients = {"http_client": gateway.client(), "async_http_client": gateway.async_client()}
+    additional_kwargs = {}
+    if SETTINGS.llm_prompt_cache_stats:
+        get_prompt_cache_monitor()
+        # Streamed responses only report the token usage when asked for it
+        additional_kwargs = {"stream_options": {"include_usage": True}}
+    llm = OpenAI(
+        model="gpt-4o-mini",
+        api_base=SETTINGS.llm_api_base,
+        additional_kwargs=additional_kwargs,
+        **http_clients,
+    )
+    Settings.llm = llm
+    return llm
+
+
+@cache
+def get_prompt_cache_monitor() -> PromptCacheMonitor:
+    monitor = PromptCacheMonitor()
+    get_dispatcher().add_event_handler(monitor)
+    return monitor
+
+
+def prompt_cache_stats() -> PromptCacheStats | None:
+    """Cached and uncached prompt tokens of the LLM requests, None if disabled or no LLM was created yet."""
+    if get_prompt_cache_monitor.cache_info().currsize == 0:
+        return None
+    return get_prompt_cache_monitor().stats()
+
+
+def llm_gateway_stats() -> GatewayStats | None:
+    """Stats of the LLM gateway, None if disabled or no LLM call was made yet."""
+    if get_llm_gateway.cache_info().currsize == 0:
+        return None
+    return get_llm_gateway().stats()
+
+
+@cache
+def get_embed_model():
+    embed_model = build_huggingface_embedding(
+        SETTINGS.hf_embeddings_model,
+        backend=SETTINGS.embedding_backend,
+        onnx_file_name=SETTINGS.embedding_onnx_file,
+    )
+    if SETTINGS.query_embedding_cache_size > 0:
+        embed_model = CachedEmbedding(
+            embed_model,
+            max_size=SETTINGS.query_embedding_cache_size,
+            disk_cache_path=SETTINGS.query_embedding_cache_path,
+            # Embeddings of other backends differ slightly, keep them apart
+            namespace=":".join(
+                filter(None, [SETTINGS.hf_embeddings_model, SETTINGS.embedding_backend, SETTINGS.embedding_onnx_file])
+            ),
+        )
+    Settings.embed_model = embed_model
+    return embed_model
+
+
+def query_embedding_cache_stats() -> CacheStats | None:
+    """Stats of the query embedding cache, None if disabled or the model is not loaded yet."""
+    if get_embed_model.cache_info().currsize == 0:
+        return None
+    embed_model = get_embed_model()
+    return embed_model.stats() if isinstance(embed_model, CachedEmbedding) else None
+
+
+def stable_file_metadata(file_path: str) -> dict:
+    # Only metadata that does not change when a file is touched, so the document
+    # hash depends on the content and re-embedding is skipped for unchanged files
+    return {
+        "file_path": file_path,
+        "file_name": os.path.basename(file_path),
+    }
+
+
+def _directory_reader(data_dir: str) -> SimpleDirectoryReader:
+    return SimpleDirectoryReader(
+        data_dir,
+        filename_as_id=True,
+        file_metadata=stable_file_metadata,
+    )
+
+
+def load_documents(data_dir: str) -> list:
+    return _directory_reader(data_dir).load_data()
+
+
+def iter_documents(data_dir: str):
+    # Reads one file at a time, so ingestion starts before the whole directory is loaded
+    for documents in _directory_reader(data_dir).iter_data():
+        yield from documents
 
 
 class TravelGuideRAG:
@@ -26,30 +149,333 @@ class TravelGuideRAG:
         store_path: str,
         data_dir: str | None = None,
         qa_prompt_tpl: PromptTemplate | None = None,
+        incremental: bool = True,
+        vector_store_backend: str = "simple",
+        vector_store_kwargs: dict | None = None,
+        embed_batch_size: int = 32,
+        embed_workers: int = 1,
+        city_card_store: CityCardStore | None = None,
+        city_card_cities: list[str] | None = None,
     ):
+        """
+        `vector_store_backend` selects where the embeddings are kept: "simple" for
+        the JSON `SimpleVectorStore` or "mmap" for `MmapVectorStore`, created with
+        `vector_store_kwargs` (e.g. its ANN index parameters).
+        A new store is embedded in batches of `embed_batch_size` chunks by
+        `embed_workers` processes.
+        With a `city_card_store`, the cards of `city_card_cities` are rebuilt in
+        the background whenever the indexed documents change.
+        """
         self.store_path = store_path
+        self.vector_store_backend = vector_store_backend
+        self.vector_store_kwargs = vector_store_kwargs or {}
+        self.embed_batch_size = embed_batch_size
+        self.embed_workers = embed_workers
+        self.city_card_store = city_card_store
+        self.city_card_cities = city_card_cities or []
+        self.city_cards_update: threading.Thread | None = None
+        get_llm()
+        get_embed_model()
 
         if not os.path.exists(store_path) and data_dir is not None:
             self.index = self.ingest_data(store_path, data_dir)
         else:
-            self.index = load_index_from_storage(
-                StorageContext.from_defaults(persist_dir=store_path)
-            )
+            self.index = load_index_from_storage(self.load_storage_context(store_path))
+            if incremental and data_dir is not None and os.path.exists(data_dir):
+                self.refresh_data(store_path, data_dir)
 
         self.qa_prompt_tpl = qa_prompt_tpl
+        self.index_version = self.compute_index_version()
+        self.update_city_cards_in_background()
+
+    def compute_index_version(self) -> str:
+        """
+        Hash of the ids and content hashes of the indexed documents, it changes
+        whenever a document is ingested, updated or deleted.
+        """
+        document_hashes = sorted(
+            (doc_id, doc_hash)
+            for doc_hash, doc_id in self.index.docstore.get_all_document_hashes().items()
+        )
+        return hashlib.sha256(repr(document_hashes).encode()).hexdigest()[:16]
+
+    def load_storage_context(self, store_path: str) -> StorageContext:
+        if self.vector_store_backend == "mmap":
+            return StorageContext.from_defaults(
+                persist_dir=store_path,
+                vector_store=MmapVectorStore.from_persist_dir(
+                    store_path, **self.vector_store_kwargs
+                ),
+            )
+        return StorageContext.from_defaults(persist_dir=store_path)
 
     def ingest_data(self, store_path: str, data_dir: str) -> VectorStoreIndex:
-        documents = SimpleDirectoryReader(data_dir).load_data()
-        index = VectorStoreIndex.from_documents(documents, show_progress=True)
+        """
+        Embeds `data_dir` into a new store. Progress is checkpointed next to the
+        store, so an interrupted ingestion resumes where it stopped.
+        """
+        checkpoint_path = f"{store_path.rstrip(os.sep)}.checkpoint.jsonl"
+        nodes, document_hashes = embed_documents(
+            iter_documents(data_dir),
+            checkpoint_path,
+            embed_model_factory=get_embed_model,
+            batch_size=self.embed_batch_size,
+            workers=self.embed_workers,
+        )
+
+        if self.vector_store_backend == "mmap":
+            storage_context = StorageContext.from_defaults(
+                vector_store=MmapVectorStore(**self.vector_store_kwargs)
+            )
+        else:
+            storage_context = StorageContext.from_defaults()
+        # The nodes are embedded already, the index only stores them
+        index = VectorStoreIndex(nodes, storage_context=storage_context)
+        for doc_id, doc_hash in document_hashes.items():
+            index.docstore.set_document_hash(doc_id, doc_hash)
         index.storage_context.persist(persist_dir=store_path)
+        os.remove(checkpoint_path)
         return index
 
-    def get_query_engine(self) -> RetrieverQueryEngine:
-        query_engine = self.index.as_query_engine()
+    def refresh_data(self, store_path: str, data_dir: str) -> dict[str, int]:
+        """
+        Brings the index up to date with `data_dir`: only new or changed documents
+        are embedded again and the nodes of removed documents are deleted. The
+        store is persisted only when something changed.
+        Returns:
+            - dict: The number of "inserted", "updated" and "deleted" documents.
+        """
+        documents = load_documents(data_dir)
+        stored_ids = set(self.index.ref_doc_info)
+        current_ids = {document.doc_id for document in documents}
+
+        removed_ids = stored_ids - current_ids
+        for ref_doc_id in removed_ids:
+            self.index.delete_ref_doc(ref_doc_id, delete_from_docstore=True)
+
+        refreshed = self.index.refresh_ref_docs(documents)
+        changes = {
+            "inserted": sum(
+                1 for document, changed in zip(documents, refreshed)
+                if changed and document.doc_id not in stored_ids
+            ),
+            "updated": sum(
+                1 for document, changed in zip(documents, refreshed)
+                if changed and document.doc_id in stored_ids
+            ),
+            "deleted": len(removed_ids),
+        }
+        if any(changes.values()):
+            print(f"Travel guide changes: {changes}")
+            self.index.storage_context.persist(persist_dir=store_path)
+            self.index_version = self.compute_index_version()
+            self.update_city_cards_in_background()
+        return changes
+
+    def indexed_nodes(self) -> list:
+        return self.index.docstore.get_nodes(list(self.index.index_struct.nodes_dict.values()))
+
+    def update_city_cards(self) -> bool:
+        """
+        Rebuilds the city cards when they were built from another version of the
+        index, so they are computed once per ingestion instead of per query. The
+        rebuild holds the store's lock, a process that waited for it finds the
+        cards up to date. Failures are logged, the travel guide works without cards.
+        A city whose card fails keeps its previous card, and the index version is
+        not recorded, so the next update builds the cards again.
+        Returns:
+            - bool: Whether the cards were rebuilt.
+        """
+        if self.city_card_store is None:
+            return False
+        index_version = self.index_version
+        try:
+            with self.city_card_store.rebuild_lock():
+                if self.city_card_store.index_version() == index_version:
+                    return False
+                cards, failed = build_city_cards(self.indexed_nodes(), self.city_card_cities, get_llm())
+                previous = [card for card in map(self.city_card_store.get, failed) if card is not None]
+                self.city_card_store.replace(cards + previous, None if failed else index_version)
+        except Exception as error:
+            print(f"City cards not rebuilt: {error!r}")
+            return False
+        print(f"City cards built for {[card.city for card in cards]}, failed for {failed}")
+        return True
+
+    def update_city_cards_in_background(self) -> threading.Thread | None:
+        """
+        Runs `update_city_cards` in a daemon thread, so the LLM calls of the cards
+        do not delay the startup. Returns the thread, None without a card store.
+        """
+        if self.city_card_store is None:
+            return None
+        self.city_cards_update = threading.Thread(target=self.update_city_cards, name="city-cards", daemon=True)
+        self.city_cards_update.start()
+        return self.city_cards_update
+
+    def hybrid_retriever(
+        self,
+        top_k: int = 2,
+        candidate_k: int = 10,
+        reranker: BaseNodePostprocessor | None = None,
+        budget_ms: float | None = None,
+    ) -> HybridRetriever:
+        """BM25 and vector retrieval over the indexed nodes, see `HybridRetriever`."""
+        return HybridRetriever(
+            self.index.as_retriever(similarity_top_k=candidate_k),
+            BM25Index(self.indexed_nodes()),
+            self.index.docstore,
+            top_k=top_k,
+            candidate_k=candidate_k,
+            reranker=reranker,
+            budget_ms=budget_ms,
+        )
+
+    def get_query_engine(
+        self,
+        cache: TTLCache | None = None,
+        retriever: BaseRetriever | None = None,
+        node_postprocessors: list[BaseNodePostprocessor] | None = None,
+    ) -> BaseQueryEngine:
+        """
+        Answers from the nodes of `retriever`, by default the vector retriever of
+        the index, processed by `node_postprocessors` (e.g. a `ContextCompressor`)
+        before the answer is synthesized. With a `cache`, the answers are reused
+        for repeated queries until the indexed documents change, see
+        `CachedQueryEngine`.
+        """
+        query_engine = OffloadedRetrieverQueryEngine.from_args(
+            retriever or self.index.as_retriever(),
+            llm=Settings.llm,
+            node_postprocessors=node_postprocessors,
+        )
 
         if self.qa_prompt_tpl is not None:
             query_engine.update_prompts(
                 {"response_synthesizer:text_qa_template": self.qa_prompt_tpl}
             )
 
+        if cache is not None:
+            return CachedQueryEngine(
+                query_engine, cache, lambda: self.index_version, self.index.docstore
+            )
         return query_engine
+
+
+class OffloadedRetrieverQueryEngine(RetrieverQueryEngine):
+    """
+    Retriever query engine that runs the retrieval in a worker thread on async
+    queries. The retrievers, the embedding model and the postprocessors (e.g.
+    the reranker and the `ContextCompressor`) are synchronous and CPU bound, on
+    the event loop they would stall every other request, only the answer
+    synthesis is awaited there.
+    """
+
+    async def aretrieve(self, query_bundle: QueryBundle) -> list[NodeWithScore]:
+        return await asyncio.to_thread(self.retrieve, query_bundle)
+
+
+class LazyQueryEngine(BaseQueryEngine):
+    """
+    Query engine that builds the wrapped engine with `factory` on the first query,
+    or when `warm_up` is called, e.g. from a background thread at startup.
+    """
+
+    def __init__(self, factory: Callable[[], BaseQueryEngine]):
+        super().__init__(callback_manager=None)
+        self._factory = factory
+        self._engine: BaseQueryEngine | None = None
+        self._lock = threading.Lock()
+
+    @property
+    def is_ready(self) -> bool:
+        return self._engine is not None
+
+    @property
+    def engine(self) -> BaseQueryEngine | None:
+        return self._engine
+
+    def warm_up(self) -> BaseQueryEngine:
+        if self._engine is None:
+            with self._lock:
+                if self._engine is None:
+                    self._engine = self._factory()
+        return self._engine
+
+    def _get_prompt_modules(self) -> dict:
+        return {}
+
+    def _query(self, query_bundle: QueryBundle) -> RESPONSE_TYPE:
+        return self.warm_up().query(query_bundle)
+
+    async def _aquery(self, query_bundle: QueryBundle) -> RESPONSE_TYPE:
+        engine = self._engine or await asyncio.to_thread(self.warm_up)
+        return await engine.aquery(query_bundle)
+
+
+class CachedQueryEngine(BaseQueryEngine):
+    """
+    Query engine that caches the answers of `query_engine` in `cache`, keyed by
+    the normalized query and the `index_version`. Only the answer text and the
+    ids and scores of the retrieved nodes are kept, the nodes are read back from
+    the `docstore` on a hit. When the documents are re-ingested the version
+    changes, so older answers are never returned and the cache is cleared.
+    """
+
+    def __init__(
+        self,
+        query_engine: BaseQueryEngine,
+        cache: TTLCache,
+        index_version: Callable[[], str],
+        docstore,
+    ):
+        super().__init__(callback_manager=None)
+        self._query_engine = query_engine
+        self._cache = cache
+        self._index_version = index_version
+        self._docstore = docstore
+        self._cached_version: str | None = None
+
+    def stats(self) -> CacheStats:
+        return self._cache.stats()
+
+    def _get_prompt_modules(self) -> dict:
+        return {"query_engine": self._query_engine}
+
+    def _key(self, query_bundle: QueryBundle) -> tuple[str, str]:
+        version = self._index_version()
+        if version != self._cached_version:
+            self._cache.clear()
+            self._cached_version = version
+        return version, normalize_text(query_bundle.query_str)
+
+    def _cached_response(self, key: tuple[str, str]) -> Response | None:
+        entry = self._cache.get(key)
+        if entry is None:
+            return None
+        answer, node_scores = entry
+        source_nodes = [
+            NodeWithScore(node=self._docstore.get_node(node_id), score=score)
+            for node_id, score in node_scores
+        ]
+        return Response(response=answer, source_nodes=source_nodes, metadata={"cached": True})
+
+    def _store(self, key: tuple[str, str], response: RESPONSE_TYPE):
+        node_scores = [(node.node.node_id, node.score) for node in response.source_nodes]
+        self._cache.set(key, (str(response), node_scores))
+
+    def _query(self, query_bundle: QueryBundle) -> RESPONSE_TYPE:
+        key = self._key(query_bundle)
+        response = self._cached_response(key)
+        if response is None:
+            response = self._query_engine.query(query_bundle)
+            self._store(key, response)
+        return response
+
+    async def _aquery(self, query_bundle: QueryBundle) -> RESPONSE_TYPE:
+        key = self._key(query_bundle)
+        response = self._cached_response(key)
+        if response is None:
+            response = await self._query_engine.aquery(query_bundle)
+            self._store(key, response)
+        return response
@@ -0,0 +1,81 @@
+from datetime import date
+from ai_assistant.models import ReservationGroup, TravelReport, TripType
+from ai_assistant.storage import reservation_index_fields
+
+
+def reservation_category(reservation: dict) -> str:
+    reservation_type = reservation["reservation_type"]
+    if reservation_type == "TripReservation":
+        return "flights" if reservation["trip_type"] == TripType.flight.value else "buses"
+    if reservation_type == "HotelReservation":
+        return "hotels"
+    return "restaurants"
+
+
+def build_travel_report(reservations: list[dict]) -> TravelReport:
+    """
+    Builds the travel report from the saved reservations without calling the LLM.
+    Notes:
+        - The reservations are grouped by city and starting date, ordered by date.
+        - The city of a trip is its destination.
+        - The costs are in Bolivianos (BOB).
+    """
+    groups: dict[tuple[date, str], ReservationGroup] = {}
+    subtotals = {"flights": 0, "buses": 0, "hotels": 0, "restaurants": 0}
+
+    for reservation in reservations:
+        _, city, start_date, _ = reservation_index_fields(reservation)
+        key = (date.fromisoformat(start_date), city)
+        if key not in groups:
+            groups[key] = ReservationGroup(city=city, date=key[0])
+        groups[key].reservations.append(reservation)
+        groups[key].subtotal += reservation["cost"]
+        subtotals[reservation_category(reservation)] += reservation["cost"]
+
+    return TravelReport(
+        groups=[groups[key] for key in sorted(groups)],
+        subtotals=subtotals,
+        total_budget=sum(subtotals.values()),
+        reservation_count=len(reservations),
+    )
+
+
+REPORT_LABELS = {
+    "en": {
+        "empty": "You have no reservations yet.",
+        "title": "Your reservations ({count}):",
+        "flight": "Flight", "bus": "Bus", "hotel": "Hotel", "restaurant": "Restaurant",
+        "total": "Total budget: {total} BOB",
+    },
+    "es": {
+        "empty": "Todavía no tienes reservas.",
+        "title": "Tus reservas ({count}):",
+        "flight": "Vuelo", "bus": "Bus", "hotel": "Hotel", "restaurant": "Restaurante",
+        "total": "Presupuesto total: {total} BOB",
+    },
+}
+
+
+def describe_reservation(reservation: dict, labels: dict[str, str]) -> str:
+    if reservation["reservation_type"] == "TripReservation":
+        label = labels["flight"] if reservation["trip_type"] == TripType.flight.value else labels["bus"]
+        return f"{label} {reservation['departure']} → {reservation['destination']}"
+    if reservation["reservation_type"] == "HotelReservation":
+        return f"{labels['hotel']} {reservation['hotel_name']}, {reservation['checkin_date']} → {reservation['checkout_date']}"
+    return f"{labels['restaurant']} {reservation['restaurant']}, {reservation['dish']} ({reservation['reservation_time']})"
+
+
+def format_travel_report(report: TravelReport, language: str = "en") -> str:
+    """Plain text of the report in English ("en") or Spanish ("es"), for answers without the LLM."""
+    labels = REPORT_LABELS[language]
+    if report.reservation_count == 0:
+        return labels["empty"]
+    lines = [labels["title"].format(count=report.reservation_count)]
+    for group in report.groups:
+        lines.append(f"{group.date.isoformat()} - {group.city}:")
+        lines.extend(
+            f"  - {describe_reservation(reservation, labels)}: {reservation['cost']} BOB"
+            for reservation in group.reservations
+        )
+    lines.append(labels["total"].format(total=report.total_budget))
+    return "\n".join(lines)
@@ -0,0 +1,152 @@
+import re
+import math
+import asyncio
+import time
+import unicodedata
+from collections import Counter
+import numpy as np
+from llama_index.core.base.base_retriever import BaseRetriever
+from llama_index.core.postprocessor.types import BaseNodePostprocessor
+from llama_index.core.schema import BaseNode, NodeWithScore, QueryBundle
+from ai_assistant.ann import top_k_indices
+
+_TOKEN_RE = re.compile(r"\w+")
+
+
+def tokenize(text: str) -> list[str]:
+    """Lowercase words without accents, so "Potosí" matches "potosi"."""
+    text = unicodedata.normalize("NFKD", text.casefold())
+    text = "".join(char for char in text if not unicodedata.combining(char))
+    return _TOKEN_RE.findall(text)
+
+
+class BM25Index:
+    """
+    In-memory Okapi BM25 keyword index over the text of the nodes.
+    The weight of every (term, node) pair is computed when the index is built,
+    so a search only sums the postings of the query terms.
+    """
+
+    def __init__(self, nodes: list[BaseNode], k1: float = 1.5, b: float = 0.75):
+        self.node_ids = [node.node_id for node in nodes]
+        term_counts = [Counter(tokenize(node.get_content())) for node in nodes]
+        lengths = np.array([sum(counts.values()) for counts in term_counts], dtype=np.float32)
+        average_length = float(lengths.mean()) if lengths.sum() else 1.0
+
+        postings: dict[str, list[tuple[int, int]]] = {}
+        for row, counts in enumerate(term_counts):
+            for term, count in counts.items():
+                postings.setdefault(term, []).append((row, count))
+
+        # term -> (rows, BM25 weight of the term in each row)
+        self._postings: dict[str, tuple[np.ndarray, np.ndarray]] = {}
+        for term, entries in postings.items():
+            rows = np.array([row for row, _ in entries], dtype=np.int64)
+            counts = np.array([count for _, count in entries], dtype=np.float32)
+            idf = math.log(1 + (len(nodes) - len(entries) + 0.5) / (len(entries) + 0.5))
+            norms = counts + k1 * (1 - b + b * lengths[rows] / average_length)
+            self._postings[term] = (rows, idf * counts * (k1 + 1) / norms)
+
+    def search(self, query: str, top_k: int) -> list[tuple[str, float]]:
+        """The ids and scores of the `top_k` best matching nodes, best first."""
+        scores = np.zeros(len(self.node_ids), dtype=np.float32)
+        for term in set(tokenize(query)):
+            posting = self._postings.get(term)
+            if posting is not None:
+                rows, weights = posting
+                scores[rows] += weights
+        return [
+            (self.node_ids[row], float(scores[row]))
+            for row in top_k_indices(scores, top_k)
+            if scores[row] > 0
+        ]
+
+
+def reciprocal_rank_fusion(rankings: list[list[str]], k: int = 60) -> list[tuple[str, float]]:
+    """Merges rankings of node ids, each id scores sum(1 / (k + rank))."""
+    scores: dict[str, float] = {}
+    for ranking in rankings:
+        for rank, node_id in enumerate(ranking, start=1):
+            scores[node_id] = scores.get(node_id, 0.0) + 1 / (k + rank)
+    return sorted(scores.items(), key=lambda item: item[1], reverse=True)
+
+
+class HybridRetriever(BaseRetriever):
+    """
+    Retrieves `candidate_k` nodes with the dense `vector_retriever` and with the
+    keyword `bm25_index`, which catches proper nouns like "Yungas" or hotel names
+    that embeddings miss, merges them with reciprocal rank fusion and returns the
+    best `top_k`.
+
+    An optional `reranker` (e.g. a local cross-encoder) reorders the fused
+    candidates. With a `budget_ms`, only as many candidates as fit in what is
+    left of the budget after retrieval are reranked, estimated from the observed
+    cost per candidate; when nothing fits, the fused order is kept.
+    """
+
+    def __init__(
+        self,
+        vector_retriever: BaseRetriever,
+        bm25_index: BM25Index,
+        docstore,
+        top_k: int = 2,
+        candidate_k: int = 10,
+        reranker: BaseNodePostprocessor | None = None,
+        budget_ms: float | None = None,
+    ):
+        super().__init__()
+        self._vector_retriever = vector_retriever
+        self._bm25_index = bm25_index
+        self._docstore = docstore
+        self._top_k = top_k
+        self._candidate_k = candidate_k
+        self._reranker = reranker
+        self._budget_ms = budget_ms
+        # Moving average of the reranking cost per candidate
+        self._rerank_ms_per_node: float | None = None
+
+    def _fuse(self, query_bundle: QueryBundle, vector_nodes: list[NodeWithScore]) -> list[NodeWithScore]:
+        keyword_hits = self._bm25_index.search(query_bundle.query_str, self._candidate_k)
+        nodes = {node.node.node_id: node.node for node in vector_nodes}
+        fused = reciprocal_rank_fusion(
+            [[node.node.node_id for node in vector_nodes], [node_id for node_id, _ in keyword_hits]]
+        )
+        missing = [node_id for node_id, _ in fused if node_id not in nodes]
+        nodes.update((node.node_id, node) for node in self._docstore.get_nodes(missing))
+        return [NodeWithScore(node=nodes[node_id], score=score) for node_id, score in fused]
+
+    def _rerank_count(self, elapsed_ms: float, candidates: int) -> int:
+        if self._budget_ms is None or self._rerank_ms_per_node is None:
+            return candidates
+        remaining_ms = self._budget_ms - elapsed_ms
+        return max(0, min(candidates, int(remaining_ms / self._rerank_ms_per_node)))
+
+    def _rerank(self, query_bundle: QueryBundle, fused: list[NodeWithScore], start: float) -> list[NodeWithScore]:
+        if self._reranker is None:
+            return fused[:self._top_k]
+
+        count = self._rerank_count((time.perf_counter() - start) * 1000, len(fused))
+        if count < 2:
+            return fused[:self._top_k]
+
+        rerank_start = time.perf_counter()
+        reranked = self._reranker.postprocess_nodes(fused[:count], query_bundle=query_bundle)
+        per_node_ms = (time.perf_counter() - rerank_start) * 1000 / count
+        self._rerank_ms_per_node = (
+            per_node_ms if self._rerank_ms_per_node is None
+            else 0.8 * self._rerank_ms_per_node + 0.2 * per_node_ms
+        )
+        return (reranked + fused[count:])[:self._top_k]
+
+    def _retrieve(self, query_bundle: QueryBundle) -> list[NodeWithScore]:
+        start = time.perf_counter()
+        fused = self._fuse(query_bundle, self._vector_retriever.retrieve(query_bundle))
+        return self._rerank(query_bundle, fused, start)
+
+    async def _aretrieve(self, query_bundle: QueryBundle) -> list[NodeWithScore]:
+        start = time.perf_counter()
+        fused = self._fuse(query_bundle, await self._vector_retriever.aretrieve(query_bundle))
+        if self._reranker is None:
+            return fused[:self._top_k]
+        # The cross-encoder is CPU bound, keep it off the event loop
+        return await asyncio.to_thread(self._rerank, query_bundle, fused, start)
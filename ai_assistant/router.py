@@ -0,0 +1,249 @@
+import re
+import threading
+from typing import Callable, NamedTuple
+import numpy as np
+from pydantic import BaseModel, computed_field
+from ai_assistant.retrievers import tokenize
+from ai_assistant.reports import build_travel_report, format_travel_report
+from ai_assistant.tools import delete_reservations, get_current_date, travel_report
+
+
+def normalize_message(message: str) -> str:
+    """Lowercase words without accents or punctuation, "¿Qué día es hoy?" -> "que dia es hoy"."""
+    return " ".join(tokenize(message))
+
+
+class Intent:
+    """
+    A command that can be answered without the agent. `handler` answers it in
+    the language of the message ("en" or "es"). `patterns` are regular
+    expressions by language that must match the whole normalized message, and
+    `examples` are messages by language for the embedding classifier. Intents
+    that are not `safe_to_guess` (e.g. deleting data) are only answered when a
+    pattern matches.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        handler: Callable[[str], str],
+        patterns: dict[str, list[str]],
+        examples: dict[str, list[str]] | None = None,
+        safe_to_guess: bool = True,
+    ):
+        self.name = name
+        self.handler = handler
+        self.patterns = {
+            language: [re.compile(pattern) for pattern in language_patterns]
+            for language, language_patterns in patterns.items()
+        }
+        self.examples = examples or {}
+        self.safe_to_guess = safe_to_guess
+
+
+class RouteMatch(NamedTuple):
+    intent: Intent
+    language: str
+    confidence: float
+    method: str
+
+
+class RouterStats(BaseModel):
+    messages: int
+    rule_routes: int
+    embedding_routes: int
+
+    @computed_field
+    @property
+    def bypass_rate(self) -> float:
+        routed = self.rule_routes + self.embedding_routes
+        return routed / self.messages if self.messages else 0.0
+
+
+class IntentRouter:
+    """
+    Answers the messages that are plain commands (e.g. "show my reservations")
+    with the tool functions directly, skipping the agent and its LLM calls.
+
+    A message is first matched against the patterns of the `intents`. Otherwise,
+    with an `embed_fn`, it goes to its most similar example: it is routed when
+    the example belongs to a `safe_to_guess` intent, the similarity is at least
+    `threshold`, and it beats the closest example of any other intent, or of the
+    `negative_examples` (messages for the agent), by `margin`. Everything else
+    returns None, for the agent to answer.
+    """
+
+    def __init__(
+        self,
+        intents: list[Intent],
+        embed_fn: Callable[[str], list[float]] | None = None,
+        negative_examples: list[str] | None = None,
+        threshold: float = 0.9,
+        margin: float = 0.02,
+    ):
+        self.intents = intents
+        self.embed_fn = embed_fn
+        self.negative_examples = negative_examples or []
+        self.threshold = threshold
+        self.margin = margin
+        self._examples: tuple[np.ndarray, list[tuple[Intent | None, str]]] | None = None
+        self._lock = threading.Lock()
+        self._messages = 0
+        self._routes = {"rule": 0, "embedding": 0}
+
+    def _embed(self, text: str) -> np.ndarray:
+        embedding = np.asarray(self.embed_fn(text), dtype=np.float32)
+        return embedding / (np.linalg.norm(embedding) or 1.0)
+
+    def _example_embeddings(self) -> tuple[np.ndarray, list[tuple[Intent | None, str]]]:
+        # Embedded on first use, so the embedding model is not loaded on import
+        if self._examples is None:
+            labels, texts = [], []
+            for intent in self.intents:
+                for language, examples in intent.examples.items():
+                    labels.extend((intent, language) for _ in examples)
+                    texts.extend(examples)
+            labels.extend((None, "") for _ in self.negative_examples)
+            texts.extend(self.negative_examples)
+            self._examples = np.stack([self._embed(text) for text in texts]), labels
+        return self._examples
+
+    def _match_rules(self, message: str) -> RouteMatch | None:
+        normalized = normalize_message(message)
+        for intent in self.intents:
+            for language, patterns in intent.patterns.items():
+                if any(pattern.fullmatch(normalized) for pattern in patterns):
+                    return RouteMatch(intent, language, 1.0, "rule")
+        return None
+
+    def _match_embedding(self, message: str) -> RouteMatch | None:
+        if self.embed_fn is None:
+            return None
+        embeddings, labels = self._example_embeddings()
+        similarities = embeddings @ self._embed(message)
+        best = int(np.argmax(similarities))
+        intent, language = labels[best]
+        if intent is None or not intent.safe_to_guess or similarities[best] < self.threshold:
+            return None
+        others = [
+            similarity for similarity, (other, _) in zip(similarities, labels) if other is not intent
+        ]
+        if others and similarities[best] - max(others) < self.margin:
+            return None
+        return RouteMatch(intent, language, float(similarities[best]), "embedding")
+
+    def classify(self, message: str) -> RouteMatch | None:
+        return self._match_rules(message) or self._match_embedding(message)
+
+    def route(self, message: str) -> str | None:
+        """The answer of the intent of the message, None if it is for the agent."""
+        match = self.classify(message)
+        with self._lock:
+            self._messages += 1
+            if match is not None:
+                self._routes[match.method] += 1
+        if match is None:
+            return None
+        print(f"Routed to {match.intent.name} by {match.method} ({match.confidence:.2f})")
+        return match.intent.handler(match.language)
+
+    def stats(self) -> RouterStats:
+        with self._lock:
+            return RouterStats(
+                messages=self._messages,
+                rule_routes=self._routes["rule"],
+                embedding_routes=self._routes["embedding"],
+            )
+
+
+def _show_reservations(language: str) -> str:
+    reservations, _ = travel_report()
+    return format_travel_report(build_travel_report(reservations), language)
+
+
+def _delete_reservations(language: str) -> str:
+    count = len(delete_reservations())
+    return f"Deleted {count} reservations." if language == "en" else f"Se eliminaron {count} reservas."
+
+
+def _current_date(language: str) -> str:
+    today = get_current_date()
+    return f"Today is {today}." if language == "en" else f"Hoy es {today}."
+
+
+def default_intents() -> list[Intent]:
+    """The commands of the travel agent that need no arguments: reservation report, deletion and date."""
+    return [
+        Intent(
+            "show_reservations",
+            _show_reservations,
+            patterns={
+                "en": [
+                    r"(please )?(show|list|display|give|get)( me)? (all )?(of )?(my|the) (saved )?(reservations|bookings|travel report|trip report)( please)?",
+                    r"(what are|what s|whats) my (reservations|bookings)",
+                    r"my (reservations|bookings)",
+                    r"(travel|trip) report",
+                ],
+                "es": [
+                    r"(por favor )?(muestra|muestrame|mostrar|lista|listame|listar|ver|dame)( me)? (todas )?(mis|las) (reservas|reservaciones)( por favor)?",
+                    r"(cuales son|que son) mis (reservas|reservaciones)",
+                    r"mis (reservas|reservaciones)",
+                    r"(reporte|informe) de (viaje|reservas)",
+                ],
+            },
+            examples={
+                "en": ["show my reservations", "what have I booked so far?", "list all my bookings"],
+                "es": ["muestra mis reservas", "¿qué tengo reservado hasta ahora?", "lista todas mis reservaciones"],
+            },
+        ),
+        Intent(
+            "delete_reservations",
+            _delete_reservations,
+            patterns={
+                "en": [
+                    r"(please )?(delete|remove|cancel|clear) (all )?(of )?(my |the )?(saved )?(reservations|bookings)( please)?",
+                ],
+                "es": [
+                    r"(por favor )?(borra|borrar|elimina|eliminar|cancela|cancelar) (todas )?(mis |las )?(reservas|reservaciones)( por favor)?",
+                ],
+            },
+            safe_to_guess=False,
+        ),
+        Intent(
+            "current_date",
+            _current_date,
+            patterns={
+                "en": [
+                    r"(what is|what s|whats) (the )?(date|day)( today)?",
+                    r"(what is|what s|whats) today s date",
+                    r"(what )?day is (it )?today",
+                    r"(tell me )?(the )?today s date",
+                ],
+                "es": [
+                    r"(que|cual es la) (fecha|dia) es hoy",
+                    r"(que|cual es la) fecha de hoy",
+                    r"a que (fecha|dia) estamos( hoy)?",
+                    r"fecha de hoy",
+                ],
+            },
+            examples={
+                "en": ["what's the date today?", "which day is it?", "tell me today's date"],
+                "es": ["¿qué fecha es hoy?", "¿en qué día estamos?", "dime la fecha de hoy"],
+            },
+        ),
+    ]
+
+
+# Messages close to the examples that need the agent, e.g. with filters or arguments
+NEGATIVE_EXAMPLES = [
+    "show my hotel reservations in La Paz",
+    "what reservations do I have next week?",
+    "how much have I spent on flights?",
+    "book a flight from La Paz to Sucre for tomorrow",
+    "what day should I visit the Salar de Uyuni?",
+    "what is the best date to travel to Potosí?",
+    "muestra mis reservas de hotel en Sucre",
+    "¿cuánto cuestan mis vuelos?",
+    "reserva un bus de Oruro a Uyuni para mañana",
+    "¿qué día es mejor para visitar Copacabana?",
+]
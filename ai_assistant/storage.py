@@ -0,0 +1,447 @@
+import os
+import json
+import shutil
+import sqlite3
+import tempfile
+import threading
+from abc import ABC, abstractmethod
+from contextlib import contextmanager, closing
+from datetime import date, datetime
+from ai_assistant.models import (
+    RestaurantReservation,
+    TripReservation,
+    HotelReservation,
+)
+
+JSON_LOG_FORMAT = "json"
+JSONL_LOG_FORMAT = "jsonl"
+
+try:
+    import fcntl
+
+    def _lock_file(file):
+        fcntl.flock(file.fileno(), fcntl.LOCK_EX)
+
+    def _unlock_file(file):
+        fcntl.flock(file.fileno(), fcntl.LOCK_UN)
+
+except ImportError:  # Windows
+    import msvcrt
+
+    def _lock_file(file):
+        file.seek(0)
+        msvcrt.locking(file.fileno(), msvcrt.LK_LOCK, 1)
+
+    def _unlock_file(file):
+        file.seek(0)
+        msvcrt.locking(file.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+_thread_lock = threading.Lock()
+
+
+class CorruptReservationLogError(RuntimeError):
+    """The reservation log on the server can not be parsed, it is left as is to be repaired."""
+
+    def __init__(self, log_file: str):
+        super().__init__(f"The reservation log {log_file} is corrupt")
+        self.log_file = log_file
+
+
+@contextmanager
+def file_lock(lock_path: str):
+    """Exclusive lock held through the file `lock_path`, across processes."""
+    with open(lock_path, "a") as lock_file:
+        _lock_file(lock_file)
+        try:
+            yield
+        finally:
+            _unlock_file(lock_file)
+
+
+@contextmanager
+def log_file_lock(log_file: str):
+    """
+    Exclusive lock over the log file, shared between the threads of this process
+    (FastAPI threadpool) and other processes (uvicorn workers) through a sidecar
+    `.lock` file. It is not reentrant.
+    """
+    with _thread_lock:
+        with file_lock(f"{log_file}.lock"):
+            yield
+
+
+def custom_serializer(obj):
+    if isinstance(obj, (date, datetime)):
+        return obj.isoformat()  # Convert date and datetime to ISO 8601 string
+    raise TypeError(f"Object of type {type(obj)} is not JSON serializable")
+
+
+def reservation_to_dict(
+    reservation: RestaurantReservation | TripReservation | HotelReservation,
+) -> dict:
+    reservation_dict = reservation.model_dump()
+    reservation_dict["reservation_type"] = reservation.__class__.__name__
+    return reservation_dict
+
+
+def reservation_index_fields(reservation_dict: dict) -> tuple[str, str | None, str, str]:
+    """
+    Extracts the fields reservations are searched by.
+    Returns:
+        - tuple: (reservation_type, city, start_date, end_date), with the dates in ISO format.
+          The city of a trip is its destination and a restaurant reservation
+          starts and ends on the day of the reservation.
+    """
+    reservation_type = reservation_dict["reservation_type"]
+    if reservation_type == TripReservation.__name__:
+        city = reservation_dict["destination"]
+        start_date = end_date = str(reservation_dict["date"])
+    elif reservation_type == HotelReservation.__name__:
+        city = reservation_dict["city"]
+        start_date = str(reservation_dict["checkin_date"])
+        end_date = str(reservation_dict["checkout_date"])
+    else:
+        city = reservation_dict["city"]
+        start_date = end_date = str(reservation_dict["reservation_time"])[:10]
+    return reservation_type, city, start_date, end_date
+
+
+def reservation_city_key(city: str | None) -> str | None:
+    """Case insensitive search key of a city, accented letters included ("POTOSÍ" is "potosí")."""
+    return city.casefold() if city is not None else None
+
+
+def is_json_array_log(log_file: str) -> bool:
+    """
+    Checks whether the log file holds the legacy JSON array format.
+    Only the first non-whitespace character is read, so the check is O(1).
+    """
+    if not os.path.exists(log_file):
+        return False
+    with open(log_file, "r") as file:
+        while chunk := file.read(64):
+            stripped = chunk.lstrip()
+            if stripped:
+                return stripped.startswith("[")
+    return False
+
+
+def read_reservations(log_file: str) -> list:
+    if not os.path.exists(log_file) or os.path.getsize(log_file) == 0:
+        return []
+
+    with open(log_file, "r") as file:
+        content = file.read()
+
+    if content.lstrip().startswith("["):
+        # Writes are atomic, so a broken array is real corruption: raise instead
+        # of returning [] and letting the next write wipe the log. Not a
+        # ValueError, the API would report it as a bad request.
+        try:
+            return json.loads(content)
+        except json.JSONDecodeError as error:
+            raise CorruptReservationLogError(log_file) from error
+
+    reservations = []
+    for line in content.splitlines():
+        if not line.strip():
+            continue
+        try:
+            reservations.append(json.loads(line))
+        except json.JSONDecodeError:
+            # A torn last line from an interrupted append, skip it
+            continue
+    return reservations
+
+
+def write_reservations(log_file: str, reservations: list, log_format: str):
+    """
+    Atomically replaces the log file: the data is written to a temporary file in
+    the same directory, flushed to disk and renamed over the log file.
+    """
+    directory = os.path.dirname(os.path.abspath(log_file))
+    fd, tmp_path = tempfile.mkstemp(prefix=".tmp-", dir=directory)
+    try:
+        with os.fdopen(fd, "w") as file:
+            if log_format == JSONL_LOG_FORMAT:
+                for reservation_dict in reservations:
+                    file.write(json.dumps(reservation_dict, default=custom_serializer) + "\n")
+            else:
+                json.dump(reservations, file, indent=4, default=custom_serializer)
+            file.flush()
+            os.fsync(file.fileno())
+        if os.path.exists(log_file):
+            shutil.copymode(log_file, tmp_path)
+        os.replace(tmp_path, log_file)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def append_reservations(log_file: str, reservations: list):
+    lines = "".join(
+        json.dumps(reservation_dict, default=custom_serializer) + "\n"
+        for reservation_dict in reservations
+    )
+    with open(log_file, "ab+") as file:
+        if file.tell() > 0:
+            file.seek(-1, os.SEEK_END)
+            if file.read(1) != b"\n":
+                # Terminate a torn line so it does not swallow the new record
+                lines = "\n" + lines
+        file.write(lines.encode())
+        file.flush()
+        os.fsync(file.fileno())
+
+
+def migrate_reservations(log_file: str) -> int:
+    """
+    Converts a legacy JSON array log file into the append-only JSON Lines format.
+    Returns:
+        - int: The number of migrated reservations.
+    """
+    with log_file_lock(log_file):
+        return _migrate_reservations(log_file)
+
+
+def _migrate_reservations(log_file: str) -> int:
+    reservations = read_reservations(log_file)
+    write_reservations(log_file, reservations, JSONL_LOG_FORMAT)
+    return len(reservations)
+
+
+class ReservationStore(ABC):
+    """
+    Storage backend for the reservations. Reservations are handled as the
+    dictionaries produced by `reservation_to_dict`.
+    Search filters:
+        - reservation_type (str): Class name of the reservation, e.g. "HotelReservation".
+        - city (str): City of the reservation (destination for trips), case insensitive.
+        - start_date, end_date (date): Only reservations overlapping this range.
+    """
+
+    @abstractmethod
+    def save(self, reservations: list[dict]):
+        pass
+
+    @abstractmethod
+    def load(self) -> list[dict]:
+        pass
+
+    @abstractmethod
+    def reset(self):
+        pass
+
+    @abstractmethod
+    def find(
+        self,
+        reservation_type: str | None = None,
+        city: str | None = None,
+        start_date: date | None = None,
+        end_date: date | None = None,
+    ) -> list[dict]:
+        pass
+
+    @abstractmethod
+    def cost_by_type(
+        self,
+        reservation_type: str | None = None,
+        city: str | None = None,
+        start_date: date | None = None,
+        end_date: date | None = None,
+    ) -> dict[str, int]:
+        pass
+
+    def total_cost(self, **filters) -> int:
+        return sum(self.cost_by_type(**filters).values())
+
+
+class JsonReservationStore(ReservationStore):
+    """
+    Reservations kept in a JSON array file, or an append-only JSON Lines file.
+    Searches scan the whole file.
+    """
+
+    def __init__(self, log_file: str, log_format: str = JSON_LOG_FORMAT):
+        self.log_file = log_file
+        self.log_format = log_format
+
+    def save(self, reservations: list[dict]):
+        with log_file_lock(self.log_file):
+            if self.log_format == JSONL_LOG_FORMAT:
+                if is_json_array_log(self.log_file):
+                    _migrate_reservations(self.log_file)
+                append_reservations(self.log_file, reservations)
+            else:
+                saved_reservations = read_reservations(self.log_file)
+                saved_reservations.extend(reservations)
+                write_reservations(self.log_file, saved_reservations, JSON_LOG_FORMAT)
+
+    def load(self) -> list[dict]:
+        return read_reservations(self.log_file)
+
+    def reset(self):
+        with log_file_lock(self.log_file):
+            if os.path.exists(self.log_file):
+                write_reservations(self.log_file, [], self.log_format)
+
+    def find(
+        self,
+        reservation_type: str | None = None,
+        city: str | None = None,
+        start_date: date | None = None,
+        end_date: date | None = None,
+    ) -> list[dict]:
+        found = []
+        for reservation_dict in self.load():
+            res_type, res_city, res_start, res_end = reservation_index_fields(reservation_dict)
+            if reservation_type is not None and res_type != reservation_type:
+                continue
+            if city is not None and reservation_city_key(res_city) != reservation_city_key(city):
+                continue
+            if start_date is not None and res_end < start_date.isoformat():
+                continue
+            if end_date is not None and res_start > end_date.isoformat():
+                continue
+            found.append(reservation_dict)
+        return found
+
+    def cost_by_type(self, **filters) -> dict[str, int]:
+        totals = {}
+        for reservation_dict in self.find(**filters):
+            reservation_type = reservation_dict["reservation_type"]
+            totals[reservation_type] = totals.get(reservation_type, 0) + reservation_dict["cost"]
+        return totals
+
+
+class SqliteReservationStore(ReservationStore):
+    """
+    Reservations kept in a SQLite database, indexed by type, city and dates so
+    searches and cost totals run in SQL. A connection is opened per operation,
+    which keeps the store usable from the FastAPI threadpool and several workers.
+    Cities are searched by `reservation_city_key`, SQLite's NOCASE only folds
+    ASCII letters.
+    """
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        with closing(self._connect()) as connection, connection:
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.executescript(
+                """
+                CREATE TABLE IF NOT EXISTS reservations (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    reservation_type TEXT NOT NULL,
+                    city TEXT,
+                    city_key TEXT,
+                    start_date TEXT NOT NULL,
+                    end_date TEXT NOT NULL,
+                    cost INTEGER NOT NULL,
+                    data TEXT NOT NULL
+                );
+                """
+            )
+            columns = {row[1] for row in connection.execute("PRAGMA table_info(reservations)")}
+            if "city_key" not in columns:
+                # A database created before the column, fill it in
+                connection.execute("ALTER TABLE reservations ADD COLUMN city_key TEXT")
+                connection.executemany(
+                    "UPDATE reservations SET city_key = ? WHERE id = ?",
+                    [
+                        (reservation_city_key(city), row_id)
+                        for row_id, city in connection.execute("SELECT id, city FROM reservations").fetchall()
+                    ],
+                )
+            connection.executescript(
+                """
+                DROP INDEX IF EXISTS ix_reservations_city_date;
+                CREATE INDEX IF NOT EXISTS ix_reservations_type_date
+                    ON reservations (reservation_type, start_date);
+                CREATE INDEX IF NOT EXISTS ix_reservations_city_key_date
+                    ON reservations (city_key, start_date);
+                CREATE INDEX IF NOT EXISTS ix_reservations_dates
+                    ON reservations (start_date, end_date);
+                """
+            )
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.db_path, timeout=30)
+
+    @staticmethod
+    def _where(
+        reservation_type: str | None = None,
+        city: str | None = None,
+        start_date: date | None = None,
+        end_date: date | None = None,
+    ) -> tuple[str, list]:
+        conditions, params = [], []
+        if reservation_type is not None:
+            conditions.append("reservation_type = ?")
+            params.append(reservation_type)
+        if city is not None:
+            conditions.append("city_key = ?")
+            params.append(reservation_city_key(city))
+        if start_date is not None:
+            conditions.append("end_date >= ?")
+            params.append(start_date.isoformat())
+        if end_date is not None:
+            conditions.append("start_date <= ?")
+            params.append(end_date.isoformat())
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        return where, params
+
+    def save(self, reservations: list[dict]):
+        rows = []
+        for reservation_dict in reservations:
+            reservation_type, city, start_date, end_date = reservation_index_fields(reservation_dict)
+            rows.append((
+                reservation_type,
+                city,
+                reservation_city_key(city),
+                start_date,
+                end_date,
+                reservation_dict["cost"],
+                json.dumps(reservation_dict, default=custom_serializer),
+            ))
+        with closing(self._connect()) as connection, connection:
+            connection.executemany(
+                "INSERT INTO reservations "
+                "(reservation_type, city, city_key, start_date, end_date, cost, data) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                rows,
+            )
+
+    def load(self) -> list[dict]:
+        return self.find()
+
+    def reset(self):
+        with closing(self._connect()) as connection, connection:
+            connection.execute("DELETE FROM reservations")
+
+    def find(self, **filters) -> list[dict]:
+        where, params = self._where(**filters)
+        with closing(self._connect()) as connection:
+            rows = connection.execute(
+                f"SELECT data FROM reservations {where} ORDER BY id", params
+            ).fetchall()
+        return [json.loads(data) for (data,) in rows]
+
+    def cost_by_type(self, **filters) -> dict[str, int]:
+        where, params = self._where(**filters)
+        with closing(self._connect()) as connection:
+            rows = connection.execute(
+                f"SELECT reservation_type, SUM(cost) FROM reservations {where} "
+                "GROUP BY reservation_type",
+                params,
+            ).fetchall()
+        return dict(rows)
+
+    def total_cost(self, **filters) -> int:
+        where, params = self._where(**filters)
+        with closing(self._connect()) as connection:
+            (total,) = connection.execute(
+                f"SELECT COALESCE(SUM(cost), 0) FROM reservations {where}", params
+            ).fetchone()
+        return total
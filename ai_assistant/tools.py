@@ -1,7 +1,12 @@
+import os
 from random import randint
+from functools import cache
 from datetime import date, datetime, time
 from llama_index.core.tools import QueryEngineTool, FunctionTool, ToolMetadata
-from ai_assistant.rags import TravelGuideRAG
+from ai_assistant.rags import TravelGuideRAG, LazyQueryEngine, CachedQueryEngine
+from ai_assistant.cache import TTLCache
+from ai_assistant.cards import CityCardStore, format_city_card
+from ai_assistant.compression import ContextCompressor
 from ai_assistant.prompts import travel_guide_qa_tpl, travel_guide_description
 from ai_assistant.config import get_agent_settings
 from ai_assistant.models import (
@@ -9,23 +14,164 @@ from ai_assistant.models import (
     TripType,
     HotelReservation,
     RestaurantReservation,
+    CacheStats,
+    CompressionStats,
+)
+from ai_assistant.utils import (
+    save_reservation,
+    load_reservations,
+    reset_reservations,
+    find_reservations,
+    reservations_total_cost,
 )
-from ai_assistant.utils import save_reservation, load_reservations, reset_reservations
 
 SETTINGS = get_agent_settings()
 
-travel_guide_tool = QueryEngineTool(
-    query_engine=TravelGuideRAG(
+
+context_compressor = (
+    ContextCompressor(token_budget=SETTINGS.context_token_budget)
+    if SETTINGS.context_compression else None
+)
+
+
+@cache
+def _city_card_store(db_path: str) -> CityCardStore:
+    return CityCardStore(db_path)
+
+
+def get_city_card_store() -> CityCardStore | None:
+    """The city card store, None if disabled or the cards are not built yet."""
+    if SETTINGS.city_cards_path is None or not os.path.exists(SETTINGS.city_cards_path):
+        return None
+    return _city_card_store(SETTINGS.city_cards_path)
+
+
+def build_travel_guide_engine():
+    cache = None
+    if SETTINGS.travel_guide_cache_size > 0:
+        cache = TTLCache(max_size=SETTINGS.travel_guide_cache_size, ttl=SETTINGS.travel_guide_cache_ttl)
+    rag = TravelGuideRAG(
         store_path=SETTINGS.travel_guide_store_path,
         data_dir=SETTINGS.travel_guide_data_path,
         qa_prompt_tpl=travel_guide_qa_tpl,
-    ).get_query_engine(),
+        incremental=SETTINGS.travel_guide_incremental_ingest,
+        vector_store_backend=SETTINGS.vector_store_backend,
+        embed_batch_size=SETTINGS.embed_batch_size,
+        embed_workers=SETTINGS.embed_workers,
+        vector_store_kwargs={
+            "ann": SETTINGS.vector_store_ann,
+            "ann_nlist": SETTINGS.vector_store_ann_nlist,
+            "ann_nprobe": SETTINGS.vector_store_ann_nprobe,
+            "ann_min_nodes": SETTINGS.vector_store_ann_min_nodes,
+        },
+        city_card_store=_city_card_store(SETTINGS.city_cards_path) if SETTINGS.city_cards_path else None,
+        city_card_cities=SETTINGS.city_cards_cities,
+    )
+
+    retriever = None
+    if SETTINGS.retrieval_mode == "hybrid":
+        reranker = None
+        if SETTINGS.reranker_model is not None:
+            from llama_index.core.postprocessor import SentenceTransformerRerank
+
+            reranker = SentenceTransformerRerank(
+                model=SETTINGS.reranker_model, top_n=SETTINGS.hybrid_top_k
+            )
+        retriever = rag.hybrid_retriever(
+            top_k=SETTINGS.hybrid_top_k,
+            candidate_k=SETTINGS.hybrid_candidate_k,
+            reranker=reranker,
+            budget_ms=SETTINGS.retrieval_budget_ms,
+        )
+    return rag.get_query_engine(
+        cache=cache,
+        retriever=retriever,
+        node_postprocessors=[context_compressor] if context_compressor is not None else None,
+    )
+
+
+travel_guide_engine = LazyQueryEngine(build_travel_guide_engine)
+
+travel_guide_tool = QueryEngineTool(
+    query_engine=travel_guide_engine,
     metadata=ToolMetadata(
         name="travel_guide", description=travel_guide_description, return_direct=False
     ),
 )
 
 
+def travel_guide_cache_stats() -> CacheStats | None:
+    """Stats of the travel guide answer cache, None if disabled or the RAG is not loaded yet."""
+    engine = travel_guide_engine.engine
+    return engine.stats() if isinstance(engine, CachedQueryEngine) else None
+
+
+def context_compression_stats() -> CompressionStats | None:
+    """Tokens of the travel guide context before and after compression, None if disabled."""
+    return context_compressor.stats() if context_compressor is not None else None
+
+
+# Reservation builders, they validate the input without saving anything
+def build_flight_reservation(date_str: str, departure: str, destination: str) -> TripReservation:
+    flight_date = date.fromisoformat(date_str)
+    if flight_date < date.today():
+        raise ValueError("Invalid flight date. The date cannot be in the past.")
+
+    return TripReservation(
+        trip_type=TripType.flight,
+        departure=departure,
+        destination=destination,
+        date=flight_date,
+        cost=randint(200, 700),
+    )
+
+def build_hotel_reservation(
+    checkin_date_str: str, checkout_date_str: str, hotel_name: str, city: str
+) -> HotelReservation:
+    checkin_date = date.fromisoformat(checkin_date_str)
+    checkout_date = date.fromisoformat(checkout_date_str)
+    if checkin_date < date.today():
+        raise ValueError("Invalid check-in date. The date cannot be in the past.")
+    if checkin_date >= checkout_date:
+        raise ValueError("Invalid check-in and check-out dates. Check-out date should be after check-in date.")
+
+    return HotelReservation(
+        checkin_date=checkin_date,
+        checkout_date=checkout_date,
+        hotel_name=hotel_name,
+        city=city,
+        cost=randint(100, 300),
+    )
+
+def build_bus_reservation(date_str: str, departure: str, destination: str) -> TripReservation:
+    trip_date = date.fromisoformat(date_str)
+    if trip_date < date.today():
+        raise ValueError("Invalid trip date. The date cannot be in the past.")
+
+    return TripReservation(
+        trip_type=TripType.bus,
+        departure=departure,
+        destination=destination,
+        date=trip_date,
+        cost=randint(50, 100),
+    )
+
+def build_restaurant_reservation(
+    reservation_time_str: str, restaurant: str, city: str, dish: str
+) -> RestaurantReservation:
+    reservation_time = datetime.fromisoformat(reservation_time_str)
+    if reservation_time < datetime.now():
+        raise ValueError("Invalid reservation time. The time cannot be in the past.")
+
+    return RestaurantReservation(
+        reservation_time=reservation_time,
+        restaurant=restaurant,
+        city=city,
+        dish=dish,
+        cost=randint(10, 50),
+    )
+
+
 # Tool functions
 def reserve_flight(date_str: str, departure: str, destination: str) -> TripReservation:
     """
@@ -42,22 +188,11 @@ def reserve_flight(date_str: str, departure: str, destination: str) -> TripReser
     Raises:
         - ValueError: If the flight date is in the past.
     """
-    
-    flight_date = date.fromisoformat(date_str)
-    if flight_date < date.today():
-        raise ValueError("Invalid flight date. The date cannot be in the past.")
-    
+    reservation = build_flight_reservation(date_str, departure, destination)
+
     print(
         f"Making flight reservation from {departure} to {destination} on date: {date_str}"
     )
-    reservation = TripReservation(
-        trip_type=TripType.flight,
-        departure=departure,
-        destination=destination,
-        date=flight_date,
-        cost=randint(200, 700),
-    )
-
     save_reservation(reservation)
     return reservation
 
@@ -79,22 +214,9 @@ def reserve_hotel(
     Raises:
         - ValueError: If the check-in date is in the past or the check-out date is before the check-in date.
     """
-    checkin_date = date.fromisoformat(checkin_date_str)
-    checkout_date = date.fromisoformat(checkout_date_str)
-    if checkin_date < date.today():
-        raise ValueError("Invalid check-in date. The date cannot be in the past.")
-    if checkin_date >= checkout_date:
-        raise ValueError("Invalid check-in and check-out dates. Check-out date should be after check-in date.")
-    
-    print(f"Making hotel reservation at {hotel_name} in {city}")
-    reservation = HotelReservation(
-        checkin_date=checkin_date,
-        checkout_date=checkout_date,
-        hotel_name=hotel_name,
-        city=city,
-        cost=randint(100, 300),
-    )
+    reservation = build_hotel_reservation(checkin_date_str, checkout_date_str, hotel_name, city)
 
+    print(f"Making hotel reservation at {hotel_name} in {city}")
     save_reservation(reservation)
     return reservation
 
@@ -113,19 +235,9 @@ def reserve_bus(date_str: str, departure: str, destination: str) -> TripReservat
     Raises:
         - ValueError: If the trip date is in the past.
     """
-    trip_date = date.fromisoformat(date_str)
-    if trip_date < date.today():
-        raise ValueError("Invalid trip date. The date cannot be in the past.")
-    
-    print(f"Making bus reservation from {departure} to {destination} on date: {date_str}")
-    reservation = TripReservation(
-        trip_type=TripType.bus,
-        departure=departure,
-        destination=destination,
-        date=trip_date,
-        cost=randint(50, 100),
-    )
+    reservation = build_bus_reservation(date_str, departure, destination)
 
+    print(f"Making bus reservation from {departure} to {destination} on date: {date_str}")
     save_reservation(reservation)
     return reservation
 
@@ -145,19 +257,9 @@ def reserve_restaurant(
     Returns:
         - RestaurantReservation: The reservation details.
     """
-    reservation_time = datetime.fromisoformat(reservation_time_str)
-    if reservation_time < datetime.now():
-        raise ValueError("Invalid reservation time. The time cannot be in the past.")
-    
-    print(f"Making restaurant reservation at {restaurant} in {city} for {dish} at {reservation_time_str}")
-    reservation = RestaurantReservation(
-        reservation_time=reservation_time,
-        restaurant=restaurant,
-        city=city,
-        dish=dish,
-        cost=randint(10, 50),
-    )
+    reservation = build_restaurant_reservation(reservation_time_str, restaurant, city, dish)
 
+    print(f"Making restaurant reservation at {restaurant} in {city} for {dish} at {reservation_time_str}")
     save_reservation(reservation)
     return reservation
 
@@ -169,6 +271,22 @@ def get_current_date() -> str:
     """
     return date.today().isoformat()
 
+def city_card(city: str) -> str:
+    """
+    This function returns the precomputed summary of a city from the travel guide.
+    Args:
+        - city (str): The name of the city.
+    Returns:
+        - str: The description, places to visit, hotels, activities and transport of the city.
+    Notes:
+        - If there is no summary for the city, use the travel_guide tool instead.
+    """
+    store = get_city_card_store()
+    card = store.get(city) if store is not None else None
+    if card is None:
+        return f"There is no summary for {city}, use the travel_guide tool."
+    return format_city_card(card)
+
 def travel_report() -> tuple[list, int]:
     """
     This function loads the saved reservations from the log file.
@@ -180,10 +298,39 @@ def travel_report() -> tuple[list, int]:
         - The dates and times are in ISO format.
         - The costs are in Bolivianos (BOB).
     """
+    # The total comes from the same read, a reservation saved meanwhile is in neither
     reservations = load_reservations()
     total_cost = sum(reservation["cost"] for reservation in reservations)
     return reservations, total_cost
 
+def search_reservations(
+    reservation_type: str | None = None,
+    city: str | None = None,
+    start_date_str: str | None = None,
+    end_date_str: str | None = None,
+) -> tuple[list, int]:
+    """
+    This function searches the saved reservations matching all the given filters.
+    Args:
+        - reservation_type (str, optional): One of "TripReservation" (flights and buses), "HotelReservation" or "RestaurantReservation".
+        - city (str, optional): The city of the reservation, for flights and buses it is the destination.
+        - start_date_str (str, optional): Only reservations on or after this date, in ISO format.
+        - end_date_str (str, optional): Only reservations on or before this date, in ISO format.
+    Returns:
+        - list: The list of matching reservations.
+        - int: The total cost of the matching reservations.
+    Notes:
+        - A hotel stay matches a date range when any night of the stay falls inside it.
+        - The costs are in Bolivianos (BOB).
+    """
+    filters = dict(
+        reservation_type=reservation_type,
+        city=city,
+        start_date=date.fromisoformat(start_date_str) if start_date_str else None,
+        end_date=date.fromisoformat(end_date_str) if end_date_str else None,
+    )
+    return find_reservations(**filters), reservations_total_cost(**filters)
+
 def delete_reservations():
     """
     This function deletes all saved reservations from the log file.
@@ -199,6 +346,8 @@ flight_tool = FunctionTool.from_defaults(fn=reserve_flight, return_direct=False)
 hotel_tool = FunctionTool.from_defaults(fn=reserve_hotel, return_direct=False)
 bus_tool = FunctionTool.from_defaults(fn=reserve_bus, return_direct=False)
 restaurant_tool = FunctionTool.from_defaults(fn=reserve_restaurant, return_direct=False)
+city_card_tool = FunctionTool.from_defaults(fn=city_card, return_direct=False)
 get_current_date_tool = FunctionTool.from_defaults(fn=get_current_date, return_direct=False)
 travel_report_tool = FunctionTool.from_defaults(fn=travel_report, return_direct=False)
+search_reservations_tool = FunctionTool.from_defaults(fn=search_reservations, return_direct=False)
 delete_reservations_tool = FunctionTool.from_defaults(fn=delete_reservations, return_direct=False)
\ No newline at end of file
@@ -0,0 +1,105 @@
+import threading
+from typing import Sequence
+from llama_index.core.agent.react.types import BaseReasoningStep, ObservationReasoningStep
+from llama_index.core.base.llms.types import ChatMessage
+from llama_index.core.tools import BaseTool
+from llama_index.core.utils import get_tokenizer
+from ai_assistant.models import TranscriptStats
+from ai_assistant.prompt_cache import PrecompiledReActChatFormatter
+
+
+class TranscriptCompactor:
+    """
+    Bounds the ReAct transcript (Thought/Action/Observation steps) sent to the
+    LLM at every step of a task, which otherwise grows with every tool call:
+        - The last `keep_recent` observations are kept whole, the model is
+          reasoning about them.
+        - Older observations (e.g. a whole travel report or travel guide answer
+          already used) are cut to their first `observation_token_limit` tokens.
+        - If the transcript is still over `step_token_budget` tokens, the older
+          observations are left out, oldest first, keeping a note of their size.
+    The thoughts and actions are always kept, so the model knows which tools it
+    already called. Only the prompts are compacted, the task keeps the full
+    steps. The tokens before and after are accumulated in `stats`, the same
+    compactor can be shared by all the agents.
+    """
+
+    def __init__(
+        self,
+        observation_token_limit: int = 256,
+        step_token_budget: int | None = 2000,
+        keep_recent: int = 1,
+    ):
+        self.observation_token_limit = observation_token_limit
+        self.step_token_budget = step_token_budget
+        self.keep_recent = keep_recent
+        self._tokenizer = get_tokenizer()
+        self._lock = threading.Lock()
+        self._steps = 0
+        self._input_tokens = 0
+        self._output_tokens = 0
+
+    def _count_tokens(self, text: str) -> int:
+        return len(self._tokenizer(text))
+
+    def _truncate(self, text: str, tokens: int) -> str:
+        # Longest prefix within the limit, by bisection on the characters
+        low, high = 0, len(text)
+        while low < high:
+            middle = (low + high + 1) // 2
+            if self._count_tokens(text[:middle]) <= self.observation_token_limit:
+                low = middle
+            else:
+                high = middle - 1
+        return f"{text[:low].rstrip()} ... [{tokens - self._count_tokens(text[:low])} tokens omitted]"
+
+    def _compact_observation(self, step: ObservationReasoningStep) -> ObservationReasoningStep:
+        tokens = self._count_tokens(step.observation)
+        if tokens <= self.observation_token_limit:
+            return step
+        return step.model_copy(update={"observation": self._truncate(step.observation, tokens)})
+
+    def compact(self, steps: Sequence[BaseReasoningStep]) -> list[BaseReasoningStep]:
+        observations = [i for i, step in enumerate(steps) if isinstance(step, ObservationReasoningStep)]
+        older = observations[:-self.keep_recent] if self.keep_recent else observations
+        compacted = list(steps)
+        for i in older:
+            compacted[i] = self._compact_observation(compacted[i])
+
+        tokens = [self._count_tokens(step.get_content()) for step in compacted]
+        if self.step_token_budget is not None:
+            for i in older:
+                if sum(tokens) <= self.step_token_budget:
+                    break
+                omitted = self._count_tokens(steps[i].observation)
+                compacted[i] = steps[i].model_copy(update={"observation": f"[{omitted} tokens omitted]"})
+                tokens[i] = self._count_tokens(compacted[i].get_content())
+
+        input_tokens = sum(self._count_tokens(step.get_content()) for step in steps)
+        with self._lock:
+            self._steps += 1
+            self._input_tokens += input_tokens
+            self._output_tokens += sum(tokens)
+        return compacted
+
+    def stats(self) -> TranscriptStats:
+        with self._lock:
+            return TranscriptStats(
+                steps=self._steps,
+                input_tokens=self._input_tokens,
+                output_tokens=self._output_tokens,
+            )
+
+
+class CompactingReActChatFormatter(PrecompiledReActChatFormatter):
+    """ReAct chat formatter that compacts the reasoning steps with `compactor` first."""
+
+    compactor: TranscriptCompactor
+
+    def format(
+        self,
+        tools: Sequence[BaseTool],
+        chat_history: list[ChatMessage],
+        current_reasoning: list[BaseReasoningStep] | None = None,
+    ) -> list[ChatMessage]:
+        return super().format(tools, chat_history, self.compactor.compact(current_reasoning or []))
@@ -1,58 +1,98 @@
-import os
-import json
-from datetime import date, datetime
+from datetime import date
+from functools import cache
 from ai_assistant.models import (
     RestaurantReservation,
     TripReservation,
     HotelReservation,
 )
 from ai_assistant.config import get_agent_settings
+from ai_assistant.storage import (
+    ReservationStore,
+    JsonReservationStore,
+    SqliteReservationStore,
+    reservation_to_dict,
+    migrate_reservations as migrate_log_file,
+)
 
 SETTINGS = get_agent_settings()
 
 
-def custom_serializer(obj):
-    if isinstance(obj, (date, datetime)):
-        return obj.isoformat()  # Convert date and datetime to ISO 8601 string
-    raise TypeError(f"Object of type {type(obj)} is not JSON serializable")
+@cache
+def _sqlite_store(db_path: str) -> SqliteReservationStore:
+    return SqliteReservationStore(db_path)
+
+
+def get_reservation_store() -> ReservationStore:
+    """
+    Returns the reservation store selected by `SETTINGS.reservation_backend`
+    ("json" or "sqlite"). The settings are read on every call.
+    """
+    if SETTINGS.reservation_backend == "sqlite":
+        return _sqlite_store(SETTINGS.reservation_db_path)
+    return JsonReservationStore(SETTINGS.log_file, SETTINGS.log_format)
+
+
+def migrate_reservations(log_file: str | None = None) -> int:
+    """
+    Converts a legacy JSON array log file into the append-only JSON Lines format.
+    Returns:
+        - int: The number of migrated reservations.
+    """
+    return migrate_log_file(log_file or SETTINGS.log_file)
 
 
 def save_reservation(
     reservation: RestaurantReservation | TripReservation | HotelReservation,
 ):
-    reservation_dict = reservation.model_dump()
+    reservation_dict = reservation_to_dict(reservation)
     print(f"saving reservation: {reservation_dict}")
-    reservations = []
-    if os.path.exists(SETTINGS.log_file) and os.path.getsize(SETTINGS.log_file) > 0:
-        with open(SETTINGS.log_file, "r") as file:
-            try:
-                reservations = json.load(file)
-            except json.JSONDecodeError:
-                reservation = []
-    else:
-        reservations = []
-    reservation_dict["reservation_type"] = reservation.__class__.__name__
-    reservations.append(reservation_dict)
+    get_reservation_store().save([reservation_dict])
+    print("saved reservation!")
 
-    with open(SETTINGS.log_file, "w") as file:
-        json.dump(reservations, file, indent=4, default=custom_serializer)
 
-    print(f"saved reservation!")
+def save_reservations(
+    reservations: list[RestaurantReservation | TripReservation | HotelReservation],
+):
+    """
+    Saves several reservations with a single write to the store.
+    """
+    reservation_dicts = [reservation_to_dict(reservation) for reservation in reservations]
+    print(f"saving {len(reservation_dicts)} reservations")
+    get_reservation_store().save(reservation_dicts)
+    print("saved reservations!")
 
 
 def load_reservations() -> list:
-    if os.path.exists(SETTINGS.log_file) and os.path.getsize(SETTINGS.log_file) > 0:
-        with open(SETTINGS.log_file, "r") as file:
-            try:
-                reservations = json.load(file)
-            except json.JSONDecodeError:
-                reservations = []
-    else:
-        reservations = []
-    return reservations
+    return get_reservation_store().load()
+
+
+def find_reservations(
+    reservation_type: str | None = None,
+    city: str | None = None,
+    start_date: date | None = None,
+    end_date: date | None = None,
+) -> list:
+    return get_reservation_store().find(
+        reservation_type=reservation_type,
+        city=city,
+        start_date=start_date,
+        end_date=end_date,
+    )
+
+
+def reservations_total_cost(
+    reservation_type: str | None = None,
+    city: str | None = None,
+    start_date: date | None = None,
+    end_date: date | None = None,
+) -> int:
+    return get_reservation_store().total_cost(
+        reservation_type=reservation_type,
+        city=city,
+        start_date=start_date,
+        end_date=end_date,
+    )
 
 
 def reset_reservations():
-    if os.path.exists(SETTINGS.log_file):
-        with open(SETTINGS.log_file, "w") as file:
-            json.dump([], file)
+    get_reservation_store().reset()
@@ -0,0 +1,274 @@
+import os
+import json
+import tempfile
+from typing import Any, Sequence
+import numpy as np
+from pydantic import PrivateAttr
+from llama_index.core.schema import BaseNode
+from llama_index.core.vector_stores import SimpleVectorStore
+from llama_index.core.vector_stores.types import (
+    BasePydanticVectorStore,
+    VectorStoreQuery,
+    VectorStoreQueryMode,
+    VectorStoreQueryResult,
+)
+from llama_index.core.vector_stores.simple import (
+    DEFAULT_PERSIST_FNAME,
+    DEFAULT_VECTOR_STORE,
+    NAMESPACE_SEP,
+)
+from ai_assistant.ann import IVFIndex, top_k_indices
+
+
+def _atomic_write(path: str, write):
+    """
+    Writes `path` through a temporary file in the same directory renamed over it,
+    so processes that have the old file mapped keep reading a consistent copy.
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(prefix=".tmp-", dir=directory)
+    try:
+        with os.fdopen(fd, "wb") as file:
+            write(file)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def _normalize(embeddings: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(embeddings, axis=-1, keepdims=True)
+    return embeddings / np.where(norms == 0, 1.0, norms)
+
+
+class MmapVectorStore(BasePydanticVectorStore):
+    """
+    Vector store that keeps the embeddings in a contiguous float32 NumPy file.
+
+    The persisted matrix is opened with `mmap_mode="r"`, so loading does not parse
+    anything and the pages are shared by every process that maps the file (e.g.
+    uvicorn workers). Embeddings are stored L2 normalized and the top-k is
+    computed with a single matrix-vector product, which gives the same cosine
+    similarity ranking as `SimpleVectorStore`.
+
+    Files, next to the other stores of the index:
+        - {namespace}__vector_store.npy: The (nodes, dim) float32 matrix.
+        - {namespace}__vector_store.ids.json: The node and ref doc id of every row.
+        - {namespace}__vector_store.ivf.npz: The optional `IVFIndex`.
+    Metadata filters are not supported, the nodes live in the docstore.
+
+    With `ann` enabled, persisting a store of at least `ann_min_nodes` nodes builds
+    an `IVFIndex` with `ann_nlist` lists (default sqrt(nodes)), searched with
+    `ann_nprobe` probes. Until the next persist, a changed store is searched by
+    brute force, as are queries restricted to some nodes or documents.
+    """
+
+    stores_text: bool = False
+    is_embedding_query: bool = True
+    ann: bool = False
+    ann_nlist: int | None = None
+    ann_nprobe: int = 8
+    ann_min_nodes: int = 10000
+
+    _embeddings: np.ndarray = PrivateAttr()
+    _node_ids: list[str] = PrivateAttr()
+    _ref_doc_ids: list[str] = PrivateAttr()
+    _ann_index: IVFIndex | None = PrivateAttr(default=None)
+
+    def __init__(
+        self,
+        embeddings: np.ndarray | None = None,
+        node_ids: list[str] | None = None,
+        ref_doc_ids: list[str] | None = None,
+        **kwargs: Any,
+    ):
+        super().__init__(**kwargs)
+        self._embeddings = (
+            embeddings if embeddings is not None else np.empty((0, 0), dtype=np.float32)
+        )
+        self._node_ids = list(node_ids or [])
+        self._ref_doc_ids = list(ref_doc_ids or [])
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "MmapVectorStore"
+
+    @property
+    def client(self) -> None:
+        return None
+
+    @property
+    def embeddings(self) -> np.ndarray:
+        """The normalized (nodes, dim) embedding matrix, memory mapped once persisted."""
+        return self._embeddings
+
+    @property
+    def node_ids(self) -> list[str]:
+        return self._node_ids
+
+    def add(self, nodes: Sequence[BaseNode], **add_kwargs: Any) -> list[str]:
+        if not nodes:
+            return []
+        new_embeddings = _normalize(
+            np.asarray([node.get_embedding() for node in nodes], dtype=np.float32)
+        )
+        if len(self._node_ids) == 0:
+            self._embeddings = new_embeddings
+        else:
+            # Copies the mapped matrix into memory until the next persist
+            self._embeddings = np.concatenate([self._embeddings, new_embeddings])
+        self._node_ids.extend(node.node_id for node in nodes)
+        self._ref_doc_ids.extend(node.ref_doc_id or "None" for node in nodes)
+        self._ann_index = None
+        return [node.node_id for node in nodes]
+
+    def delete(self, ref_doc_id: str, **delete_kwargs: Any) -> None:
+        keep = np.array([ref_id != ref_doc_id for ref_id in self._ref_doc_ids], dtype=bool)
+        if keep.all():
+            return
+        self._embeddings = self._embeddings[keep]
+        self._node_ids = [node_id for node_id, kept in zip(self._node_ids, keep) if kept]
+        self._ref_doc_ids = [ref_id for ref_id, kept in zip(self._ref_doc_ids, keep) if kept]
+        self._ann_index = None
+
+    def clear(self) -> None:
+        self._embeddings = np.empty((0, 0), dtype=np.float32)
+        self._node_ids = []
+        self._ref_doc_ids = []
+        self._ann_index = None
+
+    @property
+    def ann_index(self) -> IVFIndex | None:
+        return self._ann_index
+
+    def get(self, text_id: str) -> list[float]:
+        return self._embeddings[self._node_ids.index(text_id)].tolist()
+
+    def _candidate_rows(self, query: VectorStoreQuery) -> np.ndarray | None:
+        """Rows allowed by the node and doc id restrictions of the query, None for all."""
+        if query.node_ids is None and query.doc_ids is None:
+            return None
+        node_ids = set(query.node_ids) if query.node_ids is not None else None
+        doc_ids = set(query.doc_ids) if query.doc_ids is not None else None
+        return np.array(
+            [
+                row
+                for row, (node_id, ref_doc_id) in enumerate(zip(self._node_ids, self._ref_doc_ids))
+                if (node_ids is None or node_id in node_ids)
+                and (doc_ids is None or ref_doc_id in doc_ids)
+            ],
+            dtype=np.int64,
+        )
+
+    def query(self, query: VectorStoreQuery, **kwargs: Any) -> VectorStoreQueryResult:
+        if query.filters is not None:
+            raise ValueError("MmapVectorStore does not support metadata filters.")
+        if query.mode != VectorStoreQueryMode.DEFAULT:
+            raise ValueError(f"Invalid query mode: {query.mode}")
+        if len(self._node_ids) == 0:
+            return VectorStoreQueryResult(similarities=[], ids=[])
+
+        query_embedding = _normalize(np.asarray(query.query_embedding, dtype=np.float32))
+        rows = self._candidate_rows(query)
+        if rows is None and self._ann_index is not None:
+            top_rows, top_scores = self._ann_index.search(
+                self._embeddings, query_embedding, query.similarity_top_k
+            )
+        else:
+            embeddings = self._embeddings if rows is None else self._embeddings[rows]
+            scores = embeddings @ query_embedding
+            top = top_k_indices(scores, query.similarity_top_k)
+            top_rows, top_scores = (top if rows is None else rows[top]), scores[top]
+        return VectorStoreQueryResult(
+            similarities=top_scores.tolist(),
+            ids=[self._node_ids[row] for row in top_rows],
+        )
+
+    @staticmethod
+    def _paths(persist_path: str) -> tuple[str, str, str]:
+        base = persist_path[: -len(".json")] if persist_path.endswith(".json") else persist_path
+        return f"{base}.npy", f"{base}.ids.json", f"{base}.ivf.npz"
+
+    def persist(self, persist_path: str, fs: Any = None) -> None:
+        """
+        Writes the matrix, the ids and the ANN index for `persist_path`, the `.json`
+        path the storage context asks for, and maps the new matrix.
+        """
+        if fs is not None:
+            raise ValueError("MmapVectorStore only persists to the local file system.")
+        matrix_path, ids_path, ann_path = self._paths(persist_path)
+        embeddings = np.ascontiguousarray(self._embeddings, dtype=np.float32)
+        _atomic_write(matrix_path, lambda file: np.save(file, embeddings))
+        ids = {"node_ids": self._node_ids, "ref_doc_ids": self._ref_doc_ids}
+        _atomic_write(ids_path, lambda file: file.write(json.dumps(ids).encode()))
+        self._embeddings = np.load(matrix_path, mmap_mode="r")
+
+        if self.ann and len(self._node_ids) >= self.ann_min_nodes:
+            if self._ann_index is None:
+                self._ann_index = IVFIndex.build(
+                    self._embeddings, nlist=self.ann_nlist, nprobe=self.ann_nprobe
+                )
+            _atomic_write(ann_path, self._ann_index.save)
+        elif os.path.exists(ann_path):
+            os.remove(ann_path)
+
+    @classmethod
+    def from_persist_path(cls, persist_path: str, **kwargs: Any) -> "MmapVectorStore":
+        matrix_path, ids_path, ann_path = cls._paths(persist_path)
+        with open(ids_path, "r") as file:
+            ids = json.load(file)
+        embeddings = np.load(matrix_path, mmap_mode="r")
+        vector_store = cls(embeddings, ids["node_ids"], ids["ref_doc_ids"], **kwargs)
+
+        if vector_store.ann and os.path.exists(ann_path):
+            ann_index = IVFIndex.load(ann_path, nprobe=vector_store.ann_nprobe)
+            # An index left by a persist without ANN or built for other rows is ignored
+            if ann_index.num_vectors == len(vector_store._node_ids):
+                vector_store._ann_index = ann_index
+        return vector_store
+
+    @classmethod
+    def from_simple_vector_store(
+        cls, simple_store: SimpleVectorStore, **kwargs: Any
+    ) -> "MmapVectorStore":
+        vector_store = cls(**kwargs)
+        node_ids = list(simple_store.data.embedding_dict)
+        if node_ids:
+            vector_store._embeddings = _normalize(
+                np.asarray(
+                    [simple_store.data.embedding_dict[node_id] for node_id in node_ids],
+                    dtype=np.float32,
+                )
+            )
+            vector_store._node_ids = node_ids
+            vector_store._ref_doc_ids = [
+                simple_store.data.text_id_to_ref_doc_id.get(node_id, "None")
+                for node_id in node_ids
+            ]
+        return vector_store
+
+    @classmethod
+    def from_persist_dir(
+        cls, persist_dir: str, namespace: str = DEFAULT_VECTOR_STORE, **kwargs: Any
+    ) -> "MmapVectorStore":
+        """
+        Loads the store of `namespace` from `persist_dir`. A store persisted in the
+        JSON format of `SimpleVectorStore` is converted once and saved in the
+        binary format, so the next loads map the matrix directly.
+        """
+        persist_path = os.path.join(persist_dir, f"{namespace}{NAMESPACE_SEP}{DEFAULT_PERSIST_FNAME}")
+        matrix_path, _, _ = cls._paths(persist_path)
+        if os.path.exists(matrix_path):
+            return cls.from_persist_path(persist_path, **kwargs)
+        if not os.path.exists(persist_path):
+            raise FileNotFoundError(f"No vector store found in {persist_dir}")
+
+        vector_store = cls.from_simple_vector_store(
+            SimpleVectorStore.from_persist_path(persist_path), **kwargs
+        )
+        vector_store.persist(persist_path)
+        return vector_store
@@ -0,0 +1,116 @@
+"""
+Recall@k and latency of the IVF index against brute-force search.
+
+The vectors are synthetic: normalized points around random cluster centers, with
+the dimension of the e5 embeddings. They are written to a memory-mapped file,
+like `MmapVectorStore` does, so 1M x 768 vectors need ~3GB of disk, not of RAM.
+The `SimpleVectorStore` the travel guide used before is measured up to
+--simple-max-nodes, since it keeps every embedding as a Python list.
+
+    python -m benchmarks.ann_benchmark --sizes 10000 100000 1000000 --nprobe 4 8 16 32
+"""
+import os
+import time
+import argparse
+import tempfile
+import numpy as np
+from llama_index.core.schema import TextNode
+from llama_index.core.vector_stores import SimpleVectorStore
+from llama_index.core.vector_stores.types import VectorStoreQuery
+from ai_assistant.ann import IVFIndex, top_k_indices
+
+
+def make_vectors(path: str, count: int, dim: int, clusters: int, seed: int = 0) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(clusters, dim)).astype(np.float32)
+    vectors = np.lib.format.open_memmap(path, mode="w+", dtype=np.float32, shape=(count, dim))
+    for start in range(0, count, 65536):
+        size = min(65536, count - start)
+        chunk = centers[rng.integers(clusters, size=size)]
+        chunk += 0.5 * rng.normal(size=(size, dim)).astype(np.float32)
+        vectors[start:start + size] = chunk / np.linalg.norm(chunk, axis=1, keepdims=True)
+    vectors.flush()
+    return np.load(path, mmap_mode="r")
+
+
+def make_queries(vectors: np.ndarray, count: int, seed: int = 1) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    queries = vectors[np.sort(rng.choice(len(vectors), size=count, replace=False))]
+    queries = queries + 0.1 * rng.normal(size=queries.shape).astype(np.float32)
+    return queries / np.linalg.norm(queries, axis=1, keepdims=True)
+
+
+def timed(search, queries: np.ndarray) -> tuple[list, np.ndarray]:
+    results, latencies = [], []
+    for query in queries:
+        start = time.perf_counter()
+        results.append(search(query))
+        latencies.append(time.perf_counter() - start)
+    return results, np.array(latencies) * 1000
+
+
+def recall(results: list, exact: list, top_k: int) -> float:
+    return float(np.mean([len(set(found) & set(truth)) / top_k for found, truth in zip(results, exact)]))
+
+
+def report(nodes: int, method: str, results: list, exact: list, latencies: np.ndarray, top_k: int):
+    print(
+        f"{nodes:>9} {method:<22} {recall(results, exact, top_k):>9.3f} "
+        f"{np.percentile(latencies, 50):>9.2f} {np.percentile(latencies, 95):>9.2f}"
+    )
+
+
+def run(size: int, args: argparse.Namespace, directory: str):
+    vectors = make_vectors(
+        os.path.join(directory, f"vectors-{size}.npy"), size, args.dim, clusters=max(16, size // 1000)
+    )
+    queries = make_queries(vectors, args.queries)
+
+    exact, latencies = timed(lambda q: top_k_indices(vectors @ q, args.top_k).tolist(), queries)
+    report(size, "brute force (mmap)", exact, exact, latencies, args.top_k)
+
+    if size <= args.simple_max_nodes:
+        simple_store = SimpleVectorStore()
+        simple_store.add(
+            [TextNode(id_=str(row), text="", embedding=vector.tolist()) for row, vector in enumerate(vectors)]
+        )
+        results, latencies = timed(
+            lambda q: [
+                int(node_id)
+                for node_id in simple_store.query(
+                    VectorStoreQuery(query_embedding=q.tolist(), similarity_top_k=args.top_k)
+                ).ids
+            ],
+            queries,
+        )
+        report(size, "SimpleVectorStore", results, exact, latencies, args.top_k)
+        del simple_store
+
+    start = time.perf_counter()
+    index = IVFIndex.build(vectors, nlist=args.nlist)
+    print(f"{size:>9} IVF build nlist={index.nlist}: {time.perf_counter() - start:.1f}s")
+    for nprobe in args.nprobe:
+        index.nprobe = nprobe
+        results, latencies = timed(lambda q: index.search(vectors, q, args.top_k)[0].tolist(), queries)
+        report(size, f"IVF nprobe={nprobe}", results, exact, latencies, args.top_k)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    parser.add_argument("--dim", type=int, default=768)
+    parser.add_argument("--queries", type=int, default=100)
+    parser.add_argument("--top-k", type=int, default=5)
+    parser.add_argument("--nlist", type=int, default=None, help="Default: sqrt(nodes)")
+    parser.add_argument("--nprobe", type=int, nargs="+", default=[4, 8, 16, 32])
+    parser.add_argument("--simple-max-nodes", type=int, default=10_000)
+    args = parser.parse_args()
+
+    print(f"{'nodes':>9} {'method':<22} {'recall@' + str(args.top_k):>9} {'p50 ms':>9} {'p95 ms':>9}")
+    with tempfile.TemporaryDirectory() as directory:
+        for size in args.sizes:
+            run(size, args, directory)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+"""
+Throughput and memory of the embedding backends of `build_huggingface_embedding`.
+
+Each backend runs in a fresh process, so the peak RSS reported is the one of
+loading the model and embedding the texts with that backend alone. The texts
+are the chunks of the travel guide data directory, or synthetic sentences if
+it is empty. The e5 model is downloaded on first use.
+
+    python -m benchmarks.embedding_benchmark --backends torch torch-int8 onnx
+"""
+import os
+import time
+import argparse
+import resource
+import multiprocessing
+from ai_assistant.config import get_agent_settings
+
+
+def load_texts(data_dir: str, count: int) -> list[str]:
+    texts = []
+    if os.path.isdir(data_dir):
+        from llama_index.core.node_parser import SentenceSplitter
+        from ai_assistant.rags import load_documents
+
+        nodes = SentenceSplitter().get_nodes_from_documents(load_documents(data_dir))
+        texts = [node.get_content() for node in nodes]
+    if not texts:
+        texts = [f"Sentence number {i} about travelling around Bolivia." for i in range(count)]
+    return (texts * (count // len(texts) + 1))[:count]
+
+
+def run_backend(model_name: str, backend: str, onnx_file: str | None, texts: list[str], batch_size: int, queue):
+    from ai_assistant.embeddings import build_huggingface_embedding
+
+    try:
+        start = time.perf_counter()
+        embed_model = build_huggingface_embedding(model_name, backend, onnx_file)
+        embed_model.embed_batch_size = batch_size
+        load_seconds = time.perf_counter() - start
+
+        embed_model.get_text_embedding_batch(texts[:batch_size])  # Warm up
+        start = time.perf_counter()
+        embed_model.get_text_embedding_batch(texts)
+        texts_per_second = len(texts) / (time.perf_counter() - start)
+
+        start = time.perf_counter()
+        for text in texts[:50]:
+            embed_model.get_query_embedding(text)
+        query_ms = (time.perf_counter() - start) / min(50, len(texts)) * 1000
+
+        peak_rss_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+        queue.put((backend, load_seconds, texts_per_second, query_ms, peak_rss_mb, None))
+    except Exception as error:
+        queue.put((backend, 0, 0, 0, 0, f"{type(error).__name__}: {error}"))
+
+
+def main():
+    settings = get_agent_settings()
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--model", default=settings.hf_embeddings_model)
+    parser.add_argument("--backends", nargs="+", default=["torch", "torch-int8", "onnx"])
+    parser.add_argument("--onnx-file", default=None, help="e.g. onnx/model_qint8_avx512_vnni.onnx")
+    parser.add_argument("--data-dir", default=settings.travel_guide_data_path)
+    parser.add_argument("--texts", type=int, default=512)
+    parser.add_argument("--batch-size", type=int, default=32)
+    args = parser.parse_args()
+
+    texts = load_texts(args.data_dir, args.texts)
+    context = multiprocessing.get_context("spawn")
+    print(f"{'backend':<12} {'load s':>8} {'texts/s':>9} {'query ms':>9} {'peak RSS MB':>12}")
+    for backend in args.backends:
+        queue = context.Queue()
+        process = context.Process(
+            target=run_backend,
+            args=(args.model, backend, args.onnx_file, texts, args.batch_size, queue),
+        )
+        process.start()
+        backend, load_seconds, texts_per_second, query_ms, peak_rss_mb, error = queue.get()
+        process.join()
+        if error:
+            print(f"{backend:<12} failed: {error}")
+        else:
+            print(f"{backend:<12} {load_seconds:>8.1f} {texts_per_second:>9.1f} {query_ms:>9.2f} {peak_rss_mb:>12.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,61 @@
+"""
+Throughput and tail latency of concurrent LLM calls with and without the
+`LLMGateway`, against the local mock LLM server, so nothing is sent to OpenAI.
+
+The requests cycle over `--distinct` prompts, like popular recommendation
+requests arriving at the same time, and are sent by `--concurrency` threads.
+
+    python -m benchmarks.llm_gateway_benchmark --requests 400 --distinct 20 --latency-ms 200
+"""
+import time
+import argparse
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+from llama_index.llms.openai import OpenAI
+from ai_assistant.gateway import LLMGateway
+from tests.mock_llm_server import MockLLMServer
+
+
+def run(llm: OpenAI, prompts: list[str], concurrency: int) -> tuple[float, np.ndarray]:
+    def timed(prompt: str) -> float:
+        start = time.perf_counter()
+        llm.complete(prompt)
+        return time.perf_counter() - start
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as executor:
+        latencies = np.array(list(executor.map(timed, prompts))) * 1000
+    return time.perf_counter() - start, latencies
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=400)
+    parser.add_argument("--distinct", type=int, default=20)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--latency-ms", type=float, default=200)
+    parser.add_argument("--batch-windows-ms", type=float, nargs="+", default=[0, 20])
+    args = parser.parse_args()
+
+    prompts = [f"Recommend places to visit in city number {i % args.distinct}" for i in range(args.requests)]
+    print(f"{'client':<18} {'upstream':>9} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}")
+    configurations = [("direct", None)] + [
+        (f"gateway {window:g}ms", window) for window in args.batch_windows_ms
+    ]
+    for name, window in configurations:
+        with MockLLMServer(latency=args.latency_ms / 1000) as server:
+            http_clients = {}
+            if window is not None:
+                gateway = LLMGateway(batch_window_ms=window)
+                http_clients = {"http_client": gateway.client()}
+            llm = OpenAI(model="gpt-4o-mini", api_key="key", api_base=server.url, **http_clients)
+            seconds, latencies = run(llm, prompts, args.concurrency)
+            p50, p95, p99 = np.percentile(latencies, [50, 95, 99])
+            print(
+                f"{name:<18} {len(server.requests):>9} {args.requests / seconds:>8.1f} "
+                f"{p50:>8.1f} {p95:>8.1f} {p99:>8.1f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+"""
+Bypass rate and latency of the `IntentRouter` on a recorded set of chat
+messages, a JSON lines file of {"message": ..., "expected": <intent or null>}.
+
+The messages are only classified, so no reservation is deleted. A bypass is
+wrong when the message gets an intent other than the expected one, e.g. a
+message for the agent answered by a tool. The time saved assumes every bypassed
+message would have taken `--agent-latency-ms` in the agent (a ReAct loop with
+at least two LLM calls). The e5 model is downloaded on first use.
+
+    python -m benchmarks.router_benchmark --agent-latency-ms 2500
+    python -m benchmarks.router_benchmark --rules-only
+"""
+import json
+import time
+import argparse
+import numpy as np
+from ai_assistant.config import get_agent_settings
+from ai_assistant.router import IntentRouter, NEGATIVE_EXAMPLES, default_intents
+
+
+def load_queries(path: str) -> list[dict]:
+    with open(path) as file:
+        return [json.loads(line) for line in file if line.strip()]
+
+
+def main():
+    settings = get_agent_settings()
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--queries", default="benchmarks/data/chat_queries.jsonl")
+    parser.add_argument("--agent-latency-ms", type=float, default=2500)
+    parser.add_argument("--threshold", type=float, default=settings.intent_router_threshold)
+    parser.add_argument("--margin", type=float, default=settings.intent_router_margin)
+    parser.add_argument("--rules-only", action="store_true")
+    args = parser.parse_args()
+
+    embed_fn = None
+    if not args.rules_only:
+        from ai_assistant.rags import get_embed_model
+
+        embed_fn = lambda text: get_embed_model().get_query_embedding(text)
+    router = IntentRouter(
+        default_intents(),
+        embed_fn=embed_fn,
+        negative_examples=NEGATIVE_EXAMPLES,
+        threshold=args.threshold,
+        margin=args.margin,
+    )
+    queries = load_queries(args.queries)
+    # Loads the model and embeds the examples before timing
+    router.classify(queries[0]["message"])
+
+    latencies, routed, wrong, missed = [], {"rule": 0, "embedding": 0}, [], []
+    for query in queries:
+        start = time.perf_counter()
+        match = router.classify(query["message"])
+        latencies.append((time.perf_counter() - start) * 1000)
+        intent = match.intent.name if match is not None else None
+        if match is not None:
+            routed[match.method] += 1
+        if intent is not None and intent != query["expected"]:
+            wrong.append((query["message"], intent))
+        elif intent is None and query["expected"] is not None:
+            missed.append(query["message"])
+
+    bypassed = routed["rule"] + routed["embedding"]
+    commands = sum(query["expected"] is not None for query in queries)
+    p50, p95 = np.percentile(latencies, [50, 95])
+    print(f"messages          {len(queries)} ({commands} commands)")
+    print(f"bypassed          {bypassed} ({bypassed / len(queries):.0%}): {routed['rule']} by rules, {routed['embedding']} by embeddings")
+    print(f"wrong bypasses    {len(wrong)}")
+    print(f"missed commands   {len(missed)}")
+    print(f"router latency    p50 {p50:.2f} ms, p95 {p95:.2f} ms")
+    saved = bypassed * args.agent_latency_ms - sum(latencies)
+    print(f"time saved        {saved / 1000:.1f} s ({saved / len(queries):.0f} ms per message)")
+    for message, intent in wrong:
+        print(f"  wrong: {message!r} -> {intent}")
+    for message in missed:
+        print(f"  missed: {message!r}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,166 @@
+import re
+import json
+import time
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+    # Room for bursts of concurrent connections, the default backlog of 5 drops them
+    request_queue_size = 256
+
+
+def _common_prefix(a: list[str], b: list[str]) -> int:
+    length = 0
+    while length < min(len(a), len(b)) and a[length] == b[length]:
+        length += 1
+    return length
+
+
+class MockLLMServer:
+    """
+    Local OpenAI compatible chat completions server, it answers "Echo: <last message>"
+    after `latency` seconds, or the assistant messages of `script` in order (e.g.
+    with `tool_calls`) for the first non streaming requests. It allows `rate_limit` requests every `rate_window`
+    seconds, reporting what is left in the `x-ratelimit-*` headers, and rejects
+    the rest with a 429. The requests, the rejected ones and the client
+    connections are recorded. The usage counts words as tokens, and reports as
+    cached the longest prefix of the prompt shared with an earlier request, like
+    the provider prompt cache. Streams send it last if `stream_options` asks for it.
+
+        with MockLLMServer(latency=0.1) as server:
+            llm = OpenAI(api_base=server.url, api_key="key")
+    """
+
+    def __init__(
+        self,
+        latency: float = 0.0,
+        rate_limit: int | None = None,
+        rate_window: float = 1.0,
+        script: list[dict] | None = None,
+    ):
+        self.latency = latency
+        self.script = list(script or [])
+        self.rate_limit = rate_limit
+        self.rate_window = rate_window
+        self.requests: list[dict] = []
+        self.rejected = 0
+        self.connections: set[tuple] = set()
+        self._prompts: list[list[str]] = []
+        self._window_start = time.monotonic()
+        self._window_requests = 0
+        self._lock = threading.Lock()
+        self._server = _Server(("127.0.0.1", 0), self._handler())
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address
+        return f"http://{host}:{port}/v1"
+
+    def _admit(self) -> tuple[bool, dict]:
+        if self.rate_limit is None:
+            return True, {}
+        with self._lock:
+            now = time.monotonic()
+            if now - self._window_start >= self.rate_window:
+                self._window_start, self._window_requests = now, 0
+            reset_ms = int((self._window_start + self.rate_window - now) * 1000) + 1
+            admitted = self._window_requests < self.rate_limit
+            if admitted:
+                self._window_requests += 1
+            else:
+                self.rejected += 1
+            return admitted, {
+                "x-ratelimit-limit-requests": str(self.rate_limit),
+                "x-ratelimit-remaining-requests": str(self.rate_limit - self._window_requests),
+                "x-ratelimit-reset-requests": f"{reset_ms}ms",
+                "retry-after-ms": str(reset_ms),
+            }
+
+    def _usage(self, body: dict, answer: str) -> dict:
+        prompt = " ".join(message.get("content") or "" for message in body["messages"]).split()
+        with self._lock:
+            cached = max((_common_prefix(prompt, seen) for seen in self._prompts), default=0)
+            self._prompts.append(prompt)
+        completion_tokens = len(answer.split())
+        return {
+            "prompt_tokens": len(prompt),
+            "completion_tokens": completion_tokens,
+            "total_tokens": len(prompt) + completion_tokens,
+            "prompt_tokens_details": {"cached_tokens": cached},
+        }
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def _send(self, status: int, headers: dict, body: bytes, content_type: str):
+                self.send_response(status)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+                with server._lock:
+                    server.connections.add(self.client_address)
+                admitted, headers = server._admit()
+                if not admitted:
+                    error = {"error": {"message": "Rate limit reached", "type": "requests", "code": "rate_limit_exceeded"}}
+                    self._send(429, headers, json.dumps(error).encode(), "application/json")
+                    return
+
+                with server._lock:
+                    server.requests.append(body)
+                time.sleep(server.latency)
+                answer = f"Echo: {body['messages'][-1]['content']}"
+                if body.get("stream"):
+                    chunks = [
+                        {"choices": [{"index": 0, "delta": {"role": "assistant", "content": word}, "finish_reason": None}]}
+                        for word in re.findall(r"\S+\s*", answer)
+                    ]
+                    if (body.get("stream_options") or {}).get("include_usage"):
+                        chunks.append({"choices": [], "usage": server._usage(body, answer)})
+                    events = "".join(
+                        f"data: {json.dumps({'id': 'mock', 'object': 'chat.completion.chunk', 'created': 0, 'model': body['model'], **chunk})}\n\n"
+                        for chunk in chunks
+                    ) + "data: [DONE]\n\n"
+                    self._send(200, headers, events.encode(), "text/event-stream")
+                    return
+
+                message = {"role": "assistant", "content": answer}
+                with server._lock:
+                    if server.script:
+                        message = {"role": "assistant", "content": None, **server.script.pop(0)}
+                completion = {
+                    "id": "mock",
+                    "object": "chat.completion",
+                    "created": 0,
+                    "model": body["model"],
+                    "choices": [{
+                        "index": 0,
+                        "message": message,
+                        "finish_reason": "tool_calls" if message.get("tool_calls") else "stop",
+                    }],
+                    "usage": server._usage(body, message.get("content") or ""),
+                }
+                self._send(200, headers, json.dumps(completion).encode(), "application/json")
+
+        return Handler
+
+    def __enter__(self) -> "MockLLMServer":
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._server.shutdown()
+        self._server.server_close()
@@ -0,0 +1,37 @@
+import re
+from typing import Any
+from llama_index.core.llms import (
+    CustomLLM,
+    CompletionResponse,
+    CompletionResponseGen,
+    LLMMetadata,
+)
+
+
+class ScriptedLLM(CustomLLM):
+    """
+    LLM that answers with the given responses in order, streaming them word by word.
+    The prompts it receives are kept in `prompts`.
+    """
+
+    responses: list[str]
+    prompts: list[str] = []
+
+    @property
+    def metadata(self) -> LLMMetadata:
+        return LLMMetadata(model_name="scripted")
+
+    def _next_response(self, prompt: str) -> str:
+        self.prompts.append(prompt)
+        return self.responses[min(len(self.prompts), len(self.responses)) - 1]
+
+    def complete(self, prompt: str, formatted: bool = False, **kwargs: Any) -> CompletionResponse:
+        return CompletionResponse(text=self._next_response(prompt))
+
+    def stream_complete(
+        self, prompt: str, formatted: bool = False, **kwargs: Any
+    ) -> CompletionResponseGen:
+        text = ""
+        for delta in re.findall(r"\S+\s*|\s+", self._next_response(prompt)):
+            text += delta
+            yield CompletionResponse(text=text, delta=delta)
@@ -0,0 +1,180 @@
+import json
+import asyncio
+import threading
+import pytest
+from concurrent.futures import ThreadPoolExecutor
+from llama_index.core.agent import AgentRunner, ReActAgent
+from llama_index.core.base.llms.types import ChatMessage
+from llama_index.core.tools import FunctionTool
+from llama_index.llms.openai import OpenAI
+from ai_assistant.agent import (
+    AgentPool,
+    BoundedChatMemory,
+    ParallelToolAgentWorker,
+    astream_agent_events,
+    get_transcript_compactor,
+)
+from ai_assistant.transcript import CompactingReActChatFormatter
+from tests.mock_llm_server import MockLLMServer
+from tests.scripted_llm import ScriptedLLM
+
+
+def get_current_date() -> str:
+    """Returns the current date in ISO format."""
+    return "2026-10-18"
+
+
+def collect_events(agent: ReActAgent, prompt: str) -> list[tuple[str, str]]:
+    async def collect():
+        return [event async for event in astream_agent_events(agent, prompt)]
+
+    return asyncio.run(collect())
+
+
+def test_stream_agent_events():
+    llm = ScriptedLLM(responses=[
+        "Thought: I need the date.\nAction: get_current_date\nAction Input: {}",
+        "Thought: I can answer without using any more tools.\nAnswer: Today is 2026-10-18.",
+    ])
+    agent = ReActAgent.from_tools([FunctionTool.from_defaults(get_current_date)], llm=llm)
+
+    events = collect_events(agent, "What day is it?")
+
+    steps = [content for event, content in events if event == "step"]
+    tokens = [content for event, content in events if event == "token"]
+    assert steps[0].startswith("Thought: I need the date.")
+    assert steps[1] == "Observation: 2026-10-18"
+    assert len(tokens) > 1
+    assert "".join(tokens) == "Today is 2026-10-18."
+    # the answer is kept in the agent memory
+    assert agent.memory.get_all()[-1].content == "Today is 2026-10-18."
+
+
+@pytest.fixture
+def scripted_llm(mocker):
+    llm = ScriptedLLM(responses=["Thought: I can answer without using any more tools.\nAnswer: Hola"])
+    mocker.patch("ai_assistant.agent.get_llm", return_value=llm)
+    return llm
+
+
+def test_agent_pool_keeps_one_agent_per_session(scripted_llm):
+    pool = AgentPool(max_sessions=10)
+    agent_a = pool.get("a")
+    agent_b = pool.get("b")
+
+    assert pool.get("a") is agent_a
+    assert agent_a is not agent_b
+    assert agent_a.memory is not agent_b.memory
+    assert pool.get(None) is not pool.get(None)
+    assert len(pool) == 2
+
+    agent_a.chat("Hola")
+    assert len(agent_a.memory.get_all()) == 2
+    assert agent_b.memory.get_all() == []
+
+
+def test_agent_pool_evicts_sessions(scripted_llm):
+    pool = AgentPool(max_sessions=2)
+    agent_a = pool.get("a")
+    pool.get("b")
+    pool.get("a")
+    pool.get("c")
+
+    assert len(pool) == 2
+    assert pool.get("a") is agent_a
+    assert len(pool) == 2
+
+    pool.idle_timeout = 0
+    assert pool.evict_idle() == 2
+    assert len(pool) == 0
+
+
+def test_bounded_chat_memory_drops_old_messages():
+    memory = BoundedChatMemory.from_defaults(token_limit=50)
+    for i in range(100):
+        memory.put(ChatMessage(role="user", content=f"message number {i}"))
+
+    stored = memory.get_all()
+    assert 1 < len(stored) < 20
+    assert stored[-1].content == "message number 99"
+
+    memory.set([ChatMessage(role="user", content=f"message {i}") for i in range(100)])
+    assert len(memory.get_all()) < 20
+
+
+def tool_call(call_id: str, name: str, arguments: dict) -> dict:
+    return {"id": call_id, "type": "function", "function": {"name": name, "arguments": json.dumps(arguments)}}
+
+
+def test_parallel_tool_agent_runs_the_tools_of_a_step_concurrently():
+    threads = []
+    # Only released when the three calls are running at the same time
+    barrier = threading.Barrier(3, timeout=5)
+
+    def reserve(city: str) -> str:
+        """Reserves a hotel in the city."""
+        threads.append(threading.current_thread().name)
+        barrier.wait()
+        return f"Reserved in {city}"
+
+    script = [
+        {"tool_calls": [tool_call(f"call_{i}", "reserve", {"city": city}) for i, city in enumerate(["Tarija", "Sucre", "Uyuni"])]},
+        {"content": "All booked."},
+    ]
+    with MockLLMServer(script=script) as server:
+        llm = OpenAI(model="gpt-4o-mini", api_key="key", api_base=server.url, max_retries=0)
+        worker = ParallelToolAgentWorker.from_tools(
+            [FunctionTool.from_defaults(reserve)], llm=llm, executor=ThreadPoolExecutor(4)
+        )
+        agent = AgentRunner(worker)
+        response = agent.chat("Book hotels in Tarija, Sucre and Uyuni")
+
+    assert str(response) == "All booked."
+    assert len(set(threads)) == 3
+    # One request for the tool calls and one with all their results
+    assert len(server.requests) == 2
+    tool_messages = [message for message in server.requests[1]["messages"] if message["role"] == "tool"]
+    assert [message["tool_call_id"] for message in tool_messages] == ["call_0", "call_1", "call_2"]
+    assert [message["content"] for message in tool_messages] == [
+        "Reserved in Tarija", "Reserved in Sucre", "Reserved in Uyuni"
+    ]
+
+
+def test_parallel_tool_agent_async():
+    barrier = threading.Barrier(3, timeout=5)
+
+    def reserve(city: str) -> str:
+        """Reserves a hotel in the city."""
+        barrier.wait()
+        return f"Reserved in {city}"
+
+    script = [
+        {"tool_calls": [tool_call(f"call_{i}", "reserve", {"city": city}) for i, city in enumerate(["Tarija", "Sucre", "Uyuni"])]},
+        {"content": "Done."},
+    ]
+    with MockLLMServer(script=script) as server:
+        llm = OpenAI(model="gpt-4o-mini", api_key="key", api_base=server.url, max_retries=0)
+        agent = AgentRunner(ParallelToolAgentWorker.from_tools(
+            [FunctionTool.from_defaults(reserve)], llm=llm, executor=ThreadPoolExecutor(4)
+        ))
+        response = asyncio.run(agent.achat("Book hotels in Tarija, Sucre and Uyuni"))
+
+    assert str(response) == "Done."
+    # A call that ran alone would have timed out on the barrier and reported the error
+    tool_messages = [message for message in server.requests[1]["messages"] if message["role"] == "tool"]
+    assert [message["content"] for message in tool_messages] == [
+        "Reserved in Tarija", "Reserved in Sucre", "Reserved in Uyuni"
+    ]
+
+
+def test_unknown_agent_mode():
+    with pytest.raises(ValueError):
+        AgentPool(mode="plan_and_execute").new_agent()
+
+
+def test_react_agent_compacts_its_transcript(scripted_llm):
+    agent = AgentPool().get()
+
+    formatter = agent.agent_worker._react_chat_formatter
+    assert isinstance(formatter, CompactingReActChatFormatter)
+    assert formatter.compactor is get_transcript_compactor()
@@ -0,0 +1,64 @@
+import numpy as np
+import pytest
+from llama_index.core.schema import TextNode
+from llama_index.core.vector_stores.types import VectorStoreQuery
+from ai_assistant.ann import IVFIndex
+from ai_assistant.vector_stores import MmapVectorStore
+
+
+def clustered_vectors(count: int, dim: int = 32, clusters: int = 20, seed: int = 0) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(clusters, dim))
+    vectors = centers[rng.integers(clusters, size=count)] + 0.3 * rng.normal(size=(count, dim))
+    vectors = vectors.astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def brute_force(vectors: np.ndarray, query: np.ndarray, top_k: int) -> set[int]:
+    return set(np.argsort(-(vectors @ query))[:top_k].tolist())
+
+
+@pytest.fixture
+def vectors():
+    return clustered_vectors(3000)
+
+
+def test_every_vector_is_in_one_list(vectors):
+    index = IVFIndex.build(vectors, nlist=16)
+    assert index.nlist == 16
+    assert sorted(index.order.tolist()) == list(range(len(vectors)))
+    assert index.offsets[-1] == len(vectors)
+
+
+def test_recall(vectors):
+    queries = clustered_vectors(50, seed=1)
+    index = IVFIndex.build(vectors, nlist=32, nprobe=32)
+    for query in queries[:5]:
+        rows, _ = index.search(vectors, query, 10)
+        assert set(rows.tolist()) == brute_force(vectors, query, 10)
+
+    index.nprobe = 4
+    recall = np.mean([
+        len(set(index.search(vectors, query, 10)[0].tolist()) & brute_force(vectors, query, 10)) / 10
+        for query in queries
+    ])
+    assert recall >= 0.9
+
+
+def test_store_persists_and_invalidates_the_index(vectors, tmp_path):
+    persist_path = str(tmp_path / "default__vector_store.json")
+    nodes = [TextNode(id_=f"node-{i}", text="", embedding=vector.tolist()) for i, vector in enumerate(vectors)]
+    vector_store = MmapVectorStore(ann=True, ann_nlist=16, ann_min_nodes=1000)
+    vector_store.add(nodes)
+    vector_store.persist(persist_path)
+    assert (tmp_path / "default__vector_store.ivf.npz").exists()
+
+    loaded = MmapVectorStore.from_persist_path(persist_path, ann=True, ann_nprobe=16)
+    assert loaded.ann_index is not None and loaded.ann_index.nprobe == 16
+    result = loaded.query(VectorStoreQuery(query_embedding=vectors[42].tolist(), similarity_top_k=3))
+    assert result.ids[0] == "node-42"
+
+    # Without ANN the index file is ignored, and a changed store searches by brute force
+    assert MmapVectorStore.from_persist_path(persist_path).ann_index is None
+    loaded.delete("None")
+    assert loaded.ann_index is None
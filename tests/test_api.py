@@ -1,6 +1,25 @@
+import json
+import time
+import asyncio
+import threading
+import httpx
 import pytest
 from fastapi.testclient import TestClient
-from ai_assistant.api import app, get_agent
+from ai_assistant.api import (
+    app,
+    get_agent,
+    get_response_cache,
+    get_agent_limiter,
+    recommendation_prompt,
+    report_prompt,
+)
+from ai_assistant.cache import ResponseCache
+from ai_assistant.cards import CityCardStore
+from ai_assistant.models import CityCard
+from ai_assistant.reports import build_travel_report
+from ai_assistant.tools import get_city_card_store
+from ai_assistant.concurrency import ConcurrencyLimiter
+from ai_assistant.utils import load_reservations
 
 client = TestClient(app)
 
@@ -8,6 +27,9 @@ def get_mocked_agent():
     class MockedAgent:
         def query(self, prompt):
             return "Mocked agent response"
+
+        async def aquery(self, prompt):
+            return "Mocked agent response"
     return MockedAgent()
 
 app.dependency_overrides[get_agent] = get_mocked_agent
@@ -23,4 +45,284 @@ def test_get_recommendations(path, city, notes):
     body = response.json() 
     assert body.get("status") == "OK"
     assert body.get("message") == "Recommendations obtained successfully"
-    assert body.get("agent_response") == "Mocked agent response"
\ No newline at end of file
+    assert body.get("agent_response") == "Mocked agent response"
+
+@pytest.fixture
+def log_file(mocker, tmp_path):
+    mocker.patch("ai_assistant.utils.SETTINGS.log_file", str(tmp_path / "trip.json"))
+    mocker.patch("ai_assistant.utils.SETTINGS.log_format", "json")
+    mocker.patch("ai_assistant.utils.SETTINGS.reservation_backend", "json")
+
+
+def test_batch_reservation(log_file):
+    items = [
+        {"reservation_type": "TripReservation", "trip_type": "FLIGHT", "date": "2030-12-01", "departure": "La Paz", "destination": "Tarija"},
+        {"reservation_type": "HotelReservation", "checkin_date": "2030-12-01", "checkout_date": "2030-12-03", "hotel_name": "Hotel Los Parrales", "city": "Tarija"},
+        {"reservation_type": "RestaurantReservation", "reservation_time": "2030-12-01T20:00:00", "restaurant": "La Casa del Vino", "city": "Tarija", "dish": "pique"},
+        {"reservation_type": "TripReservation", "trip_type": "BUS", "date": "2030-12-03", "departure": "Tarija", "destination": "Potosi"},
+    ]
+    response = client.post("/reservations/batch", json=items)
+
+    assert response.status_code == 200
+    body = response.json()
+    assert body.get("status") == "OK"
+    assert [result["status"] for result in body["results"]] == ["OK"] * 4
+    assert body["results"][3]["reservation"]["trip_type"] == "BUS"
+
+    reservations = load_reservations()
+    assert [reservation["reservation_type"] for reservation in reservations] == [
+        "TripReservation", "HotelReservation", "RestaurantReservation", "TripReservation"
+    ]
+
+
+def test_batch_reservation_is_all_or_nothing(log_file):
+    items = [
+        {"reservation_type": "TripReservation", "trip_type": "FLIGHT", "date": "2030-12-01", "departure": "La Paz", "destination": "Tarija"},
+        {"reservation_type": "HotelReservation", "checkin_date": "2030-12-03", "checkout_date": "2030-12-01", "hotel_name": "Hotel A", "city": "Tarija"},
+        {"reservation_type": "TripReservation", "trip_type": "BUS", "date": "2020-12-03", "departure": "Tarija", "destination": "Potosi"},
+    ]
+    response = client.post("/reservations/batch", json=items)
+
+    assert response.status_code == 400
+    results = response.json()["detail"]["results"]
+    assert [result["status"] for result in results] == ["OK", "ERROR", "ERROR"]
+    assert "Check-out date" in results[1]["error"]
+    assert load_reservations() == []
+
+
+def test_corrupt_reservation_log_is_a_server_error(log_file, tmp_path):
+    (tmp_path / "trip.json").write_text('[{"cost": 1}, {"co')
+    response = TestClient(app, raise_server_exceptions=False).post(
+        "/reservations/flight", params={"date": "2030-12-01", "departure": "La Paz", "destination": "Tarija"}
+    )
+
+    assert response.status_code == 500
+    assert (tmp_path / "trip.json").read_text() == '[{"cost": 1}, {"co'
+
+
+def test_empty_batch_reservation_is_rejected(log_file, mocker):
+    save_reservations = mocker.patch("ai_assistant.api.save_reservations")
+    response = client.post("/reservations/batch", json=[])
+
+    assert response.status_code == 400
+    assert response.json()["detail"] == "The batch has no reservations"
+    save_reservations.assert_not_called()
+
+
+def test_readiness_while_loading(mocker):
+    mocker.patch("ai_assistant.api.travel_guide_engine._engine", None)
+    response = client.get("/health/ready")
+
+    assert response.status_code == 503
+    assert response.json().get("rag_ready") is False
+
+
+def test_readiness_when_ready(mocker):
+    mocker.patch("ai_assistant.api.travel_guide_engine._engine", object())
+    response = client.get("/health/ready")
+
+    assert response.status_code == 200
+    assert response.json().get("rag_ready") is True
+
+
+def test_recommendations_are_cached():
+    calls = []
+
+    class CountingAgent:
+        async def aquery(self, prompt):
+            calls.append(prompt)
+            return f"Response {len(calls)}"
+
+    response_cache = ResponseCache()
+    app.dependency_overrides[get_agent] = CountingAgent
+    app.dependency_overrides[get_response_cache] = lambda: response_cache
+    try:
+        params = {"city": "La Paz", "notes": ["I like museums"]}
+        first = client.get("/recommendations/places", params=params).json()
+        second = client.get("/recommendations/places", params=params).json()
+        bypassed = client.get("/recommendations/places", params={**params, "no_cache": True}).json()
+        stats = client.get("/cache/stats").json()["stats"]
+    finally:
+        app.dependency_overrides[get_agent] = get_mocked_agent
+        del app.dependency_overrides[get_response_cache]
+
+    assert first["agent_response"] == second["agent_response"] == "Response 1"
+    assert bypassed["agent_response"] == "Response 2"
+    assert len(calls) == 2
+    assert stats["hits"] == 1 and stats["misses"] == 1
+
+
+def test_agent_overload_returns_503():
+    limiter = ConcurrencyLimiter(max_concurrency=1, max_waiting=0)
+
+    async def request_while_busy():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as async_client:
+            # The test holds the only slot
+            async with limiter.acquire():
+                return await async_client.get("/recommendations/places", params={"city": "Sucre", "no_cache": True})
+
+    app.dependency_overrides[get_agent_limiter] = lambda: limiter
+    try:
+        response = asyncio.run(request_while_busy())
+    finally:
+        del app.dependency_overrides[get_agent_limiter]
+
+    assert response.status_code == 503
+    assert response.headers.get("retry-after") == "5"
+    assert limiter.rejected == 1
+
+
+def test_concurrent_recommendations_do_not_block():
+    class SlowAgent:
+        async def aquery(self, prompt):
+            await asyncio.sleep(0.2)
+            return "Slow response"
+
+    async def send_requests(requests: int):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as async_client:
+            return await asyncio.gather(*(
+                async_client.get("/recommendations/hotels", params={"city": f"City {i}", "no_cache": True})
+                for i in range(requests)
+            ))
+
+    app.dependency_overrides[get_agent] = SlowAgent
+    app.dependency_overrides[get_agent_limiter] = lambda: ConcurrencyLimiter(max_concurrency=500, max_waiting=0)
+    try:
+        start = time.perf_counter()
+        responses = asyncio.run(send_requests(300))
+        elapsed = time.perf_counter() - start
+    finally:
+        app.dependency_overrides[get_agent] = get_mocked_agent
+        del app.dependency_overrides[get_agent_limiter]
+
+    assert all(response.status_code == 200 for response in responses)
+    # Sequentially these requests would take 60 seconds
+    assert elapsed < 5
+
+
+async def fake_agent_events(agent, prompt):
+    yield "step", "Thought: I need to use a tool."
+    yield "token", "Mocked "
+    yield "token", "stream"
+
+
+@pytest.mark.parametrize("path, params", [
+    ("/recommendations/cities/stream", {"notes": ["I like museums"]}),
+    ("/recommendations/places/stream", {"city": "Sucre"}),
+    ("/reservations/stream", {}),
+])
+def test_streaming_endpoints(path, params, mocker):
+    mocker.patch("ai_assistant.api.astream_agent_events", fake_agent_events)
+    app.dependency_overrides[get_response_cache] = ResponseCache
+    try:
+        response = client.get(path, params={**params, "no_cache": True})
+    finally:
+        del app.dependency_overrides[get_response_cache]
+
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/event-stream")
+    events = [block.split("\n") for block in response.text.strip().split("\n\n")]
+    assert [lines[0] for lines in events] == [
+        "event: step", "event: token", "event: token", "event: done"
+    ]
+    assert json.loads(events[2][1].removeprefix("data: ")) == {"content": "stream"}
+
+
+def test_streaming_uses_the_response_cache(mocker):
+    mocker.patch("ai_assistant.api.astream_agent_events", fake_agent_events)
+    response_cache = ResponseCache()
+    app.dependency_overrides[get_response_cache] = lambda: response_cache
+    try:
+        params = {"city": "Potosi"}
+        client.get("/recommendations/hotels/stream", params=params)
+        cached = client.get("/recommendations/hotels/stream", params=params)
+        regular = client.get("/recommendations/hotels", params=params).json()
+    finally:
+        del app.dependency_overrides[get_response_cache]
+
+    assert cached.text.startswith('event: token\ndata: {"content": "Mocked stream"}')
+    assert regular["agent_response"] == "Mocked stream"
+
+
+def test_structured_travel_report(log_file):
+    client.post("/reservations/flight", params={"date": "2030-12-01", "departure": "La Paz", "destination": "Tarija"})
+    client.post("/reservations/hotel", params={"chekin_date": "2030-12-01", "chekout_date": "2030-12-03", "hotel_name": "Hotel A", "city": "Tarija"})
+
+    response = client.get("/reservations/report")
+
+    assert response.status_code == 200
+    report = response.json()["report"]
+    assert report["reservation_count"] == 2
+    assert [group["city"] for group in report["groups"]] == ["Tarija"]
+    assert report["total_budget"] == report["subtotals"]["flights"] + report["subtotals"]["hotels"]
+
+
+def test_travel_report_sends_the_summary_to_the_agent(log_file):
+    prompts = []
+
+    class RecordingAgent:
+        async def aquery(self, prompt):
+            prompts.append(prompt)
+            return "Report"
+
+    client.post("/reservations/bus", params={"date": "2030-12-01", "departure": "Sucre", "destination": "Potosi"})
+    app.dependency_overrides[get_agent] = RecordingAgent
+    try:
+        response = client.get("/reservations", params={"notes": ["En español"]})
+    finally:
+        app.dependency_overrides[get_agent] = get_mocked_agent
+
+    body = response.json()
+    assert body["agent_response"] == "Report"
+    assert body["report"]["reservation_count"] == 1
+    assert '"destination":"Potosi"' in prompts[0]
+
+
+def test_recommendations_use_the_city_card(tmp_path):
+    prompts = []
+    loop_threads, lookup_threads = set(), set()
+
+    class RecordingAgent:
+        async def aquery(self, prompt):
+            loop_threads.add(threading.get_ident())
+            prompts.append(prompt)
+            return "Recommendations"
+
+    class RecordingCityCardStore(CityCardStore):
+        def get(self, city):
+            lookup_threads.add(threading.get_ident())
+            return super().get(city)
+
+    city_cards = RecordingCityCardStore(str(tmp_path / "cards.db"))
+    city_cards.replace([CityCard(city="Sucre", description="Constitutional capital", hotels=["Hotel Parador"])], "v1")
+    app.dependency_overrides[get_agent] = RecordingAgent
+    app.dependency_overrides[get_city_card_store] = lambda: city_cards
+    try:
+        client.get("/recommendations/hotels", params={"city": "sucre", "no_cache": True})
+        client.get("/recommendations/hotels", params={"city": "Oruro", "no_cache": True})
+    finally:
+        app.dependency_overrides[get_agent] = get_mocked_agent
+        del app.dependency_overrides[get_city_card_store]
+
+    assert "- Hotels: Hotel Parador" in prompts[0]
+    assert "Sucre: Constitutional capital" in prompts[0]
+    assert "summary of 'Oruro'" not in prompts[1]
+    # The SQLite lookups do not block the event loop
+    assert lookup_threads and not lookup_threads & loop_threads
+
+
+def test_request_data_goes_after_the_instructions():
+    prompts = [
+        recommendation_prompt("hotels", "Sucre", ["cheap"]),
+        recommendation_prompt("places", "Tarija", ["con niños"]),
+        report_prompt(["in Spanish"], build_travel_report([])),
+        report_prompt([], build_travel_report([])),
+    ]
+
+    # The instructions are a prefix shared by every request of the endpoint
+    for first, second in [prompts[:2], prompts[2:]]:
+        instructions = first[:first.index("## Request")]
+        assert second.startswith(instructions)
+    assert prompts[0].endswith("Notes:\n- cheap\n")
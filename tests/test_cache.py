@@ -0,0 +1,64 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+from ai_assistant.cache import TTLCache, ResponseCache
+
+
+def test_ttl_cache_evicts_least_recently_used():
+    cache = TTLCache(max_size=2)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    assert cache.get("a") == 1
+    cache.set("c", 3)
+
+    assert cache.get("b") is None
+    assert cache.get("a") == 1
+    assert cache.get("c") == 3
+    assert cache.evictions == 1
+
+
+def test_ttl_cache_expires_entries():
+    cache = TTLCache(max_size=2, ttl=0.05)
+    cache.set("a", 1)
+    assert cache.get("a") == 1
+    time.sleep(0.1)
+
+    assert cache.get("a") is None
+    assert cache.expirations == 1
+
+
+def test_response_cache_normalizes_prompt():
+    cache = ResponseCache()
+    cache.set("Recommend   places in\n La Paz", "response")
+
+    assert cache.get("recommend places in la paz") == "response"
+    assert cache.get("recommend places in Sucre") is None
+    stats = cache.stats()
+    assert (stats.hits, stats.misses, stats.hit_rate) == (1, 1, 0.5)
+
+
+def test_response_cache_semantic_tier():
+    vectors = {
+        "la paz": [1.0, 0.0, 0.0],
+        "la paz bolivia": [0.99, 0.1, 0.0],
+        "sucre": [0.0, 1.0, 0.0],
+    }
+    cache = ResponseCache(embed_fn=lambda text: vectors[text], similarity_threshold=0.9)
+    cache.set("prompt about La Paz", "la paz response", scope="places", query="La Paz")
+
+    assert cache.get("prompt about La Paz, Bolivia", scope="places", query="La Paz Bolivia") == "la paz response"
+    assert cache.get("prompt about La Paz, Bolivia", scope="hotels", query="La Paz Bolivia") is None
+    assert cache.get("prompt about Sucre", scope="places", query="Sucre") is None
+    stats = cache.stats()
+    assert (stats.hits, stats.semantic_hits, stats.misses) == (0, 1, 2)
+
+
+def test_response_cache_counts_concurrent_lookups():
+    cache = ResponseCache()
+    cache.set("Hotels in Sucre", "Parador Santa María")
+
+    prompts = ["Hotels in Sucre", "Hotels in Tarija"] * 2000
+    with ThreadPoolExecutor(8) as executor:
+        list(executor.map(cache.get, prompts))
+
+    stats = cache.stats()
+    assert (stats.hits, stats.misses) == (2000, 2000)
@@ -0,0 +1,74 @@
+import json
+from llama_index.core.schema import TextNode
+from ai_assistant.cards import CityCardStore, build_city_cards, city_key, format_city_card
+from ai_assistant.models import CityCard
+from tests.scripted_llm import ScriptedLLM
+
+NODES = [
+    TextNode(id_="la-paz", text="La Paz is the seat of government. Take the cable car to El Alto."),
+    TextNode(id_="hotels", text="In La Paz, Hotel Rosario is near the San Francisco church."),
+    TextNode(id_="paz", text="The Paz river crosses the valley."),
+    TextNode(id_="potosi", text="Potosí grew rich with the silver of the Cerro Rico."),
+]
+
+CARD_JSON = json.dumps({
+    "description": "Seat of government of Bolivia",
+    "places": ["San Francisco church"],
+    "hotels": ["Hotel Rosario, near the San Francisco church"],
+    "activities": [],
+    "transport": ["Cable car to El Alto"],
+})
+
+
+def test_city_key():
+    assert city_key("Potosí") == city_key("  POTOSI ") == "potosi"
+
+
+def test_build_city_cards_from_the_nodes_that_mention_the_city():
+    llm = ScriptedLLM(responses=[CARD_JSON], prompts=[])
+    cards, failed = build_city_cards(NODES, ["La Paz", "Oruro"], llm)
+
+    assert [card.city for card in cards] == ["La Paz"]
+    assert failed == []
+    assert sorted(cards[0].source_node_ids) == ["hotels", "la-paz"]
+    assert cards[0].hotels == ["Hotel Rosario, near the San Francisco church"]
+    # Oruro is not in the guide, so only one LLM call was made
+    assert len(llm.prompts) == 1
+    assert "The Paz river" not in llm.prompts[0]
+
+
+def test_cities_whose_card_fails_are_skipped():
+    llm = ScriptedLLM(responses=["not a card", CARD_JSON], prompts=[])
+    cards, failed = build_city_cards(NODES, ["Potosí", "La Paz"], llm, workers=1)
+
+    assert [card.city for card in cards] == ["La Paz"]
+    assert failed == ["Potosí"]
+    assert len(llm.prompts) == 2
+
+
+def test_format_city_card_skips_empty_lists():
+    card = CityCard(city="Sucre", description="Constitutional capital", places=["Casa de la Libertad"])
+    assert format_city_card(card) == "Sucre: Constitutional capital\n- Places: Casa de la Libertad"
+
+
+def test_city_card_store(tmp_path):
+    store = CityCardStore(str(tmp_path / "cards.db"))
+    assert store.index_version() is None
+    assert store.get("La Paz") is None
+
+    sucre = CityCard(city="Sucre", description="Constitutional capital")
+    potosi = CityCard(city="Potosí", description="Silver mines", source_node_ids=["potosi"])
+    store.replace([sucre, potosi], "v1")
+    assert store.index_version() == "v1"
+    assert store.get("potosi") == potosi
+    assert store.cities() == ["Potosí", "Sucre"]
+
+    store.replace([sucre], "v2")
+    reopened = CityCardStore(store.db_path)
+    assert reopened.index_version() == "v2"
+    assert reopened.get("Potosí") is None
+
+    # Partial cards are rebuilt by the next update
+    store.replace([potosi], None)
+    assert store.index_version() is None
+    assert store.cities() == ["Potosí"]
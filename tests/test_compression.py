@@ -0,0 +1,59 @@
+from llama_index.core.schema import TextNode, NodeWithScore, QueryBundle
+from ai_assistant.compression import ContextCompressor, split_sentences
+
+UYUNI = (
+    "The Salar de Uyuni is the largest salt flat in the world. "
+    "Tours leave from the town of Uyuni and last three days. "
+    "The train cemetery is on the outskirts of the town."
+)
+# The next chunk overlaps the previous one by a sentence
+UYUNI_NEXT = (
+    "The train cemetery is on the outskirts of the town. "
+    "In the rainy season the salt flat becomes a mirror."
+)
+SUCRE = "Sucre is the constitutional capital of Bolivia. Its center is white."
+
+
+def compress(compressor: ContextCompressor, query: str, texts: list[str]) -> list[str]:
+    nodes = [NodeWithScore(node=TextNode(text=text), score=1.0) for text in texts]
+    return [node.node.get_content() for node in compressor.postprocess_nodes(nodes, QueryBundle(query))]
+
+
+def test_split_sentences():
+    assert split_sentences("One. Two?\nThree!  ") == ["One.", "Two?", "Three!"]
+
+
+def test_keeps_the_relevant_sentences_once():
+    compressor = ContextCompressor(token_budget=1000)
+    texts = compress(compressor, "When is the salt flat a mirror?", [UYUNI, UYUNI_NEXT, SUCRE])
+    # "the" and "is" are in most sentences, they do not make the train cemetery relevant
+    assert texts == [
+        "The Salar de Uyuni is the largest salt flat in the world.",
+        "In the rainy season the salt flat becomes a mirror.",
+    ]
+
+
+def test_fits_the_token_budget():
+    compressor = ContextCompressor(token_budget=15)
+    texts = compress(compressor, "salt flat mirror", [UYUNI, UYUNI_NEXT, SUCRE])
+    assert texts == ["In the rainy season the salt flat becomes a mirror."]
+
+
+def test_keeps_the_retrieval_order_without_matches():
+    compressor = ContextCompressor(token_budget=35)
+    texts = compress(compressor, "¿Dónde está el desierto salado?", [UYUNI, SUCRE])
+    assert texts == [
+        "The Salar de Uyuni is the largest salt flat in the world. "
+        "Tours leave from the town of Uyuni and last three days."
+    ]
+
+
+def test_stats_report_the_tokens_saved():
+    compressor = ContextCompressor(token_budget=1000)
+    compress(compressor, "capital of Bolivia", [UYUNI, SUCRE])
+    compress(compressor, "Uyuni tours", [UYUNI])
+
+    stats = compressor.stats()
+    assert stats.queries == 2
+    assert 0 < stats.output_tokens < stats.input_tokens
+    assert stats.tokens_saved == stats.input_tokens - stats.output_tokens
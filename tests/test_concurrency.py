@@ -0,0 +1,42 @@
+import asyncio
+from ai_assistant.concurrency import ConcurrencyLimiter, OverloadedError
+
+
+async def run_requests(limiter: ConcurrencyLimiter, requests: int, delay: float):
+    peak = 0
+
+    async def request():
+        nonlocal peak
+        async with limiter.acquire():
+            peak = max(peak, limiter.running)
+            await asyncio.sleep(delay)
+        return True
+
+    results = await asyncio.gather(*(request() for _ in range(requests)), return_exceptions=True)
+    return results, peak
+
+
+def test_limiter_caps_concurrency():
+    limiter = ConcurrencyLimiter(max_concurrency=10, max_waiting=1000)
+    results, peak = asyncio.run(run_requests(limiter, 500, 0.01))
+
+    assert all(result is True for result in results)
+    assert peak == 10
+    assert limiter.running == limiter.waiting == 0
+
+
+def test_limiter_rejects_when_queue_is_full():
+    limiter = ConcurrencyLimiter(max_concurrency=2, max_waiting=3)
+    results, _ = asyncio.run(run_requests(limiter, 10, 0.05))
+
+    rejected = [result for result in results if isinstance(result, OverloadedError)]
+    assert len(rejected) == 5
+    assert limiter.rejected == 5
+
+
+def test_limiter_times_out_waiting():
+    limiter = ConcurrencyLimiter(max_concurrency=1, max_waiting=10, timeout=0.01)
+    results, _ = asyncio.run(run_requests(limiter, 2, 0.1))
+
+    assert results[0] is True
+    assert isinstance(results[1], OverloadedError)
@@ -0,0 +1,126 @@
+import asyncio
+import threading
+import numpy as np
+import pytest
+from llama_index.core.embeddings import MockEmbedding
+from ai_assistant.embeddings import CachedEmbedding, build_huggingface_embedding
+
+
+class CountingEmbedding(MockEmbedding):
+    queries: list[str] = []
+    threads: list[int] = []
+
+    def _get_query_embedding(self, query: str) -> list[float]:
+        self.queries.append(query)
+        self.threads.append(threading.get_ident())
+        return [float(len(query))] + [0.5] * (self.embed_dim - 1)
+
+    async def _aget_query_embedding(self, query: str) -> list[float]:
+        return self._get_query_embedding(query)
+
+
+@pytest.fixture
+def embed_model():
+    return CountingEmbedding(embed_dim=4, queries=[], threads=[])
+
+
+def test_normalized_queries_hit_the_cache(embed_model):
+    cached = CachedEmbedding(embed_model, max_size=2)
+    first = cached.get_query_embedding("Hotels in La Paz")
+    assert cached.get_query_embedding("  hotels in  la paz ") == first
+    assert asyncio.run(cached.aget_query_embedding("HOTELS IN LA PAZ")) == first
+    assert embed_model.queries == ["Hotels in La Paz"]
+
+    cached.get_query_embedding("Uyuni tours")
+    cached.get_query_embedding("Sucre museums")
+    cached.get_query_embedding("Hotels in La Paz")
+    assert len(embed_model.queries) == 4
+
+    stats = cached.stats()
+    assert (stats.hits, stats.misses, stats.evictions) == (2, 4, 2)
+    assert stats.hit_rate == pytest.approx(2 / 6)
+
+
+def test_text_embeddings_are_not_cached(embed_model):
+    cached = CachedEmbedding(embed_model)
+    assert cached.get_text_embedding_batch(["a", "b"]) == [[0.5] * 4, [0.5] * 4]
+    assert cached.stats().size == 0
+
+
+def test_async_misses_are_embedded_off_the_event_loop(embed_model, tmp_path):
+    cached = CachedEmbedding(embed_model, disk_cache_path=str(tmp_path / "embeddings.db"))
+
+    async def embed() -> tuple[list[float], int]:
+        return await cached.aget_query_embedding("Salar de Uyuni"), threading.get_ident()
+
+    embedding, loop_thread = asyncio.run(embed())
+    assert embedding == cached.get_query_embedding("salar de uyuni")
+    assert embed_model.queries == ["Salar de Uyuni"]
+    assert embed_model.threads[0] != loop_thread
+
+
+def test_disk_tier_survives_restarts(embed_model, tmp_path):
+    disk_cache_path = str(tmp_path / "embeddings.db")
+    first = CachedEmbedding(embed_model, disk_cache_path=disk_cache_path).get_query_embedding("Salar de Uyuni")
+
+    restarted = CachedEmbedding(embed_model, disk_cache_path=disk_cache_path)
+    assert restarted.get_query_embedding("salar de uyuni") == first
+    assert restarted.get_query_embedding("salar de uyuni") == first
+    assert embed_model.queries == ["Salar de Uyuni"]
+
+    stats = restarted.stats()
+    assert (stats.hits, stats.disk_hits, stats.misses) == (1, 1, 0)
+    assert stats.hit_rate == 1.0
+
+
+PASSAGES = [
+    "La Paz is the seat of government of Bolivia.",
+    "The Salar de Uyuni is the largest salt flat in the world.",
+    "Sucre is the constitutional capital of Bolivia.",
+    "Tarija is known for its wines.",
+    "Hotels in La Paz are near the city center.",
+]
+QUERIES = ["Where is the salt flat?", "wines of Tarija", "capital of Bolivia", "hotels in La Paz"]
+
+
+@pytest.fixture(scope="module")
+def tiny_model_path(tmp_path_factory):
+    """A small randomly initialized BERT saved locally, so no model is downloaded."""
+    torch = pytest.importorskip("torch")
+    from transformers import BertConfig, BertModel, BertTokenizerFast
+
+    path = tmp_path_factory.mktemp("tiny-bert")
+    words = {word.strip(".?").lower() for text in PASSAGES + QUERIES for word in text.split()}
+    (path / "vocab.txt").write_text("\n".join(["[PAD]", "[UNK]", "[CLS]", "[SEP]", "[MASK]", *sorted(words)]))
+    BertTokenizerFast(vocab_file=str(path / "vocab.txt")).save_pretrained(path)
+    torch.manual_seed(0)
+    config = BertConfig(
+        vocab_size=len(words) + 5, hidden_size=64, num_hidden_layers=2,
+        num_attention_heads=2, intermediate_size=128,
+    )
+    BertModel(config).save_pretrained(path)
+    return str(path)
+
+
+def retrieve(embed_model) -> tuple[list[list[int]], np.ndarray]:
+    passages = np.array(embed_model.get_text_embedding_batch(PASSAGES))
+    queries = np.array([embed_model.get_query_embedding(query) for query in QUERIES])
+    similarities = queries @ passages.T
+    return [list(np.argsort(-row)[:3]) for row in similarities], similarities
+
+
+@pytest.mark.parametrize("backend", ["torch-int8", "onnx"])
+def test_backend_parity(tiny_model_path, backend):
+    if backend == "onnx":
+        pytest.importorskip("onnxruntime")
+        pytest.importorskip("optimum")
+    reference_ranking, reference = retrieve(build_huggingface_embedding(tiny_model_path, "torch"))
+    ranking, similarities = retrieve(build_huggingface_embedding(tiny_model_path, backend))
+
+    assert [row[0] for row in ranking] == [row[0] for row in reference_ranking]
+    assert similarities == pytest.approx(reference, abs=0.02)
+
+
+def test_unknown_backend():
+    with pytest.raises(ValueError):
+        build_huggingface_embedding("model", "tpu")
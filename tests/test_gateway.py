@@ -0,0 +1,117 @@
+import time
+import asyncio
+import httpx
+import pytest
+from concurrent.futures import ThreadPoolExecutor
+from llama_index.llms.openai import OpenAI
+from ai_assistant.gateway import LLMGateway, RateLimitScheduler, parse_duration
+from tests.mock_llm_server import MockLLMServer
+
+
+def gateway_llm(server: MockLLMServer, gateway: LLMGateway) -> OpenAI:
+    return OpenAI(
+        model="gpt-4o-mini",
+        api_key="key",
+        api_base=server.url,
+        max_retries=0,
+        http_client=gateway.client(),
+        async_http_client=gateway.async_client(),
+    )
+
+
+def test_parse_duration():
+    assert parse_duration("20ms") == pytest.approx(0.02)
+    assert parse_duration("1s") == 1
+    assert parse_duration("6m0s") == 360
+    assert parse_duration("1h2m3.5s") == pytest.approx(3723.5)
+
+
+def test_rate_limit_scheduler_pauses_until_reset():
+    scheduler = RateLimitScheduler()
+    request = httpx.Request("POST", "http://llm")
+    scheduler.observe(httpx.Response(200, headers={"x-ratelimit-remaining-requests": "5", "x-ratelimit-reset-requests": "1s"}, request=request))
+    assert scheduler.delay() == 0
+
+    scheduler.observe(httpx.Response(200, headers={"x-ratelimit-remaining-tokens": "10", "x-ratelimit-reset-tokens": "2s"}, request=request))
+    assert 1.5 < scheduler.delay() <= 2
+
+    scheduler = RateLimitScheduler()
+    scheduler.observe(httpx.Response(429, headers={"retry-after": "3"}, request=request))
+    assert 2.5 < scheduler.delay() <= 3
+
+
+def test_identical_prompts_in_flight_share_one_request():
+    gateway = LLMGateway(batch_window_ms=50)
+    with MockLLMServer(latency=0.2) as server:
+        llm = gateway_llm(server, gateway)
+        with ThreadPoolExecutor(5) as executor:
+            answers = list(executor.map(lambda _: llm.complete("Hotels in Sucre").text, range(5)))
+
+    assert answers == ["Echo: Hotels in Sucre"] * 5
+    assert len(server.requests) == 1
+    stats = gateway.stats()
+    assert (stats.requests, stats.upstream_requests, stats.coalesced) == (5, 1, 4)
+
+
+def test_identical_async_prompts_share_one_request():
+    gateway = LLMGateway(batch_window_ms=50)
+
+    async def ask(llm: OpenAI) -> list[str]:
+        responses = await asyncio.gather(*[llm.acomplete("Tours in Uyuni") for _ in range(5)])
+        return [response.text for response in responses]
+
+    with MockLLMServer(latency=0.2) as server:
+        answers = asyncio.run(ask(gateway_llm(server, gateway)))
+
+    assert answers == ["Echo: Tours in Uyuni"] * 5
+    assert len(server.requests) == 1
+
+
+def test_followers_take_over_from_a_cancelled_leader():
+    gateway = LLMGateway()
+
+    async def ask(llm: OpenAI) -> str:
+        leader = asyncio.create_task(llm.acomplete("Tours in Uyuni"))
+        await asyncio.sleep(0.05)
+        follower = asyncio.create_task(llm.acomplete("Tours in Uyuni"))
+        await asyncio.sleep(0.05)
+        leader.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await leader
+        return (await follower).text
+
+    with MockLLMServer(latency=0.3) as server:
+        answer = asyncio.run(ask(gateway_llm(server, gateway)))
+
+    assert answer == "Echo: Tours in Uyuni"
+    # The follower sent the request again as the new leader
+    stats = gateway.stats()
+    assert (stats.requests, stats.upstream_requests, stats.coalesced) == (2, 2, 0)
+
+
+def test_different_prompts_reuse_the_connection():
+    gateway = LLMGateway()
+    with MockLLMServer() as server:
+        llm = gateway_llm(server, gateway)
+        answers = [llm.complete(f"Question {i}").text for i in range(5)]
+        streamed = "".join(response.delta for response in llm.stream_complete("Question 5"))
+
+    assert answers == [f"Echo: Question {i}" for i in range(5)]
+    assert streamed == "Echo: Question 5"
+    assert len(server.requests) == 6
+    assert len(server.connections) == 1
+    assert gateway.stats().coalesced == 0
+
+
+def test_requests_wait_for_the_rate_limit_instead_of_failing():
+    gateway = LLMGateway()
+    with MockLLMServer(rate_limit=2, rate_window=0.3) as server:
+        llm = gateway_llm(server, gateway)
+        start = time.perf_counter()
+        answers = [llm.complete(f"Question {i}").text for i in range(4)]
+        elapsed = time.perf_counter() - start
+
+    assert answers == [f"Echo: Question {i}" for i in range(4)]
+    assert server.rejected == 0
+    assert elapsed >= 0.3
+    assert gateway.stats().rate_limit_pauses >= 1
@@ -0,0 +1,102 @@
+import pytest
+from llama_index.core.embeddings import MockEmbedding
+from llama_index.core.node_parser import SentenceSplitter
+from llama_index.core.schema import Document
+from ai_assistant.embeddings import CachedEmbedding
+from ai_assistant.ingestion import embed_documents, read_checkpoint
+
+
+class FailingEmbedding(MockEmbedding):
+    """Embeds `max_batches` batches, then fails like an interrupted ingestion."""
+
+    max_batches: int = 1000
+    batch_sizes: list[int] = []
+
+    def _get_text_embeddings(self, texts: list[str]) -> list[list[float]]:
+        if len(self.batch_sizes) >= self.max_batches:
+            raise KeyboardInterrupt
+        self.batch_sizes.append(len(texts))
+        return super()._get_text_embeddings(texts)
+
+
+def make_embed_model() -> MockEmbedding:
+    return MockEmbedding(embed_dim=8)
+
+
+@pytest.fixture
+def documents():
+    return [
+        Document(id_=f"guide-{i}.txt", text=" ".join(f"Sentence {j} of guide {i}." for j in range(40)))
+        for i in range(6)
+    ]
+
+
+@pytest.fixture
+def node_parser():
+    return SentenceSplitter(chunk_size=64, chunk_overlap=0)
+
+
+def test_embeds_in_batches(documents, node_parser, tmp_path):
+    checkpoint_path = str(tmp_path / "store.checkpoint.jsonl")
+    nodes, document_hashes = embed_documents(
+        iter(documents), checkpoint_path, make_embed_model, batch_size=4, node_parser=node_parser
+    )
+    assert len(nodes) > len(documents)
+    assert all(node.embedding == [0.5] * 8 for node in nodes)
+    assert [node.ref_doc_id for node in nodes] == sorted(node.ref_doc_id for node in nodes)
+    assert document_hashes == {document.doc_id: document.hash for document in documents}
+    assert set(read_checkpoint(checkpoint_path)) == set(document_hashes)
+
+
+def test_model_embeds_batches_of_the_configured_size(documents, node_parser, tmp_path):
+    inner_model = FailingEmbedding(embed_dim=8, embed_batch_size=10)
+    cached_model = CachedEmbedding(inner_model)
+    nodes, _ = embed_documents(
+        documents, str(tmp_path / "store.checkpoint.jsonl"), lambda: cached_model,
+        batch_size=16, node_parser=node_parser,
+    )
+    assert len(nodes) > 16
+    assert inner_model.batch_sizes[:-1] == [16] * (len(inner_model.batch_sizes) - 1)
+    assert sum(inner_model.batch_sizes) == len(nodes)
+    # The shared model keeps its own batch size
+    assert (cached_model.embed_batch_size, inner_model.embed_batch_size) == (10, 10)
+
+
+def test_resumes_from_checkpoint(documents, node_parser, tmp_path):
+    checkpoint_path = str(tmp_path / "store.checkpoint.jsonl")
+    failing_model = FailingEmbedding(embed_dim=8, max_batches=2)
+    with pytest.raises(KeyboardInterrupt):
+        embed_documents(
+            documents, checkpoint_path, lambda: failing_model, batch_size=4, node_parser=node_parser
+        )
+    checkpointed = read_checkpoint(checkpoint_path)
+    assert 0 < len(checkpointed) < len(documents)
+
+    # A changed document is embedded again even if it was checkpointed
+    changed_id = documents[0].doc_id
+    assert changed_id in checkpointed
+    documents[0] = Document(id_=changed_id, text=documents[0].text + " Updated.")
+    to_embed = [
+        document for document in documents
+        if document.doc_id not in checkpointed or document.doc_id == changed_id
+    ]
+    counting_model = FailingEmbedding(embed_dim=8)
+    nodes, _ = embed_documents(
+        documents, checkpoint_path, lambda: counting_model, batch_size=4, node_parser=node_parser
+    )
+    assert sum(counting_model.batch_sizes) == len(node_parser.get_nodes_from_documents(to_embed))
+    assert len(nodes) == len(node_parser.get_nodes_from_documents(documents))
+    assert len(read_checkpoint(checkpoint_path)) == len(documents)
+
+
+def test_process_pool(documents, node_parser, tmp_path):
+    nodes, _ = embed_documents(
+        documents,
+        str(tmp_path / "store.checkpoint.jsonl"),
+        make_embed_model,
+        batch_size=4,
+        workers=2,
+        node_parser=node_parser,
+    )
+    assert len(nodes) == len(node_parser.get_nodes_from_documents(documents))
+    assert all(node.embedding == [0.5] * 8 for node in nodes)
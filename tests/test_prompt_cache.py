@@ -0,0 +1,72 @@
+import pytest
+from llama_index.core.agent.react.formatter import ReActChatFormatter
+from llama_index.core.agent.react.types import ActionReasoningStep, ObservationReasoningStep
+from llama_index.core.base.llms.types import ChatMessage
+from llama_index.core.instrumentation import get_dispatcher
+from llama_index.llms.openai import OpenAI
+from ai_assistant.agent import TRAVEL_TOOLS
+from ai_assistant.prompt_cache import (
+    PrecompiledReActChatFormatter,
+    PromptCacheMonitor,
+    compile_react_system_header,
+    prompt_token_usage,
+)
+from ai_assistant.prompts import agent_prompt_str
+from tests.mock_llm_server import MockLLMServer
+
+
+@pytest.fixture
+def monitor():
+    monitor = PromptCacheMonitor()
+    get_dispatcher().add_event_handler(monitor)
+    yield monitor
+    get_dispatcher().event_handlers.remove(monitor)
+
+
+def test_precompiled_formatter_matches_the_react_formatter():
+    history = [ChatMessage(role="user", content="Hola"), ChatMessage(role="assistant", content="¡Hola!")]
+    steps = [
+        ActionReasoningStep(thought="I need the date.", action="get_current_date", action_input={}),
+        ObservationReasoningStep(observation="2026-10-18"),
+    ]
+    expected = ReActChatFormatter(system_header=agent_prompt_str).format(TRAVEL_TOOLS, history, steps)
+
+    first = PrecompiledReActChatFormatter(system_header=agent_prompt_str).format(TRAVEL_TOOLS, history, steps)
+    second = PrecompiledReActChatFormatter(system_header=agent_prompt_str).format(TRAVEL_TOOLS, [], [])
+
+    assert first == expected
+    # Every agent sends the same compiled system prompt
+    assert second[0].content is first[0].content
+    assert compile_react_system_header.cache_info().hits >= 1
+
+
+def test_prompt_token_usage():
+    assert prompt_token_usage({"usage": {"prompt_tokens": 2000, "prompt_tokens_details": {"cached_tokens": 1920}}}) == (2000, 1920)
+    assert prompt_token_usage({"usage": {"prompt_tokens": 10}}) == (10, 0)
+    assert prompt_token_usage({"choices": []}) is None
+
+
+def test_monitor_reports_cached_prompt_tokens(monitor):
+    system = ChatMessage(role="system", content="You are a travel assistant for Bolivia. " * 20)
+    with MockLLMServer() as server:
+        llm = OpenAI(
+            model="gpt-4o-mini",
+            api_key="key",
+            api_base=server.url,
+            additional_kwargs={"stream_options": {"include_usage": True}},
+        )
+        llm.chat([system, ChatMessage(role="user", content="Hotels in Sucre")])
+        llm.chat([system, ChatMessage(role="user", content="Hotels in Tarija")])
+        streamed = "".join(
+            response.delta
+            for response in llm.stream_chat([system, ChatMessage(role="user", content="Tours in Uyuni")])
+        )
+
+    assert streamed == "Echo: Tours in Uyuni"
+    stats = monitor.stats()
+    assert stats.requests == 3
+    assert stats.prompt_tokens == 3 * 143
+    # After the first request, the system prompt comes from the cache
+    assert stats.cached_tokens == 142 + 140
+    assert stats.uncached_tokens == 143 + 1 + 3
+    assert stats.cached_ratio == pytest.approx(282 / 429)
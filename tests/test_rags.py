@@ -0,0 +1,218 @@
+import asyncio
+import threading
+import pytest
+from llama_index.core import Settings
+from llama_index.core.embeddings import MockEmbedding
+from llama_index.core.postprocessor.types import BaseNodePostprocessor
+from ai_assistant.cache import TTLCache
+from ai_assistant.cards import CityCardStore
+from ai_assistant.models import CityCard
+from ai_assistant.compression import ContextCompressor
+from ai_assistant.rags import LazyQueryEngine, TravelGuideRAG
+from tests.scripted_llm import ScriptedLLM
+
+
+class CountingEmbedding(MockEmbedding):
+    embedded_texts: list[str] = []
+
+    def _get_text_embedding(self, text: str) -> list[float]:
+        self.embedded_texts.append(text)
+        return super()._get_text_embedding(text)
+
+    def _get_text_embeddings(self, texts: list[str]) -> list[list[float]]:
+        return [self._get_text_embedding(text) for text in texts]
+
+
+@pytest.fixture
+def embed_model(mocker):
+    embed_model = CountingEmbedding(embed_dim=8)
+    llm = ScriptedLLM(responses=["answer"])
+
+    def use_embed_model():
+        Settings.embed_model = embed_model
+        return embed_model
+
+    def use_llm():
+        Settings.llm = llm
+        return llm
+
+    mocker.patch("ai_assistant.rags.get_embed_model", use_embed_model)
+    mocker.patch("ai_assistant.rags.get_llm", use_llm)
+    yield embed_model
+    Settings._embed_model = None
+    Settings._llm = None
+
+
+@pytest.fixture
+def data_dir(tmp_path):
+    data_dir = tmp_path / "data"
+    data_dir.mkdir()
+    (data_dir / "la_paz.txt").write_text("La Paz is the seat of government of Bolivia.")
+    (data_dir / "uyuni.txt").write_text("The Salar de Uyuni is the largest salt flat in the world.")
+    (data_dir / "sucre.txt").write_text("Sucre is the constitutional capital of Bolivia.")
+    return data_dir
+
+
+def test_incremental_ingestion(embed_model, data_dir, tmp_path):
+    store_path = str(tmp_path / "store")
+    rag = TravelGuideRAG(store_path, str(data_dir))
+    assert len(embed_model.embedded_texts) == 3
+    assert len(rag.index.ref_doc_info) == 3
+
+    # Unchanged data, even if the files are touched, embeds nothing
+    embed_model.embedded_texts.clear()
+    (data_dir / "sucre.txt").touch()
+    TravelGuideRAG(store_path, str(data_dir))
+    assert embed_model.embedded_texts == []
+
+    (data_dir / "uyuni.txt").write_text("The Salar de Uyuni floods in the rainy season.")
+    (data_dir / "sucre.txt").unlink()
+    (data_dir / "tarija.txt").write_text("Tarija is known for its wines.")
+    rag = TravelGuideRAG(store_path, str(data_dir), incremental=False)
+    changes = rag.refresh_data(store_path, str(data_dir))
+
+    assert changes == {"inserted": 1, "updated": 1, "deleted": 1}
+    assert sorted(text.split("\n\n")[-1] for text in embed_model.embedded_texts) == [
+        "Tarija is known for its wines.",
+        "The Salar de Uyuni floods in the rainy season.",
+    ]
+
+    rag = TravelGuideRAG(store_path, str(data_dir), incremental=False)
+    file_names = sorted(info.metadata["file_name"] for info in rag.index.ref_doc_info.values())
+    assert file_names == ["la_paz.txt", "tarija.txt", "uyuni.txt"]
+    assert len(rag.index.docstore.docs) == 3
+
+
+def test_mmap_vector_store_backend(embed_model, data_dir, tmp_path):
+    store_path = tmp_path / "store"
+    rag = TravelGuideRAG(str(store_path), str(data_dir), vector_store_backend="mmap")
+    assert (store_path / "default__vector_store.npy").exists()
+    assert not (store_path / "default__vector_store.json").exists()
+
+    (data_dir / "tarija.txt").write_text("Tarija is known for its wines.")
+    embed_model.embedded_texts.clear()
+    rag = TravelGuideRAG(str(store_path), str(data_dir), vector_store_backend="mmap")
+    assert len(embed_model.embedded_texts) == 1
+    assert len(rag.index.vector_store.node_ids) == 4
+
+    nodes = rag.index.as_retriever(similarity_top_k=2).retrieve("wines of Tarija")
+    assert len(nodes) == 2
+
+
+def test_cached_answers_until_reingestion(embed_model, data_dir, tmp_path, mocker):
+    store_path = str(tmp_path / "store")
+    rag = TravelGuideRAG(store_path, str(data_dir))
+    query_engine = rag.get_query_engine(cache=TTLCache(max_size=10))
+    synthesize = mocker.spy(query_engine._query_engine, "query")
+
+    first = query_engine.query("Where is the salt flat?")
+    second = query_engine.query("  where is the SALT flat? ")
+    assert str(first) == str(second) == "answer"
+    assert second.metadata == {"cached": True}
+    assert [node.node.node_id for node in second.source_nodes] == [
+        node.node.node_id for node in first.source_nodes
+    ]
+    assert synthesize.call_count == 1
+
+    (data_dir / "tarija.txt").write_text("Tarija is known for its wines.")
+    rag.refresh_data(store_path, str(data_dir))
+    query_engine.query("Where is the salt flat?")
+    assert synthesize.call_count == 2
+    assert query_engine.stats().hits == 1
+
+
+def test_hybrid_retrieval(embed_model, data_dir, tmp_path):
+    rag = TravelGuideRAG(str(tmp_path / "store"), str(data_dir))
+    retriever = rag.hybrid_retriever(top_k=1, candidate_k=3)
+    nodes = retriever.retrieve("Salar de Uyuni")
+    assert nodes[0].node.metadata["file_name"] == "uyuni.txt"
+
+    response = rag.get_query_engine(retriever=retriever).query("Salar de Uyuni")
+    assert str(response) == "answer"
+    assert [node.node.node_id for node in response.source_nodes] == [nodes[0].node.node_id]
+
+
+def test_city_cards_rebuilt_when_the_documents_change(embed_model, data_dir, tmp_path, mocker):
+    llm = ScriptedLLM(responses=['{"description": "Constitutional capital of Bolivia"}'], prompts=[])
+    mocker.patch("ai_assistant.rags.get_llm", lambda: llm)
+    store_path = str(tmp_path / "store")
+    card_store = CityCardStore(str(tmp_path / "cards.db"))
+
+    rag = TravelGuideRAG(store_path, str(data_dir), city_card_store=card_store, city_card_cities=["Sucre", "Tarija"])
+    rag.city_cards_update.join()
+    assert card_store.cities() == ["Sucre"]
+    assert card_store.get("sucre").description == "Constitutional capital of Bolivia"
+    assert card_store.index_version() == rag.index_version
+    assert len(llm.prompts) == 1
+
+    # Unchanged documents reuse the cards
+    reloaded = TravelGuideRAG(store_path, str(data_dir), city_card_store=card_store, city_card_cities=["Sucre", "Tarija"])
+    assert reloaded.update_city_cards() is False
+    reloaded.city_cards_update.join()
+    assert len(llm.prompts) == 1
+
+    (data_dir / "tarija.txt").write_text("Tarija is known for its wines.")
+    rag.refresh_data(store_path, str(data_dir))
+    rag.city_cards_update.join()
+    assert card_store.cities() == ["Sucre", "Tarija"]
+    assert card_store.index_version() == rag.index_version
+
+
+def test_city_cards_do_not_block_or_fail_construction(embed_model, data_dir, tmp_path, mocker):
+    llm = ScriptedLLM(responses=["not a card", '{"description": "Constitutional capital of Bolivia"}'], prompts=[])
+    mocker.patch("ai_assistant.rags.get_llm", lambda: llm)
+    card_store = CityCardStore(str(tmp_path / "cards.db"))
+    card_store.replace([CityCard(city="Sucre", description="White city")], "old")
+
+    # Another process is rebuilding the cards
+    with card_store.rebuild_lock():
+        rag = TravelGuideRAG(str(tmp_path / "store"), str(data_dir), city_card_store=card_store, city_card_cities=["Sucre"])
+        assert rag.index.as_retriever().retrieve("Salar de Uyuni")
+        assert rag.city_cards_update.is_alive()
+    rag.city_cards_update.join()
+
+    # The card that failed keeps the previous one and the build is retried
+    assert len(llm.prompts) == 1
+    assert card_store.get("sucre").description == "White city"
+    assert card_store.index_version() is None
+    assert rag.update_city_cards() is True
+    assert len(llm.prompts) == 2
+    assert card_store.get("sucre").description == "Constitutional capital of Bolivia"
+    assert card_store.index_version() == rag.index_version
+
+
+def test_context_compression_before_synthesis(embed_model, data_dir, tmp_path):
+    rag = TravelGuideRAG(str(tmp_path / "store"), str(data_dir))
+    compressor = ContextCompressor()
+    query_engine = rag.get_query_engine(
+        retriever=rag.hybrid_retriever(top_k=3, candidate_k=3), node_postprocessors=[compressor]
+    )
+    response = query_engine.query("Where is the salt flat?")
+
+    assert [node.node.get_content() for node in response.source_nodes] == [
+        "The Salar de Uyuni is the largest salt flat in the world."
+    ]
+    assert "Sucre" not in Settings.llm.prompts[-1]
+    assert compressor.stats().tokens_saved > 0
+
+
+class ThreadRecorder(BaseNodePostprocessor):
+    threads: list[int] = []
+
+    def _postprocess_nodes(self, nodes, query_bundle=None):
+        self.threads.append(threading.get_ident())
+        return nodes
+
+
+def test_async_queries_retrieve_off_the_event_loop(embed_model, data_dir, tmp_path):
+    rag = TravelGuideRAG(str(tmp_path / "store"), str(data_dir))
+    recorder = ThreadRecorder()
+    query_engine = LazyQueryEngine(lambda: rag.get_query_engine(node_postprocessors=[recorder]))
+
+    async def query():
+        return threading.get_ident(), await query_engine.aquery("Where is the salt flat?")
+
+    loop_thread, response = asyncio.run(query())
+    assert str(response) == "answer"
+    assert len(recorder.threads) == 1
+    assert recorder.threads[0] != loop_thread
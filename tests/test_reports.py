@@ -0,0 +1,48 @@
+from datetime import date
+from ai_assistant.reports import build_travel_report, format_travel_report
+
+RESERVATIONS = [
+    {"trip_type": "FLIGHT", "date": "2026-12-01", "departure": "La Paz", "destination": "Tarija", "cost": 500, "reservation_type": "TripReservation"},
+    {"checkin_date": "2026-12-01", "checkout_date": "2026-12-05", "hotel_name": "Hotel Los Parrales", "city": "Tarija", "cost": 200, "reservation_type": "HotelReservation"},
+    {"reservation_time": "2026-12-03T20:00:00", "restaurant": "La Casa del Vino", "city": "Tarija", "dish": "pique", "cost": 40, "reservation_type": "RestaurantReservation"},
+    {"trip_type": "BUS", "date": "2026-11-28", "departure": "Sucre", "destination": "La Paz", "cost": 80, "reservation_type": "TripReservation"},
+]
+
+
+def test_build_travel_report():
+    report = build_travel_report(RESERVATIONS)
+
+    assert [(group.city, group.date) for group in report.groups] == [
+        ("La Paz", date(2026, 11, 28)),
+        ("Tarija", date(2026, 12, 1)),
+        ("Tarija", date(2026, 12, 3)),
+    ]
+    assert [len(group.reservations) for group in report.groups] == [1, 2, 1]
+    assert report.groups[1].subtotal == 700
+    assert report.subtotals == {"flights": 500, "buses": 80, "hotels": 200, "restaurants": 40}
+    assert report.total_budget == 820
+    assert report.reservation_count == 4
+
+
+def test_build_empty_travel_report():
+    report = build_travel_report([])
+
+    assert report.groups == []
+    assert report.total_budget == 0
+
+
+def test_format_travel_report():
+    report = build_travel_report(RESERVATIONS)
+
+    assert format_travel_report(report) == "\n".join([
+        "Your reservations (4):",
+        "2026-11-28 - La Paz:",
+        "  - Bus Sucre → La Paz: 80 BOB",
+        "2026-12-01 - Tarija:",
+        "  - Flight La Paz → Tarija: 500 BOB",
+        "  - Hotel Hotel Los Parrales, 2026-12-01 → 2026-12-05: 200 BOB",
+        "2026-12-03 - Tarija:",
+        "  - Restaurant La Casa del Vino, pique (2026-12-03T20:00:00): 40 BOB",
+        "Total budget: 820 BOB",
+    ])
+    assert format_travel_report(build_travel_report([]), "es") == "Todavía no tienes reservas."
@@ -0,0 +1,95 @@
+import time
+import asyncio
+import pytest
+from llama_index.core.postprocessor.types import BaseNodePostprocessor
+from llama_index.core.schema import TextNode, NodeWithScore
+from llama_index.core.storage.docstore import SimpleDocumentStore
+from llama_index.core.base.base_retriever import BaseRetriever
+from ai_assistant.retrievers import BM25Index, HybridRetriever, reciprocal_rank_fusion, tokenize
+
+NODES = [
+    TextNode(id_="la-paz", text="La Paz is the seat of government of Bolivia, high in the Andes."),
+    TextNode(id_="uyuni", text="The Salar de Uyuni is the largest salt flat in the world."),
+    TextNode(id_="yungas", text="The Yungas road descends from the mountains into the jungle."),
+    TextNode(id_="potosi", text="Potosí grew rich with the silver of the Cerro Rico."),
+    TextNode(id_="sucre", text="Sucre is the constitutional capital of Bolivia."),
+]
+
+
+class FixedRetriever(BaseRetriever):
+    """Dense retriever stand-in that always returns the same ranking."""
+
+    def __init__(self, node_ids: list[str]):
+        super().__init__()
+        self.node_ids = node_ids
+
+    def _retrieve(self, query_bundle) -> list[NodeWithScore]:
+        nodes = {node.node_id: node for node in NODES}
+        return [NodeWithScore(node=nodes[node_id], score=1.0) for node_id in self.node_ids]
+
+
+class SlowReranker(BaseNodePostprocessor):
+    """Reverses the candidates, taking `ms_per_node` per candidate."""
+
+    ms_per_node: float = 5
+    calls: list[int] = []
+
+    def _postprocess_nodes(self, nodes, query_bundle=None):
+        self.calls.append(len(nodes))
+        time.sleep(self.ms_per_node * len(nodes) / 1000)
+        return list(reversed(nodes))
+
+
+@pytest.fixture
+def docstore():
+    docstore = SimpleDocumentStore()
+    docstore.add_documents(NODES)
+    return docstore
+
+
+def test_tokenize_folds_case_and_accents():
+    assert tokenize("Potosí, CERRO Rico!") == ["potosi", "cerro", "rico"]
+
+
+def test_bm25_finds_proper_nouns():
+    index = BM25Index(NODES)
+    assert index.search("yungas", 3)[0][0] == "yungas"
+    assert index.search("potosi silver", 3)[0][0] == "potosi"
+    assert [node_id for node_id, _ in index.search("capital of Bolivia", 2)] == ["sucre", "la-paz"]
+    assert index.search("Oruro", 3) == []
+
+
+def test_reciprocal_rank_fusion():
+    fused = reciprocal_rank_fusion([["a", "b", "c"], ["c", "a"]])
+    assert [node_id for node_id, _ in fused] == ["a", "c", "b"]
+
+
+def test_hybrid_retriever_surfaces_keyword_matches(docstore):
+    retriever = HybridRetriever(
+        FixedRetriever(["la-paz", "sucre", "uyuni"]), BM25Index(NODES), docstore, top_k=2, candidate_k=3
+    )
+    node_ids = [node.node.node_id for node in retriever.retrieve("Yungas road")]
+    assert "yungas" in node_ids
+
+    node_ids = [node.node.node_id for node in asyncio.run(retriever.aretrieve("Salar de Uyuni"))]
+    assert node_ids[0] == "uyuni"
+
+
+def test_reranking_fits_the_budget(docstore):
+    reranker = SlowReranker(calls=[])
+    retriever = HybridRetriever(
+        FixedRetriever(["la-paz", "sucre", "uyuni", "potosi"]),
+        BM25Index(NODES),
+        docstore,
+        top_k=2,
+        candidate_k=4,
+        reranker=reranker,
+        budget_ms=12,
+    )
+    first = retriever.retrieve("Bolivia")
+    assert reranker.calls == [4]
+    assert first[0].node.node_id != "la-paz"
+
+    # With the observed cost of 5ms per candidate only 2 fit in the budget
+    retriever.retrieve("Bolivia")
+    assert all(count <= 2 for count in reranker.calls[1:])
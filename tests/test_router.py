@@ -0,0 +1,106 @@
+import re
+import zlib
+from datetime import date
+import numpy as np
+import pytest
+from ai_assistant.router import IntentRouter, Intent, NEGATIVE_EXAMPLES, default_intents
+from ai_assistant.tools import reserve_bus
+from ai_assistant.utils import load_reservations, reset_reservations
+
+
+def bag_of_words(text: str) -> list[float]:
+    # Stand-in for the embedding model: one dimension per word
+    embedding = np.zeros(512)
+    for word in re.findall(r"\w+", text.lower()):
+        embedding[zlib.crc32(word.encode()) % 512] += 1
+    return embedding.tolist()
+
+
+@pytest.fixture
+def log_file(mocker, tmp_path):
+    mocker.patch("ai_assistant.utils.SETTINGS.log_file", str(tmp_path / "trip.json"))
+    reset_reservations()
+
+
+@pytest.mark.parametrize(
+    "message, intent, language",
+    [
+        ("Show me my reservations", "show_reservations", "en"),
+        ("what are my bookings?", "show_reservations", "en"),
+        ("Muéstrame todas mis reservas, por favor", "show_reservations", "es"),
+        ("Delete all my reservations", "delete_reservations", "en"),
+        ("Borra todas mis reservas", "delete_reservations", "es"),
+        ("What's today's date?", "current_date", "en"),
+        ("¿Qué día es hoy?", "current_date", "es"),
+    ],
+)
+def test_commands_are_matched_by_rules(message, intent, language):
+    match = IntentRouter(default_intents()).classify(message)
+
+    assert (match.intent.name, match.language, match.method) == (intent, language, "rule")
+
+
+@pytest.mark.parametrize(
+    "message",
+    [
+        "Show my hotel reservations in Sucre",
+        "Cancel my hotel reservation",
+        "Book a flight from La Paz to Sucre for today",
+        "What day should I visit the Salar de Uyuni?",
+    ],
+)
+def test_other_messages_go_to_the_agent(message):
+    assert IntentRouter(default_intents()).route(message) is None
+
+
+def test_routed_commands_call_the_tools(log_file):
+    router = IntentRouter(default_intents())
+    reserve_bus("2026-12-01", "Oruro", "Uyuni")
+
+    report = router.route("Muestra mis reservas")
+    assert report.startswith("Tus reservas (1):")
+    assert "2026-12-01 - Uyuni:" in report
+    assert "Bus Oruro → Uyuni" in report
+
+    assert router.route("what is the date today") == f"Today is {date.today().isoformat()}."
+    assert router.route("Delete my reservations") == "Deleted 1 reservations."
+    assert load_reservations() == []
+    assert router.route("show my reservations") == "You have no reservations yet."
+
+
+def test_paraphrases_are_matched_by_embeddings():
+    router = IntentRouter(
+        default_intents(), embed_fn=bag_of_words, negative_examples=NEGATIVE_EXAMPLES, threshold=0.8
+    )
+
+    match = router.classify("list all my bookings now")
+    assert (match.intent.name, match.method) == ("show_reservations", "embedding")
+    assert match.confidence >= 0.8
+    # The closest example needs the agent
+    assert router.classify("show my hotel reservations in La Paz, please") is None
+
+
+def test_unsafe_intents_are_not_matched_by_embeddings():
+    intent = Intent(
+        "delete_reservations",
+        lambda language: "Deleted",
+        patterns={"en": [r"delete my reservations"]},
+        examples={"en": ["delete my reservations"]},
+        safe_to_guess=False,
+    )
+    router = IntentRouter([intent], embed_fn=bag_of_words, threshold=0.5)
+
+    assert router.classify("delete my reservations") is not None
+    assert router.classify("please delete my reservations") is None
+
+
+def test_router_stats(log_file):
+    router = IntentRouter(default_intents(), embed_fn=bag_of_words, threshold=0.8)
+    router.route("show my reservations")
+    router.route("list all my bookings now")
+    router.route("Recommend hotels in Tarija")
+    router.route("Which museums are open in Sucre?")
+
+    stats = router.stats()
+    assert (stats.messages, stats.rule_routes, stats.embedding_routes) == (4, 1, 1)
+    assert stats.bypass_rate == 0.5
@@ -0,0 +1,126 @@
+import sqlite3
+import pytest
+from contextlib import closing
+from datetime import date, datetime
+from ai_assistant.models import (
+    TripReservation,
+    TripType,
+    HotelReservation,
+    RestaurantReservation,
+)
+from ai_assistant.storage import (
+    JsonReservationStore,
+    SqliteReservationStore,
+    reservation_to_dict,
+)
+
+RESERVATIONS = [
+    TripReservation(
+        trip_type=TripType.flight,
+        date=date(2026, 12, 1),
+        departure="La Paz",
+        destination="Tarija",
+        cost=500,
+    ),
+    HotelReservation(
+        checkin_date=date(2026, 12, 1),
+        checkout_date=date(2026, 12, 5),
+        hotel_name="Hotel Los Parrales",
+        city="Tarija",
+        cost=200,
+    ),
+    HotelReservation(
+        checkin_date=date(2026, 12, 10),
+        checkout_date=date(2026, 12, 12),
+        hotel_name="Hotel A",
+        city="La Paz",
+        cost=150,
+    ),
+    RestaurantReservation(
+        reservation_time=datetime(2026, 12, 3, 20, 0),
+        restaurant="La Casa del Vino",
+        city="Tarija",
+        dish="pique",
+        cost=40,
+    ),
+]
+
+
+@pytest.fixture(params=["json", "jsonl", "sqlite"])
+def store(request, tmp_path):
+    if request.param == "sqlite":
+        store = SqliteReservationStore(str(tmp_path / "trip.db"))
+    else:
+        store = JsonReservationStore(str(tmp_path / "trip.json"), request.param)
+    store.save([reservation_to_dict(reservation) for reservation in RESERVATIONS])
+    return store
+
+
+def test_load_keeps_order(store):
+    reservations = store.load()
+    assert len(reservations) == 4
+    assert [reservation["cost"] for reservation in reservations] == [500, 200, 150, 40]
+    assert reservations[1]["checkin_date"] == "2026-12-01"
+
+
+def test_find_by_type_city_and_dates(store):
+    hotels = store.find(
+        reservation_type="HotelReservation",
+        city="tarija",
+        start_date=date(2026, 12, 4),
+        end_date=date(2026, 12, 11),
+    )
+    assert [hotel["hotel_name"] for hotel in hotels] == ["Hotel Los Parrales"]
+
+    in_tarija = store.find(city="Tarija")
+    assert len(in_tarija) == 3
+
+    later = store.find(start_date=date(2026, 12, 6))
+    assert [reservation["cost"] for reservation in later] == [150]
+
+
+def test_find_accented_city_in_any_case(store):
+    store.save([reservation_to_dict(HotelReservation(
+        checkin_date=date(2026, 12, 6),
+        checkout_date=date(2026, 12, 8),
+        hotel_name="Hotel Cima Argentum",
+        city="POTOSÍ",
+        cost=120,
+    ))])
+
+    assert [hotel["hotel_name"] for hotel in store.find(city="potosí")] == ["Hotel Cima Argentum"]
+    assert store.total_cost(city="Potosí") == 120
+
+
+def test_sqlite_store_adds_the_city_key_to_an_old_database(tmp_path):
+    db_path = str(tmp_path / "trip.db")
+    with closing(sqlite3.connect(db_path)) as connection, connection:
+        connection.execute(
+            "CREATE TABLE reservations (id INTEGER PRIMARY KEY AUTOINCREMENT, reservation_type TEXT NOT NULL, "
+            "city TEXT COLLATE NOCASE, start_date TEXT NOT NULL, end_date TEXT NOT NULL, "
+            "cost INTEGER NOT NULL, data TEXT NOT NULL)"
+        )
+        connection.execute(
+            "INSERT INTO reservations (reservation_type, city, start_date, end_date, cost, data) "
+            "VALUES ('HotelReservation', 'Potosí', '2026-12-06', '2026-12-08', 120, '{\"cost\": 120}')"
+        )
+
+    store = SqliteReservationStore(db_path)
+    assert store.find(city="POTOSÍ") == [{"cost": 120}]
+
+
+def test_costs(store):
+    assert store.total_cost() == 890
+    assert store.total_cost(city="Tarija") == 740
+    assert store.cost_by_type() == {
+        "TripReservation": 500,
+        "HotelReservation": 350,
+        "RestaurantReservation": 40,
+    }
+    assert store.total_cost(city="Oruro") == 0
+
+
+def test_reset(store):
+    store.reset()
+    assert store.load() == []
+    assert store.total_cost() == 0
@@ -1,5 +1,5 @@
 import pytest
-from ai_assistant.tools import reserve_flight, reserve_hotel, reserve_restaurant, reserve_bus
+from ai_assistant.tools import reserve_flight, reserve_hotel, reserve_restaurant, reserve_bus, travel_report
 from ai_assistant.utils import load_reservations, save_reservation, reset_reservations
 
 
@@ -127,3 +127,12 @@ def test_reserve_bus_invalid_date(date):
 
     log_reservations = load_reservations()
     assert len(log_reservations) == 0
+
+
+def test_travel_report_total_matches_the_listed_reservations(mocker, log_file):
+    reserve_bus("2026-12-01", "Oruro", "Uyuni")
+    mocker.patch("ai_assistant.tools.reservations_total_cost", side_effect=AssertionError("second read"))
+
+    reservations, total_cost = travel_report()
+
+    assert total_cost == sum(reservation["cost"] for reservation in reservations)
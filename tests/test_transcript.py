@@ -0,0 +1,77 @@
+from llama_index.core.agent import ReActAgent
+from llama_index.core.agent.react.types import ActionReasoningStep, ObservationReasoningStep
+from llama_index.core.tools import FunctionTool
+from ai_assistant.transcript import CompactingReActChatFormatter, TranscriptCompactor
+from tests.scripted_llm import ScriptedLLM
+
+GUIDE = " ".join(f"Sentence {i} of the travel guide about Sucre." for i in range(200))
+
+
+def travel_guide(query: str) -> str:
+    """Answers questions about travelling in Bolivia."""
+    return GUIDE
+
+
+def transcript(observations: list[str]) -> list:
+    steps = []
+    for i, observation in enumerate(observations):
+        steps.append(ActionReasoningStep(
+            thought=f"I need step {i}.", action="travel_guide", action_input={"query": f"q{i}"}
+        ))
+        steps.append(ObservationReasoningStep(observation=observation))
+    return steps
+
+
+def test_old_observations_are_truncated():
+    compactor = TranscriptCompactor(observation_token_limit=20, step_token_budget=None)
+    steps = transcript([GUIDE, "short answer", GUIDE])
+
+    compacted = compactor.compact(steps)
+
+    assert [step.get_content() for step in compacted[::2]] == [step.get_content() for step in steps[::2]]
+    assert compacted[1].observation.startswith("Sentence 0 of the travel guide")
+    assert compacted[1].observation.endswith("tokens omitted]")
+    assert len(compacted[1].observation) < 200
+    assert compacted[3].observation == "short answer"
+    # The last observation is the one the model is working on
+    assert compacted[5].observation == GUIDE
+    assert steps[1].observation == GUIDE
+
+
+def test_oldest_observations_are_omitted_over_the_budget():
+    compactor = TranscriptCompactor(observation_token_limit=200, step_token_budget=500)
+    steps = transcript([GUIDE, GUIDE, GUIDE[:600]])
+
+    compacted = compactor.compact(steps)
+
+    assert compacted[1].observation.startswith("[") and compacted[1].observation.endswith("tokens omitted]")
+    assert compacted[3].observation.startswith("Sentence 0 of the travel guide")
+    assert compacted[5].observation == GUIDE[:600]
+    stats = compactor.stats()
+    assert stats.steps == 1
+    assert stats.output_tokens <= 500
+    assert stats.tokens_saved == stats.input_tokens - stats.output_tokens > 0
+
+
+def test_agent_prompts_stay_bounded():
+    def run(formatter) -> list[int]:
+        llm = ScriptedLLM(responses=[
+            *[f'Thought: I need the guide.\nAction: travel_guide\nAction Input: {{"query": "q{i}"}}' for i in range(4)],
+            "Thought: I can answer without using any more tools.\nAnswer: Visit Sucre.",
+        ])
+        agent = ReActAgent.from_tools(
+            [FunctionTool.from_defaults(travel_guide)], llm=llm, react_chat_formatter=formatter
+        )
+        assert agent.chat("Tell me about Sucre").response == "Visit Sucre."
+        return [len(prompt) for prompt in llm.prompts]
+
+    full = run(None)
+    compactor = TranscriptCompactor(observation_token_limit=50, step_token_budget=1500)
+    compacted = run(CompactingReActChatFormatter(compactor=compactor))
+
+    assert compacted[:2] == full[:2]
+    assert full[-1] > 3 * full[1]
+    # Later steps only carry one whole observation
+    assert compacted[-1] < 1.5 * compacted[1]
+    assert compactor.stats().steps == 5
+    assert compactor.stats().tokens_saved > 0
@@ -0,0 +1,163 @@
+import json
+import multiprocessing
+import pytest
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date
+from ai_assistant import utils
+from ai_assistant.models import TripReservation, TripType, HotelReservation
+from ai_assistant.storage import CorruptReservationLogError, read_reservations
+from ai_assistant.utils import (
+    load_reservations,
+    save_reservation,
+    reset_reservations,
+    migrate_reservations,
+)
+
+
+def make_flight(cost: int = 300) -> TripReservation:
+    return TripReservation(
+        trip_type=TripType.flight,
+        date=date(2026, 12, 1),
+        departure="La Paz",
+        destination="Santa Cruz",
+        cost=cost,
+    )
+
+
+@pytest.fixture
+def jsonl_log(mocker, tmp_path):
+    log_file = tmp_path / "trip.jsonl"
+    mocker.patch("ai_assistant.utils.SETTINGS.log_file", str(log_file))
+    mocker.patch("ai_assistant.utils.SETTINGS.log_format", "jsonl")
+    return log_file
+
+
+def test_jsonl_save_appends_lines(jsonl_log):
+    for cost in (300, 400, 500):
+        save_reservation(make_flight(cost))
+
+    lines = jsonl_log.read_text().splitlines()
+    assert len(lines) == 3
+    assert [json.loads(line)["cost"] for line in lines] == [300, 400, 500]
+    assert [reservation["cost"] for reservation in load_reservations()] == [300, 400, 500]
+
+
+def test_jsonl_migrates_legacy_array(jsonl_log):
+    legacy = [
+        {
+            "checkin_date": "2026-12-05",
+            "checkout_date": "2026-12-15",
+            "hotel_name": "El Lucero",
+            "city": "Oruro",
+            "cost": 990,
+            "reservation_type": "HotelReservation",
+        }
+    ]
+    jsonl_log.write_text(json.dumps(legacy, indent=4))
+
+    save_reservation(make_flight())
+
+    lines = jsonl_log.read_text().splitlines()
+    assert len(lines) == 2
+    reservations = load_reservations()
+    assert reservations[0]["hotel_name"] == "El Lucero"
+    assert reservations[1]["reservation_type"] == "TripReservation"
+
+
+def test_migrate_reservations(tmp_path):
+    log_file = tmp_path / "trip.json"
+    log_file.write_text(json.dumps([{"cost": 1}, {"cost": 2}]))
+
+    assert migrate_reservations(str(log_file)) == 2
+    assert log_file.read_text().splitlines() == ['{"cost": 1}', '{"cost": 2}']
+
+
+def test_jsonl_skips_torn_last_line(jsonl_log):
+    save_reservation(make_flight())
+    with open(jsonl_log, "a") as file:
+        file.write('{"trip_type": "FLI')
+
+    assert len(load_reservations()) == 1
+
+    save_reservation(make_flight(cost=450))
+    reservations = load_reservations()
+    assert len(reservations) == 2
+    assert reservations[-1]["cost"] == 450
+
+
+def test_jsonl_reset(jsonl_log):
+    save_reservation(
+        HotelReservation(
+            checkin_date=date(2026, 12, 1),
+            checkout_date=date(2026, 12, 3),
+            hotel_name="Hotel A",
+            city="La Paz",
+            cost=100,
+        )
+    )
+    reset_reservations()
+
+    assert load_reservations() == []
+    assert jsonl_log.read_text() == ""
+
+
+def test_json_corrupted_log_is_not_overwritten(mocker, tmp_path):
+    log_file = tmp_path / "trip.json"
+    log_file.write_text('[{"cost": 1}, {"co')
+    mocker.patch("ai_assistant.utils.SETTINGS.log_file", str(log_file))
+    mocker.patch("ai_assistant.utils.SETTINGS.log_format", "json")
+
+    with pytest.raises(CorruptReservationLogError) as error:
+        save_reservation(make_flight())
+
+    assert error.value.log_file == str(log_file)
+
+    assert log_file.read_text() == '[{"cost": 1}, {"co'
+
+
+@pytest.mark.parametrize("log_format, bookings", [("json", 500), ("jsonl", 3000)])
+def test_concurrent_bookings_are_not_lost(log_format, bookings, mocker, tmp_path):
+    log_file = tmp_path / "trip.json"
+    mocker.patch("ai_assistant.utils.SETTINGS.log_file", str(log_file))
+    mocker.patch("ai_assistant.utils.SETTINGS.log_format", log_format)
+    mocker.patch("builtins.print")
+
+    with ThreadPoolExecutor(max_workers=32) as executor:
+        list(executor.map(lambda cost: save_reservation(make_flight(cost)), range(bookings)))
+
+    costs = sorted(reservation["cost"] for reservation in load_reservations())
+    assert costs == list(range(bookings))
+
+
+def book_from_process(log_file: str, log_format: str, first_cost: int, bookings: int):
+    utils.SETTINGS.log_file = log_file
+    utils.SETTINGS.log_format = log_format
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        list(
+            executor.map(
+                lambda cost: save_reservation(make_flight(cost)),
+                range(first_cost, first_cost + bookings),
+            )
+        )
+
+
+@pytest.mark.parametrize("log_format", ["json", "jsonl"])
+def test_multiprocess_bookings_are_not_lost(log_format, tmp_path):
+    log_file = str(tmp_path / "trip.json")
+    processes, bookings = 4, 250
+    context = multiprocessing.get_context("spawn")
+    workers = [
+        context.Process(
+            target=book_from_process,
+            args=(log_file, log_format, worker * bookings, bookings),
+        )
+        for worker in range(processes)
+    ]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+        assert worker.exitcode == 0
+
+    costs = sorted(reservation["cost"] for reservation in read_reservations(log_file))
+    assert costs == list(range(processes * bookings))
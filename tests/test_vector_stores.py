@@ -0,0 +1,77 @@
+import numpy as np
+import pytest
+from llama_index.core.schema import TextNode, NodeRelationship, RelatedNodeInfo
+from llama_index.core.vector_stores import SimpleVectorStore
+from llama_index.core.vector_stores.types import VectorStoreQuery
+from ai_assistant.vector_stores import MmapVectorStore
+
+
+def make_nodes(count: int, dim: int = 16, seed: int = 0) -> list[TextNode]:
+    rng = np.random.default_rng(seed)
+    nodes = []
+    for i in range(count):
+        node = TextNode(id_=f"node-{i}", text=f"text {i}", embedding=rng.normal(size=dim).tolist())
+        node.relationships[NodeRelationship.SOURCE] = RelatedNodeInfo(node_id=f"doc-{i % 5}")
+        nodes.append(node)
+    return nodes
+
+
+@pytest.fixture
+def nodes():
+    return make_nodes(200)
+
+
+def test_matches_simple_vector_store(nodes):
+    simple_store = SimpleVectorStore()
+    simple_store.add(nodes)
+    mmap_store = MmapVectorStore()
+    mmap_store.add(nodes)
+
+    rng = np.random.default_rng(1)
+    for _ in range(10):
+        query = VectorStoreQuery(query_embedding=rng.normal(size=16).tolist(), similarity_top_k=5)
+        expected = simple_store.query(query)
+        result = mmap_store.query(query)
+        assert result.ids == expected.ids
+        assert result.similarities == pytest.approx(expected.similarities, abs=1e-5)
+
+
+def test_persist_maps_the_matrix(nodes, tmp_path):
+    persist_path = str(tmp_path / "default__vector_store.json")
+    vector_store = MmapVectorStore()
+    vector_store.add(nodes)
+    vector_store.persist(persist_path)
+
+    loaded = MmapVectorStore.from_persist_path(persist_path)
+    assert isinstance(loaded.embeddings, np.memmap)
+    assert loaded.embeddings.dtype == np.float32
+    assert loaded.node_ids == vector_store.node_ids
+
+    query = VectorStoreQuery(query_embedding=nodes[7].embedding, similarity_top_k=1)
+    assert loaded.query(query).ids == ["node-7"]
+
+
+def test_delete_and_restrictions(nodes):
+    vector_store = MmapVectorStore()
+    vector_store.add(nodes)
+    vector_store.delete("doc-0")
+    assert len(vector_store.node_ids) == 160
+    assert "node-0" not in vector_store.node_ids
+
+    query = VectorStoreQuery(
+        query_embedding=nodes[1].embedding, similarity_top_k=3, doc_ids=["doc-2"]
+    )
+    result = vector_store.query(query)
+    assert len(result.ids) == 3
+    assert all(int(node_id.split("-")[1]) % 5 == 2 for node_id in result.ids)
+
+
+def test_converts_simple_vector_store(nodes, tmp_path):
+    simple_store = SimpleVectorStore()
+    simple_store.add(nodes)
+    simple_store.persist(str(tmp_path / "default__vector_store.json"))
+
+    vector_store = MmapVectorStore.from_persist_dir(str(tmp_path))
+    assert (tmp_path / "default__vector_store.npy").exists()
+    assert len(vector_store.node_ids) == len(nodes)
+    assert isinstance(MmapVectorStore.from_persist_dir(str(tmp_path)).embeddings, np.memmap)